@@ -0,0 +1,79 @@
+import os
+import asyncio
+import hashlib
+import tempfile
+
+# Source archive configuration: raw uploads are kept under the SHA-256 of their bytes
+ARCHIVE_SOURCES = os.getenv("ARCHIVE_SOURCES", "true").lower() in ("1", "true", "yes")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./uploaded-content")
+ARCHIVE_CHUNK_BYTES = 1024 * 1024
+
+
+class SourceArchive:
+    """Content-addressed copy of every ingested source. Each distinct content is stored once, as
+    `<sha256><suffix>`, so identical uploads share a file and names never collide. Writes run in the
+    background: the ingestion pipeline works on the in-memory text and never waits for the archive."""
+
+    def __init__(self, directory=ARCHIVE_DIR, enabled=ARCHIVE_SOURCES):
+        self.directory = directory
+        self.enabled = enabled
+        self.tasks = set()
+
+    def path(self, digest, suffix=""):
+        return os.path.join(self.directory, f"{digest}{suffix}")
+
+    def write(self, data, suffix=""):
+        """Store `data` (bytes, or a binary file read from the start) and return its SHA-256 hex digest."""
+        if isinstance(data, (bytes, bytearray)):
+            pieces = [data]
+        else:
+            data.seek(0)
+            pieces = iter(lambda: data.read(ARCHIVE_CHUNK_BYTES), b"")
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, incoming = tempfile.mkstemp(dir=self.directory, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for piece in pieces:
+                    digest.update(piece)
+                    out.write(piece)
+            path = self.path(digest.hexdigest(), suffix)
+            if os.path.exists(path):
+                os.remove(incoming)
+            else:
+                os.replace(incoming, path)
+        except BaseException:
+            if os.path.exists(incoming):
+                os.remove(incoming)
+            raise
+        return digest.hexdigest()
+
+    def _archive(self, data, suffix, close):
+        try:
+            digest = self.write(data, suffix)
+            print(f"Archived source as {self.path(digest, suffix)}")
+        except Exception as e:
+            print(f"Archiving source failed: {e}")
+        finally:
+            if close:
+                data.close()
+
+    def submit(self, data, suffix="", close=False):
+        """Archive `data` in a background thread; with `close`, the file is closed once it has been read.
+        With archiving turned off this only closes the file."""
+        if not self.enabled:
+            if close:
+                data.close()
+            return None
+        task = asyncio.create_task(asyncio.to_thread(self._archive, data, suffix, close))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    # Wait for the writes still in flight (on shutdown)
+    async def drain(self):
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+source_archive = SourceArchive()
@@ -0,0 +1,243 @@
+import os
+import asyncio
+import audioop
+import threading
+import contextvars
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import speech_recognition as sr
+from text_chunking import ChunkBuilder
+from metrics import span
+
+# Speech recognition configuration: "google" (Web Speech API), "sphinx" (offline, pocketsphinx) or "whisper" (local, openai-whisper)
+AUDIO_RECOGNIZER = os.getenv("AUDIO_RECOGNIZER", "google").lower()
+AUDIO_LANGUAGE = os.getenv("AUDIO_LANGUAGE", "en")
+AUDIO_WHISPER_MODEL = os.getenv("AUDIO_WHISPER_MODEL", "base")
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "4"))
+# A segment is cut at the first pause after AUDIO_SEGMENT_SECONDS, or at its quietest moment if no pause comes
+# before AUDIO_MAX_SEGMENT_SECONDS (the Google recognizer rejects audio much longer than a minute)
+AUDIO_SEGMENT_SECONDS = float(os.getenv("AUDIO_SEGMENT_SECONDS", "30"))
+AUDIO_MAX_SEGMENT_SECONDS = float(os.getenv("AUDIO_MAX_SEGMENT_SECONDS", "55"))
+# Loudness is measured over windows of this length; a window quieter than this fraction of the segment's mean is a pause
+AUDIO_WINDOW_SECONDS = float(os.getenv("AUDIO_WINDOW_SECONDS", "0.05"))
+AUDIO_SILENCE_RATIO = float(os.getenv("AUDIO_SILENCE_RATIO", "0.1"))
+
+Segment = namedtuple("Segment", ["index", "start", "end", "audio"])
+SegmentText = namedtuple("SegmentText", ["index", "start", "end", "text", "error"])
+
+
+### Recognizers ###
+
+class SpeechRecognizer:
+    """Turns one segment (a speech_recognition AudioData) into text, "" when nothing intelligible was said.
+    Segments are transcribed from several threads at once."""
+
+    def transcribe(self, audio):
+        raise NotImplementedError
+
+
+class GoogleRecognizer(SpeechRecognizer):
+    """Google Web Speech API (needs a network connection)."""
+
+    def __init__(self, language=AUDIO_LANGUAGE):
+        self.language = language
+
+    def transcribe(self, audio):
+        try:
+            return sr.Recognizer().recognize_google(audio, language=self.language)
+        except sr.UnknownValueError:
+            return ""
+        except sr.RequestError as e:
+            raise Exception(f"Could not request results; {e}")
+
+
+class SphinxRecognizer(SpeechRecognizer):
+    """CMU Sphinx, fully offline (needs pocketsphinx)."""
+
+    def __init__(self, language="en-US"):
+        self.language = language
+
+    def transcribe(self, audio):
+        try:
+            return sr.Recognizer().recognize_sphinx(audio, language=self.language)
+        except sr.UnknownValueError:
+            return ""
+
+
+class WhisperRecognizer(SpeechRecognizer):
+    """Local Whisper model (needs openai-whisper). The model is loaded on the first segment and shared by the workers."""
+
+    def __init__(self, model=AUDIO_WHISPER_MODEL):
+        self.model = model
+        self.recognizer = sr.Recognizer()
+        self.lock = threading.Lock()
+
+    def transcribe(self, audio):
+        # the first call loads the model; concurrent ones wait for it instead of loading their own copy
+        with self.lock:
+            if self.model not in getattr(self.recognizer, "whisper_model", {}):
+                return self.recognizer.recognize_whisper(audio, model=self.model)
+        return self.recognizer.recognize_whisper(audio, model=self.model)
+
+
+RECOGNIZERS = {
+    "google": GoogleRecognizer,
+    "sphinx": SphinxRecognizer,
+    "whisper": WhisperRecognizer,
+}
+
+
+def create_recognizer(name=AUDIO_RECOGNIZER):
+    if name not in RECOGNIZERS:
+        raise ValueError(f"Unknown speech recognizer {name!r}, expected one of {', '.join(RECOGNIZERS)}")
+    return RECOGNIZERS[name]()
+
+
+### Segmentation ###
+
+# Recordings are file paths or binary files (e.g. a spooled upload), which are read from the start
+def open_audio(audio):
+    if hasattr(audio, "seek"):
+        audio.seek(0)
+    return sr.AudioFile(audio)
+
+
+def audio_duration(audio):
+    with open_audio(audio) as source:
+        return source.DURATION
+
+
+def iter_segments(audio, segment_seconds=AUDIO_SEGMENT_SECONDS, max_seconds=AUDIO_MAX_SEGMENT_SECONDS,
+                  window_seconds=AUDIO_WINDOW_SECONDS, silence_ratio=AUDIO_SILENCE_RATIO):
+    """Read a WAV (or AIFF/FLAC) recording window by window and yield Segments cut in pauses.
+    Only the segment being cut is held in memory, so the length of the recording does not matter."""
+    with open_audio(audio) as source:
+        rate, width = source.SAMPLE_RATE, source.SAMPLE_WIDTH
+        window = max(1, int(rate * window_seconds))
+        target, limit = int(rate * segment_seconds), max(int(rate * max_seconds), window)
+        buffer, levels = bytearray(), []
+        start, index = 0, 0
+        while True:
+            data = source.stream.read(window)
+            if data:
+                buffer += data
+                levels.append(audioop.rms(data, width))
+            frames = len(buffer) // width
+            if data and frames < target:
+                continue
+            cut = None
+            if not data:
+                cut = len(levels)
+            elif levels[-1] <= silence_ratio * sum(levels) / len(levels):
+                cut = len(levels)
+            elif frames >= limit:
+                # no pause before the maximum: cut after the quietest window past the target length
+                first = min(target // window, len(levels) - 1)
+                cut = min(range(first, len(levels)), key=lambda i: levels[i]) + 1
+            if cut and buffer:
+                size = min(cut * window * width, len(buffer))
+                end = start + size // width
+                yield Segment(index, start / rate, end / rate, sr.AudioData(bytes(buffer[:size]), rate, width))
+                del buffer[:size]
+                del levels[:cut]
+                start, index = end, index + 1
+            if not data:
+                return
+
+
+### Transcription ###
+
+# Function to transcribe one segment; a failure is returned with the segment rather than raised
+def transcribe_segment(recognizer, segment):
+    try:
+        with span("transcribe_segment", index=segment.index, audio_seconds=round(segment.end - segment.start, 3)):
+            text = recognizer.transcribe(segment.audio).strip()
+    except Exception as e:
+        print(f"Error transcribing audio segment {segment.index+1} ({segment.start:.1f}s-{segment.end:.1f}s): {e}")
+        return SegmentText(segment.index, segment.start, segment.end, "", str(e))
+    return SegmentText(segment.index, segment.start, segment.end, text, None)
+
+
+async def atranscribe(audio, recognizer, workers=TRANSCRIBE_WORKERS):
+    """Transcribe a recording `workers` segments at a time, yielding SegmentTexts in order as soon as a segment
+    and all before it are done. At most 2 × workers segments are read ahead, which bounds memory."""
+    loop = asyncio.get_running_loop()
+    segments = iter_segments(audio)
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    read = None
+    try:
+        while True:
+            # shielded: if the consumer is cancelled the read carries on, and `read` tells when it has returned
+            read = asyncio.ensure_future(asyncio.to_thread(next, segments, None))
+            segment = await asyncio.shield(read)
+            if segment is not None:
+                context = contextvars.copy_context()
+                pending.append(loop.run_in_executor(executor, context.run, transcribe_segment, recognizer, segment))
+            while pending and (segment is None or len(pending) >= 2 * workers or pending[0].done()):
+                yield await pending.popleft()
+            if segment is None:
+                return
+    finally:
+        if read is not None and not read.done():
+            # a worker thread is still inside the generator, which cannot be closed until it returns
+            read.add_done_callback(lambda done: close_segments(segments, done))
+        else:
+            segments.close()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Function to close the segment reader once its last read has returned
+def close_segments(segments, read):
+    if not read.cancelled() and read.exception() is not None:
+        print(f"Reading audio failed after the transcription was stopped: {read.exception()}")
+    segments.close()
+
+
+class Transcription:
+    """Transcript of one recording, produced while it is being transcribed: `chunks()` yields extraction chunks
+    as soon as enough text has arrived."""
+
+    def __init__(self, audio, recognizer, workers=TRANSCRIBE_WORKERS, on_progress=None):
+        self.audio = audio
+        self.recognizer = recognizer
+        self.workers = workers
+        self.on_progress = on_progress
+        self.duration = None
+        self.segments = 0
+        self.failed_segments = 0
+        self.characters = 0
+        self.error = None
+
+    async def chunks(self):
+        self.duration = await asyncio.to_thread(audio_duration, self.audio)
+        if self.on_progress:
+            self.on_progress("transcribing", 0.0)
+        builder = ChunkBuilder()
+        async for result in atranscribe(self.audio, self.recognizer, self.workers):
+            self.segments += 1
+            if self.on_progress and self.duration:
+                self.on_progress("transcribing", result.end / self.duration)
+            if result.error is not None:
+                self.failed_segments += 1
+                self.error = self.error or result.error
+                continue
+            if not result.text:
+                continue
+            self.characters += len(result.text)
+            for chunk in builder.add(result.text):
+                yield chunk
+        if self.segments and self.failed_segments == self.segments:
+            raise Exception(f"None of the {self.segments} audio segments could be transcribed: {self.error}")
+        if not self.characters:
+            raise Exception("Speech was unintelligible")
+        for chunk in builder.close():
+            yield chunk
+
+    def info(self):
+        return {
+            "seconds": round(self.duration or 0.0, 3),
+            "segments": self.segments,
+            "failed_segments": self.failed_segments,
+            "characters": self.characters,
+        }
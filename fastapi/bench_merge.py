@@ -0,0 +1,71 @@
+"""MERGE latency as the graph grows, with and without the id uniqueness constraint.
+
+Runs against the Neo4j instance configured in .env (NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD) using a throwaway
+label, which is dropped afterwards. Without the constraint every MERGE scans the label, so batch latency grows
+with the node count; with it the latency should stay flat.
+
+    python bench_merge.py --sizes 1000 10000 50000 --batch 500
+"""
+import os
+import argparse
+from timeit import default_timer as timer
+from dotenv import load_dotenv
+from neo4j import GraphDatabase
+from graph_writer import entity_merge_query
+from constraints import constraint_query
+
+BENCH_LABEL = "MergeBenchEntity"
+
+
+def grow(driver, query, start, stop, batch):
+    for i in range(start, stop, batch):
+        rows = [{"id": f"entity{j}", "properties": {"name": f"Entity {j}"}} for j in range(i, min(i + batch, stop))]
+        driver.execute_query(query, rows=rows)
+
+
+# Latency of MERGEing one batch of new ids plus one batch of existing ids
+def measure(driver, query, size, batch, repeats=5):
+    timings = []
+    for r in range(repeats):
+        rows = [{"id": f"probe{r}_{j}", "properties": {}} for j in range(batch // 2)]
+        rows += [{"id": f"entity{(j * 7919) % size}", "properties": {}} for j in range(batch - len(rows))]
+        start = timer()
+        driver.execute_query(query, rows=rows)
+        timings.append(timer() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def cleanup(driver):
+    driver.execute_query(f"DROP CONSTRAINT {BENCH_LABEL}_id_unique IF EXISTS")
+    driver.execute_query(f"MATCH (n:{BENCH_LABEL}) CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF 10000 ROWS")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    load_dotenv()
+    driver = GraphDatabase.driver(os.getenv("NEO4J_URI"), auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")))
+    query = entity_merge_query(BENCH_LABEL)
+    print(f"{'nodes':>10} {'constraint':>10} {'median batch (ms)':>18}")
+    try:
+        for with_constraint in (False, True):
+            cleanup(driver)
+            if with_constraint:
+                driver.execute_query(constraint_query(BENCH_LABEL))
+                driver.execute_query("CALL db.awaitIndexes(300)")
+            size = 0
+            for target in sorted(args.sizes):
+                grow(driver, query, size, target, 5000)
+                size = target
+                latency = measure(driver, query, size, args.batch)
+                print(f"{size:>10} {str(with_constraint):>10} {latency * 1000:>18.1f}")
+    finally:
+        cleanup(driver)
+        driver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+"""Reproducible benchmarks of the ingestion and QA hot paths.
+
+Gemini is replaced by deterministic stand-ins (fakes.py) with a configurable latency, and the graph is the
+embedded in-memory backend unless GRAPH_BACKEND=neo4j is set, in which case the Neo4j instance from .env is used
+and WIPED between suites (pass --allow-wipe to confirm it is disposable).
+
+Suites:
+    cypher   parsing and statement building for extractions of --entity-sizes entities, as streamed by ingestion
+    ingest   construct_graph on documents of --doc-sizes sentences
+    info     get_info on graphs of --graph-sizes nodes
+    qa       qa_on_graph on graphs of --graph-sizes nodes, with cold and warm QA caches, and answered from a template
+    http     GET /info, POST /query and POST /upload-text (until the job is done) on the same graphs
+    analytics  snapshot export, PageRank, connected components and 3-hop neighborhoods on the same graphs
+
+Every case reports p50/p95/p99 latency and throughput. Results can be saved as JSON and compared between commits:
+
+    python benchmark.py --output bench/base.json
+    python benchmark.py --compare bench/base.json                  # run now and compare against a saved run
+    python benchmark.py --compare bench/base.json bench/new.json   # compare two saved runs
+"""
+import os
+import sys
+import json
+import math
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import contextlib
+from time import time, sleep
+from timeit import default_timer as timer
+
+# The stand-ins must be configured before the pipeline modules read their settings at import time
+os.environ.setdefault("GRAPH_BACKEND", "memory")
+os.environ.setdefault("EXTRACTION_CACHE_PATH", "")
+os.environ.setdefault("EXTRACTION_CACHE_MEMORY_ENTRIES", "0")
+os.environ.setdefault("GEMINI_KEY", "benchmark")
+os.environ.setdefault("STATS_RECONCILE_SECONDS", "3600")
+
+from fastapi.testclient import TestClient
+import graph_construct
+import graph_qa
+import server
+from fakes import FakeGemini, FakeQALLM
+from graph_store import GRAPH_BACKEND
+from graph_writer import build_statements, write_statements, StreamingGraphWriter
+from json_stream import ExtractionStreamParser
+from graph_state import graph_state
+from graph_stats import graph_stats
+from constraints import constraint_manager
+from entity_search import search_index
+from intent_router import intent_router
+from entity_resolution import EntityResolver
+from rate_limiter import RateLimiter
+from graph_snapshot import export_snapshot, GraphSnapshot
+from graph_analytics import pagerank, connected_components, k_hop
+
+RESET_QUERY = "MATCH (n) CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS"
+QA_CYPHER = (
+    "MATCH (a:Concept)-[:IS_RELATED_TO]->(b:Concept) "
+    "WHERE toLower(a.name) CONTAINS 'concept {target}' RETURN b.name AS related LIMIT 10"
+)
+SENTENCE = "Person{i} works at Company{c} on Project{p}, which uses Technology{t}. "
+SUITES = ["cypher", "ingest", "info", "qa", "http", "analytics"]
+
+
+### Measurement ###
+
+# Nearest-rank percentile of sorted samples
+def percentile(samples, p):
+    return samples[max(0, math.ceil(p / 100 * len(samples)) - 1)]
+
+
+def summarize(bench, case, samples, units=1, unit="ops"):
+    ordered = sorted(samples)
+    return {
+        "bench": bench,
+        "case": case,
+        "samples": len(samples),
+        "mean_ms": round(1000 * sum(samples) / len(samples), 3),
+        "p50_ms": round(1000 * percentile(ordered, 50), 3),
+        "p95_ms": round(1000 * percentile(ordered, 95), 3),
+        "p99_ms": round(1000 * percentile(ordered, 99), 3),
+        "throughput": round(units * len(samples) / sum(samples), 2) if sum(samples) else None,
+        "unit": f"{unit}/s",
+    }
+
+
+# Time `fn(i)` for each iteration after `warmup` untimed calls; `setup(i)` runs before each call, untimed
+def measure(fn, iterations, warmup=1, setup=None):
+    samples = []
+    for i in range(-warmup, iterations):
+        if setup:
+            setup(i)
+        start = timer()
+        fn(i)
+        if i >= 0:
+            samples.append(timer() - start)
+    return samples
+
+
+# The pipeline logs every batch and QA result; keep that out of the report (the formatting cost is still paid)
+@contextlib.contextmanager
+def quiet():
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+# The LLM path is measured with the intent router off, since the benchmark questions match a template
+@contextlib.contextmanager
+def routing(enabled):
+    previous = intent_router.enabled
+    intent_router.enabled = enabled
+    try:
+        yield
+    finally:
+        intent_router.enabled = previous
+
+
+### Fixtures ###
+
+def synthetic_extraction(entities):
+    ids = [f"entity{i}" for i in range(entities)]
+    return json.dumps({
+        "entities": [{"label": "Concept", "id": entity_id, "name": f"Entity {i}"} for i, entity_id in enumerate(ids)],
+        "relationships": [f"{a}|IS_RELATED_TO|{b}" for a, b in zip(ids, ids[1:])],
+    })
+
+
+def write_document(path, sentences, seed):
+    with open(path, "w") as f:
+        f.write("".join(SENTENCE.format(i=seed * sentences + j, c=j % 50, p=j % 20, t=j % 10) for j in range(sentences)))
+    return os.path.getsize(path)
+
+
+def reset_graph(driver):
+    with driver.session() as session:
+        session.run(RESET_QUERY).consume()
+    graph_stats.reconcile(driver)
+    graph_qa.cypher_cache.clear()
+    graph_qa.result_cache.clear()
+    graph_construct.entity_resolver = EntityResolver()
+
+
+# Grow the graph to `stop` Concept nodes in a chain; zero-padded names keep every full-text lookup unambiguous
+def grow_graph(driver, start, stop, batch_size=5000):
+    rows = [{"id": f"concept{i:06d}", "properties": {"name": f"Concept {i:06d}", "search_name": f"concept {i:06d}"}} for i in range(start, stop)]
+    rels = [{"src": f"concept{i - 1:06d}", "tgt": f"concept{i:06d}"} for i in range(max(start, 1), stop)]
+    statements = build_statements({"Concept": rows}, {("Concept", "IS_RELATED_TO", "Concept"): rels}, batch_size)
+    constraint_manager.ensure(driver, ["Concept"])
+    search_index.ensure(driver, ["Concept"])
+    result = write_statements(driver, statements)
+    graph_state.record_write(result)
+    graph_stats.reconcile(driver)
+    # graph_state still knows the pattern from before the reset, so the QA schema would not be refreshed on its own
+    graph_qa.schema_snapshot.refresh()
+
+
+def clear_qa_caches(i=None):
+    graph_qa.cypher_cache.clear()
+    graph_qa.result_cache.clear()
+
+
+### Suites ###
+
+# What an ingestion does between the model's output and the graph write: the streamed JSON is parsed item by item
+# and the streaming writer resolves, deduplicates and batches the rows (a fresh resolver, as for a new graph)
+def stream_statements(extraction):
+    writer = StreamingGraphWriter(resolver=EntityResolver())
+    for item in ExtractionStreamParser().feed(extraction):
+        writer.add(*item)
+    return writer.take(final=True)
+
+
+def bench_cypher(args):
+    results = []
+    for entities in args.entity_sizes:
+        extraction = synthetic_extraction(entities)
+
+        with quiet():
+            samples = measure(lambda i: stream_statements(extraction), args.iterations, args.warmup)
+        results.append(summarize("cypher_generation", f"{entities} entities", samples, 2 * entities - 1, "rows"))
+    return results
+
+
+def bench_ingest(args, workdir):
+    results = []
+    for sentences in args.doc_sizes:
+        paths = {}
+        size = 0
+        for i in range(-args.warmup, args.iterations):
+            paths[i] = os.path.join(workdir, f"doc_{sentences}_{i + args.warmup}.txt")
+            size = write_document(paths[i], sentences, i + args.warmup)
+        with quiet():
+            samples = measure(lambda i: graph_construct.construct_graph(paths[i]), args.iterations, args.warmup)
+        results.append(summarize("construct_graph", f"{sentences} sentences ({size / 1024:.1f} KB)", samples, 1, "docs"))
+    return results
+
+
+def bench_info(args, nodes):
+    with quiet():
+        samples = measure(lambda i: graph_construct.get_info(), args.iterations, args.warmup)
+    return [summarize("get_info", f"{nodes} nodes", samples)]
+
+
+def bench_qa(args, nodes):
+    target = lambda i: f"{(i * 7919) % nodes:06d}"
+
+    def cold(i):
+        clear_qa_caches()
+        graph_qa.llm.cypher = QA_CYPHER.format(target=target(i))
+
+    with quiet(), routing(False):
+        cold_samples = measure(lambda i: graph_qa.qa_on_graph(f"What is related to concept {target(i)}?"), args.iterations, args.warmup, cold)
+        warm_samples = measure(lambda i: graph_qa.qa_on_graph(f"What is related to concept {target(0)}?"), args.iterations, args.warmup)
+        check = graph_qa.qa_on_graph(f"What is related to concept {target(0)}?")
+    # an empty query means the Cypher was rejected against the schema, and nothing was measured
+    if not check["intermediate_steps"][0]["query"]:
+        raise RuntimeError("The QA benchmark query was rejected; the schema snapshot does not match the graph")
+    with quiet(), routing(True):
+        routed_samples = measure(lambda i: graph_qa.qa_on_graph(f"What is related to concept {target(i)}?"), args.iterations, args.warmup)
+        check = graph_qa.qa_on_graph(f"What is related to concept {target(0)}?")
+    if check["route"]["intent"] is None:
+        raise RuntimeError(f"The QA benchmark question was not answered from a template: {check['route']['reason']}")
+    return [
+        summarize("qa_on_graph", f"{nodes} nodes, cold cache", cold_samples, 1, "questions"),
+        summarize("qa_on_graph", f"{nodes} nodes, warm cache", warm_samples, 1, "questions"),
+        summarize("qa_on_graph", f"{nodes} nodes, template route", routed_samples, 1, "questions"),
+    ]
+
+
+def bench_http(args, nodes, client):
+    target = lambda i: f"{(i * 104729) % nodes:06d}"
+
+    def query(i):
+        response = client.post("/query", json={"text": f"What is related to concept {target(i)}?"})
+        response.raise_for_status()
+
+    def cold(i):
+        clear_qa_caches()
+        graph_qa.llm.cypher = QA_CYPHER.format(target=target(i))
+
+    def upload(i):
+        job = client.post("/upload-text", json={"text": SENTENCE.format(i=nodes + i, c=i, p=i, t=i) * 5}).json()
+        while client.get(job["status_url"]).json()["status"] not in ("done", "failed"):
+            sleep(0.002)
+
+    with quiet():
+        info_samples = measure(lambda i: client.get("/info").raise_for_status(), args.iterations, args.warmup)
+        with routing(False):
+            query_samples = measure(query, args.iterations, args.warmup, cold)
+        upload_samples = measure(upload, args.iterations, args.warmup)
+    return [
+        summarize("GET /info", f"{nodes} nodes", info_samples, 1, "requests"),
+        summarize("POST /query", f"{nodes} nodes, cold cache", query_samples, 1, "requests"),
+        summarize("POST /upload-text", f"{nodes} nodes, until done", upload_samples, 1, "uploads"),
+    ]
+
+
+def bench_analytics(args, nodes):
+    driver = graph_construct.gds
+    with quiet():
+        export_samples = measure(lambda i: export_snapshot(driver, "graph-snapshot"), args.iterations, args.warmup)
+    snapshot = GraphSnapshot.open("graph-snapshot")
+    center = lambda i: snapshot.find(f"concept{(i * 7919) % nodes:06d}")[0]
+    return [
+        summarize("export_snapshot", f"{nodes} nodes", export_samples, nodes, "nodes"),
+        summarize("pagerank", f"{nodes} nodes", measure(lambda i: pagerank(snapshot), args.iterations, args.warmup), nodes, "nodes"),
+        summarize("connected_components", f"{nodes} nodes", measure(lambda i: connected_components(snapshot), args.iterations, args.warmup), nodes, "nodes"),
+        summarize("k_hop", f"{nodes} nodes, 3 hops", measure(lambda i: k_hop(snapshot, center(i), 3), args.iterations, args.warmup)),
+    ]
+
+
+def run(args):
+    graph_construct.GEMINI = FakeGemini(latency=args.llm_latency)
+    graph_construct.gemini_limiter = RateLimiter(10**6, 10**9)
+    graph_qa.llm = FakeQALLM(cypher=QA_CYPHER.format(target="000000"), answer="They are related.", latency=args.llm_latency)
+    graph_qa.qa_limiter = RateLimiter(10**6, 10**9)
+    driver = graph_construct.gds
+    results = []
+    workdir = tempfile.mkdtemp(prefix="kg-benchmark-")
+    cwd = os.getcwd()
+    # the pipeline writes its logs and uploads relative to the working directory
+    os.chdir(workdir)
+    os.makedirs("uploaded-content", exist_ok=True)
+    try:
+        with contextlib.ExitStack() as stack:
+            for suite, bench in [("cypher", lambda: bench_cypher(args)), ("ingest", lambda: bench_ingest(args, workdir))]:
+                if suite not in args.suites:
+                    continue
+                with quiet():
+                    reset_graph(driver)
+                suite_results = bench()
+                report(suite_results)
+                results += suite_results
+            if not set(args.suites) & {"info", "qa", "http", "analytics"}:
+                return results
+            with quiet():
+                reset_graph(driver)
+                client = stack.enter_context(TestClient(server.app)) if "http" in args.suites else None
+            nodes = 0
+            for size in sorted(args.graph_sizes):
+                with quiet():
+                    grow_graph(driver, nodes, size)
+                nodes = size
+                graph_results = []
+                if "info" in args.suites:
+                    graph_results += bench_info(args, nodes)
+                if "qa" in args.suites:
+                    graph_results += bench_qa(args, nodes)
+                if "http" in args.suites:
+                    graph_results += bench_http(args, nodes, client)
+                if "analytics" in args.suites:
+                    graph_results += bench_analytics(args, nodes)
+                report(graph_results)
+                results += graph_results
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+### Reporting ###
+
+def report(results):
+    for r in results:
+        print(
+            f"{r['bench']:<20} {r['case']:<32} {r['samples']:>5} {r['p50_ms']:>10.3f} {r['p95_ms']:>10.3f} "
+            f"{r['p99_ms']:>10.3f} {r['throughput'] or 0:>12.2f} {r['unit']}",
+            flush=True,
+        )
+
+
+def report_header():
+    print(f"{'bench':<20} {'case':<32} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'throughput':>12}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def change(base, new):
+    if not base or new is None:
+        return None
+    return 100 * (new - base) / base
+
+
+def compare(base, new, threshold):
+    """Print every case present in both runs; a p95 slowdown or throughput drop beyond `threshold`% is a regression.
+    Returns the number of regressions."""
+    print(f"\nComparing {base['meta'].get('commit')} (base) with {new['meta'].get('commit')} (new), threshold {threshold}%")
+    print(f"{'bench':<20} {'case':<32} {'p50 ms':>20} {'p95 ms':>20} {'p99 ms':>20} {'throughput':>16}")
+    base_results = {(r["bench"], r["case"]): r for r in base["results"]}
+    regressions = 0
+    for r in new["results"]:
+        b = base_results.get((r["bench"], r["case"]))
+        if b is None:
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput"):
+            delta = change(b[key], r[key])
+            cells.append(f"{b[key]} -> {r[key]} ({delta:+.1f}%)" if delta is not None else f"{b[key]} -> {r[key]}")
+        p95_delta = change(b["p95_ms"], r["p95_ms"]) or 0
+        throughput_delta = change(b["throughput"], r["throughput"]) or 0
+        regressed = p95_delta > threshold or throughput_delta < -threshold
+        regressions += regressed
+        print(f"{r['bench']:<20} {r['case']:<32} {cells[0]:>20} {cells[1]:>20} {cells[2]:>20} {cells[3]:>16}{'  REGRESSION' if regressed else ''}")
+    print(f"{regressions} regression(s)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=SUITES)
+    parser.add_argument("--iterations", type=int, default=20, help="timed runs per case")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed runs before each case")
+    parser.add_argument("--entity-sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--doc-sizes", type=int, nargs="+", default=[10, 100, 1000], help="sentences per document")
+    parser.add_argument("--graph-sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="nodes in the graph")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake Gemini call")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--compare", nargs="+", metavar="RESULTS", help="base results (and optionally new results) to compare")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 if anything regressed")
+    parser.add_argument("--allow-wipe", action="store_true", help="allow deleting everything in the configured Neo4j")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes a base results file and optionally a new one")
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            regressions = compare(json.load(f), json.load(g), args.threshold)
+        sys.exit(1 if regressions and args.fail_on_regression else 0)
+    if GRAPH_BACKEND != "memory" and not args.allow_wipe:
+        sys.exit(f"The {GRAPH_BACKEND} backend is wiped between suites; pass --allow-wipe if the database is disposable")
+
+    report_header()
+    results = run(args)
+    run_result = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": GRAPH_BACKEND,
+            "llm_latency": args.llm_latency,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+        },
+        "results": results,
+    }
+    if args.output:
+        if os.path.dirname(args.output):
+            os.makedirs(os.path.dirname(args.output), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(run_result, f, indent=2)
+        print(f"Results saved to {args.output}")
+    if args.compare:
+        with open(args.compare[0]) as f:
+            regressions = compare(json.load(f), run_result, args.threshold)
+        sys.exit(1 if regressions and args.fail_on_regression else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""Bulk offline ingestion of a document corpus into the knowledge graph.
+
+Documents are streamed from a directory (every file matching --pattern, recursively) or from a JSONL file
+(one {"id": ..., "text": ...} object per line). Extraction runs in a pool of worker processes, each extracting
+the chunks of its document concurrently under its share of the Gemini quota. This process resolves entity ids and
+writes the results in large batches while the workers keep extracting.
+
+A checkpoint manifest (JSONL, next to the corpus by default) records every document once its rows are in the
+graph. An interrupted load picks up where it stopped: written documents are skipped unless their text changed,
+and the chunks of the others that were already extracted come out of the extraction cache.
+
+    python bulk_load.py ./corpus --processes 8
+    python bulk_load.py corpus.jsonl --text-field body --id-field url --flush-rows 50000
+"""
+import os
+import sys
+import json
+import glob
+import hashlib
+import argparse
+import multiprocessing
+from time import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from timeit import default_timer as timer
+import graph_construct
+from graph_construct import stream_chunk, merge_extractions, model_config_key, gds, EXTRACTION_WORKERS
+from graph_writer import group_extraction, build_statements, write_statements, empty_result, merge_results
+from constraints import constraint_manager, statement_labels
+from entity_search import search_index
+from entity_resolution import entity_resolver
+from text_chunking import split_into_chunks
+from rate_limiter import RateLimiter, GEMINI_RPM, GEMINI_TPM
+from prompts import RELATION_EXTRACTION_TEMPLATE
+
+# Bulk load configuration
+BULK_PROCESSES = int(os.getenv("BULK_LOAD_PROCESSES", str(os.cpu_count() or 4)))
+BULK_WRITE_BATCH_SIZE = int(os.getenv("BULK_LOAD_BATCH_SIZE", "5000"))
+# Extracted rows are buffered across documents and written once this many are pending
+BULK_FLUSH_ROWS = int(os.getenv("BULK_LOAD_FLUSH_ROWS", "20000"))
+
+
+### Corpus ###
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# Yields (doc id, text) for every matching file under a directory, in a stable order
+def iter_directory(path, pattern):
+    for filepath in sorted(glob.iglob(os.path.join(path, "**", pattern), recursive=True)):
+        if not os.path.isfile(filepath):
+            continue
+        with open(filepath, "r", errors="ignore") as f:
+            yield os.path.relpath(filepath, path), f.read()
+
+
+# Yields (doc id, text) for every line of a JSONL corpus; lines without an id are named after their line number
+def iter_jsonl(path, text_field, id_field):
+    with open(path, "r") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                text = record[text_field]
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Skipping line {number} of {path}: {e}")
+                continue
+            yield str(record.get(id_field, f"line{number}")), str(text)
+
+
+def iter_documents(path, pattern="*.txt", text_field="text", id_field="id"):
+    if os.path.isdir(path):
+        return iter_directory(path, pattern)
+    return iter_jsonl(path, text_field, id_field)
+
+
+class Manifest:
+    """Append-only checkpoint of the documents whose rows are in the graph, keyed by doc id and content hash.
+    Each entry is fsynced before the next batch is written; a line cut off by a crash is ignored on load."""
+
+    def __init__(self, path):
+        self.path = path
+        self.written = set()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("status") == "written":
+                        self.written.add((entry["doc"], entry["sha"]))
+        self.file = open(path, "a")
+
+    def is_written(self, doc_id, sha):
+        return (doc_id, sha) in self.written
+
+    def record(self, entries):
+        for entry in entries:
+            self.file.write(json.dumps(entry) + "\n")
+            if entry["status"] == "written":
+                self.written.add((entry["doc"], entry["sha"]))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+### Extraction workers ###
+
+_chunk_workers = EXTRACTION_WORKERS
+
+
+# Runs once in every worker process: each one gets an equal share of the Gemini RPM/TPM budget
+def init_worker(processes, chunk_workers):
+    global _chunk_workers
+    _chunk_workers = chunk_workers
+    graph_construct.gemini_limiter = RateLimiter(GEMINI_RPM / processes, GEMINI_TPM / processes)
+
+
+# Function to extract one document in a worker process, through the same streaming extraction as the server.
+# Raises if any chunk fails or is cut off, so the document is not checkpointed and is retried on the next run
+# (its successful chunks are cached by then).
+def extract_document(doc_id, sha, text):
+    start = timer()
+    chunks = split_into_chunks(text.rstrip())
+    config_key = model_config_key(graph_construct.GEMINI)
+
+    def extract_chunk(chunk):
+        items = []
+        stream_chunk(chunk, RELATION_EXTRACTION_TEMPLATE, config_key, items.append)
+        return items
+
+    with ThreadPoolExecutor(max_workers=_chunk_workers) as executor:
+        results = list(executor.map(extract_chunk, chunks))
+    return doc_id, sha, merge_extractions(item for items in results for item in items), len(chunks), timer() - start
+
+
+### Loader ###
+
+class Progress:
+    """Running totals of a load, printed every `interval` seconds with document and triple throughput."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.start = time()
+        self.reported = self.start
+        self.extracted = 0
+        self.written = 0
+        self.skipped = 0
+        self.failed = 0
+        self.chunks = 0
+        self.entities = 0
+        self.triples = 0
+
+    def snapshot(self):
+        elapsed = max(time() - self.start, 1e-9)
+        return {
+            "elapsed_seconds": round(elapsed, 1),
+            "documents_extracted": self.extracted,
+            "documents_written": self.written,
+            "documents_skipped": self.skipped,
+            "documents_failed": self.failed,
+            "chunks": self.chunks,
+            "entities": self.entities,
+            "triples": self.triples,
+            "docs_per_second": round(self.written / elapsed, 2),
+            "triples_per_second": round(self.triples / elapsed, 2),
+        }
+
+    def report(self, force=False):
+        if not force and time() - self.reported < self.interval:
+            return
+        self.reported = time()
+        s = self.snapshot()
+        print(
+            f"[{s['elapsed_seconds']:>8.1f}s] written {s['documents_written']} docs "
+            f"(extracted {s['documents_extracted']}, skipped {s['documents_skipped']}, failed {s['documents_failed']}) | "
+            f"{s['docs_per_second']} docs/s | {s['triples_per_second']} triples/s | "
+            f"{s['entities']} entities, {s['triples']} triples",
+            flush=True,
+        )
+
+
+class BulkWriter:
+    """Buffers the rows of extracted documents and writes them in large batches. A document is checkpointed
+    only after the flush that wrote its rows."""
+
+    def __init__(self, driver, manifest, progress, batch_size=BULK_WRITE_BATCH_SIZE, flush_rows=BULK_FLUSH_ROWS):
+        self.driver = driver
+        self.manifest = manifest
+        self.progress = progress
+        self.batch_size = batch_size
+        self.flush_rows = flush_rows
+        self.entity_groups = {}
+        self.relationship_groups = {}
+        self.documents = []
+        self.entities = 0
+        self.triples = 0
+        self.result = empty_result()
+
+    def add(self, doc_id, sha, extraction, chunks):
+        try:
+            entity_groups, relationship_groups = group_extraction(extraction, entity_resolver)
+        except (TypeError, ValueError) as e:
+            self.fail(doc_id, sha, f"Unparseable extraction: {e}")
+            return
+        entities = sum(len(rows) for rows in entity_groups.values())
+        triples = sum(len(rows) for rows in relationship_groups.values())
+        for label, rows in entity_groups.items():
+            self.entity_groups.setdefault(label, []).extend(rows)
+        for pattern, rows in relationship_groups.items():
+            self.relationship_groups.setdefault(pattern, []).extend(rows)
+        self.documents.append({"doc": doc_id, "sha": sha, "status": "written", "chunks": chunks, "entities": entities, "triples": triples})
+        self.entities += entities
+        self.triples += triples
+        self.progress.extracted += 1
+        self.progress.chunks += chunks
+        if self.entities + self.triples >= self.flush_rows:
+            self.flush()
+
+    def fail(self, doc_id, sha, error):
+        print(f"Extraction of {doc_id} failed, it will be retried on the next run: {error}")
+        self.manifest.record([{"doc": doc_id, "sha": sha, "status": "failed", "error": str(error), "at": time()}])
+        self.progress.failed += 1
+
+    def flush(self):
+        if not self.documents:
+            return
+        statements = build_statements(self.entity_groups, self.relationship_groups, self.batch_size)
+        if statements:
+            labels = statement_labels(statements)
+            constraint_manager.ensure(self.driver, labels)
+            search_index.ensure(self.driver, labels)
+            merge_results(self.result, write_statements(self.driver, statements))
+        written_at = time()
+        self.manifest.record([{**doc, "at": written_at} for doc in self.documents])
+        self.progress.written += len(self.documents)
+        self.progress.entities += self.entities
+        self.progress.triples += self.triples
+        self.entity_groups = {}
+        self.relationship_groups = {}
+        self.documents = []
+        self.entities = 0
+        self.triples = 0
+
+
+def collect(futures, writer):
+    for future in futures:
+        try:
+            doc_id, sha, extraction, chunks, _ = future.result()
+        except Exception as e:
+            doc_id, sha = futures[future]
+            writer.fail(doc_id, sha, e)
+            continue
+        writer.add(doc_id, sha, extraction, chunks)
+
+
+def bulk_load(documents, manifest, processes=BULK_PROCESSES, chunk_workers=EXTRACTION_WORKERS, batch_size=BULK_WRITE_BATCH_SIZE,
+              flush_rows=BULK_FLUSH_ROWS, report_every=10.0, limit=None, driver=None):
+    """Extract and write `documents` ((doc id, text) pairs), skipping the ones the manifest has as written.
+    At most 2 documents per process are extracted ahead of the writer, so the corpus is streamed rather than loaded."""
+    driver = driver or gds
+    progress = Progress(report_every)
+    writer = BulkWriter(driver, manifest, progress, batch_size, flush_rows)
+    entity_resolver.load(driver)
+    # spawn rather than fork: the parent holds database, gRPC and SQLite handles that must not be shared
+    context = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(processes, mp_context=context, initializer=init_worker, initargs=(processes, chunk_workers))
+    pending = {}
+    submitted = 0
+    try:
+        for doc_id, text in documents:
+            if limit is not None and submitted >= limit:
+                break
+            sha = content_hash(text)
+            if manifest.is_written(doc_id, sha):
+                progress.skipped += 1
+                continue
+            if not text.strip():
+                manifest.record([{"doc": doc_id, "sha": sha, "status": "written", "chunks": 0, "entities": 0, "triples": 0, "at": time()}])
+                progress.written += 1
+                continue
+            pending[pool.submit(extract_document, doc_id, sha, text)] = (doc_id, sha)
+            submitted += 1
+            while len(pending) >= processes * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect({future: pending.pop(future) for future in done}, writer)
+                progress.report()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect({future: pending.pop(future) for future in done}, writer)
+            progress.report()
+    except KeyboardInterrupt:
+        print("Interrupted, writing the documents extracted so far")
+        pool.shutdown(wait=False, cancel_futures=True)
+        writer.flush()
+        raise
+    pool.shutdown()
+    writer.flush()
+    progress.report(force=True)
+    return {**progress.snapshot(), "write": writer.result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="directory of text files or a JSONL file")
+    parser.add_argument("--pattern", default="*.txt", help="file name pattern when loading a directory")
+    parser.add_argument("--text-field", default="text", help="JSONL field holding the document text")
+    parser.add_argument("--id-field", default="id", help="JSONL field holding the document id")
+    parser.add_argument("--manifest", help="checkpoint manifest (default: <path>.manifest.jsonl)")
+    parser.add_argument("--processes", type=int, default=BULK_PROCESSES, help="extraction worker processes")
+    parser.add_argument("--chunk-workers", type=int, default=EXTRACTION_WORKERS, help="concurrent chunk extractions per process")
+    parser.add_argument("--batch-size", type=int, default=BULK_WRITE_BATCH_SIZE, help="rows per write transaction")
+    parser.add_argument("--flush-rows", type=int, default=BULK_FLUSH_ROWS, help="buffered rows that trigger a write")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    parser.add_argument("--limit", type=int, help="extract at most this many documents")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        sys.exit(f"{args.path} does not exist")
+    manifest = Manifest(args.manifest or f"{args.path.rstrip(os.sep)}.manifest.jsonl")
+    print(f"Checkpoint manifest {manifest.path}: {len(manifest.written)} documents already written")
+    try:
+        summary = bulk_load(
+            iter_documents(args.path, args.pattern, args.text_field, args.id_field),
+            manifest,
+            processes=args.processes,
+            chunk_workers=args.chunk_workers,
+            batch_size=args.batch_size,
+            flush_rows=args.flush_rows,
+            report_every=args.report_every,
+            limit=args.limit,
+        )
+    finally:
+        manifest.close()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
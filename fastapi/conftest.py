@@ -0,0 +1,4 @@
+import os
+
+# The tests run the pipeline against the embedded graph, with fakes standing in for Gemini
+os.environ.setdefault("GRAPH_BACKEND", "memory")
@@ -0,0 +1,87 @@
+import os
+import re
+import threading
+from graph_writer import quote_name, valid_name
+from prompts import RELATION_EXTRACTION_TEMPLATE
+
+# Seconds to wait for index population at startup before ingestion begins
+INDEX_WAIT_SECONDS = int(os.getenv("INDEX_WAIT_SECONDS", "300"))
+
+# Labels the extraction prompt asks for; constraints for these are created at startup
+KNOWN_LABELS = re.findall(r"label:'(\w+)'", RELATION_EXTRACTION_TEMPLATE)
+
+INDEX_STATE_QUERY = (
+    "SHOW INDEXES YIELD name, type, labelsOrTypes, properties, state, populationPercent "
+    "WHERE properties = ['id'] RETURN name, type, labelsOrTypes, properties, state, populationPercent"
+)
+
+
+def constraint_query(label):
+    return f"CREATE CONSTRAINT {label}_id_unique IF NOT EXISTS FOR (n:{quote_name(label)}) REQUIRE n.id IS UNIQUE"
+
+
+# Fallback when existing duplicate ids prevent a uniqueness constraint
+def index_query(label):
+    return f"CREATE INDEX {label}_id_index IF NOT EXISTS FOR (n:{quote_name(label)}) ON (n.id)"
+
+
+class ConstraintManager:
+    """Makes sure every label the writer MERGEs on has a uniqueness constraint (or at least a range index) on `id`,
+    so MERGE is an index seek instead of a label scan. Labels are handled once per process."""
+
+    def __init__(self):
+        self.ensured = set()
+        self.lock = threading.Lock()
+
+    def _pending(self, labels):
+        with self.lock:
+            return [label for label in sorted(set(labels)) if label not in self.ensured and valid_name(label)]
+
+    def _done(self, label):
+        with self.lock:
+            self.ensured.add(label)
+
+    def ensure(self, driver, labels):
+        for label in self._pending(labels):
+            with driver.session() as session:
+                try:
+                    session.run(constraint_query(label)).consume()
+                except Exception as e:
+                    print(f"Cannot create uniqueness constraint for {label}, using an index instead: {e}")
+                    session.run(index_query(label)).consume()
+            print(f"Ensured id constraint/index for label {label}")
+            self._done(label)
+
+    async def aensure(self, driver, labels):
+        for label in self._pending(labels):
+            async with driver.session() as session:
+                try:
+                    await (await session.run(constraint_query(label))).consume()
+                except Exception as e:
+                    print(f"Cannot create uniqueness constraint for {label}, using an index instead: {e}")
+                    await (await session.run(index_query(label))).consume()
+            print(f"Ensured id constraint/index for label {label}")
+            self._done(label)
+
+    async def await_indexes(self, driver, timeout=INDEX_WAIT_SECONDS):
+        async with driver.session() as session:
+            await (await session.run(f"CALL db.awaitIndexes({int(timeout)})")).consume()
+
+    async def index_states(self, driver):
+        async with driver.session() as session:
+            result = await session.run(INDEX_STATE_QUERY)
+            return [dict(record) async for record in result]
+
+
+# Labels a batch of statements is about to MERGE on
+def statement_labels(statements):
+    labels = set()
+    for statement in statements:
+        if statement.label:
+            labels.add(statement.label)
+        if statement.pattern:
+            labels.update((statement.pattern[0], statement.pattern[2]))
+    return labels
+
+
+constraint_manager = ConstraintManager()
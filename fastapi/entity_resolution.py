@@ -0,0 +1,153 @@
+import os
+import random
+import asyncio
+import threading
+import numpy as np
+from zlib import crc32
+from graph_writer import normalize_search_text
+
+# Entity resolution configuration
+ENTITY_RESOLUTION = os.getenv("ENTITY_RESOLUTION", "1") not in ("0", "false", "False")
+# Minimum trigram Jaccard similarity for an id to be merged into an existing one
+RESOLUTION_THRESHOLD = float(os.getenv("ENTITY_RESOLUTION_THRESHOLD", "0.8"))
+# Keys shorter than this are only merged on an exact match ("ai" and "api" are different things)
+RESOLUTION_MIN_LENGTH = int(os.getenv("ENTITY_RESOLUTION_MIN_LENGTH", "5"))
+# MinHash signature = BANDS x ROWS hashes; ids sharing all the rows of any band become candidates
+MINHASH_BANDS = int(os.getenv("ENTITY_RESOLUTION_BANDS", "8"))
+MINHASH_ROWS = int(os.getenv("ENTITY_RESOLUTION_ROWS", "4"))
+
+CORPORATE_SUFFIXES = {"inc", "incorporated", "corp", "corporation", "ltd", "limited", "llc", "co", "company", "plc", "gmbh", "ag", "sa"}
+
+LOAD_QUERY = "MATCH (n) WHERE n.id IS NOT NULL RETURN labels(n) AS labels, n.id AS id"
+
+# Universal hashes (a * crc32 + b) mod p; with p < 2^31 the products fit in uint64
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = random.Random(20240601)
+_A = np.array([_rng.randrange(1, (1 << 31) - 1) for _ in range(MINHASH_BANDS * MINHASH_ROWS)], dtype=np.uint64)[:, None]
+_B = np.array([_rng.randrange(0, (1 << 31) - 1) for _ in range(MINHASH_BANDS * MINHASH_ROWS)], dtype=np.uint64)[:, None]
+
+
+# "OpenAI Inc.", "open ai" and "openai" all have the key "openai"
+def resolution_key(entity_id):
+    words = normalize_search_text(entity_id).split()
+    while len(words) > 1 and words[-1] in CORPORATE_SUFFIXES:
+        words.pop()
+    return "".join(words)
+
+
+def trigrams(key):
+    padded = f"#{key}#"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def minhash_bands(grams):
+    hashes = np.fromiter((crc32(gram.encode()) for gram in grams), dtype=np.uint64, count=len(grams))
+    signature = ((_A * hashes + _B) % _PRIME).min(axis=1).reshape(MINHASH_BANDS, MINHASH_ROWS)
+    return [(band, signature[band].tobytes()) for band in range(MINHASH_BANDS)]
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class LabelIndex:
+    """Canonical ids of one label: exact lookups by id and normalized key, and MinHash LSH buckets
+    over key trigrams to find near-duplicate candidates without comparing against every id."""
+
+    def __init__(self):
+        self.ids = {}
+        self.keys = {}
+        self.grams = {}
+        self.buckets = {}
+
+    def add(self, entity_id, key):
+        self.ids[entity_id] = entity_id
+        if key in self.keys:
+            return
+        self.keys[key] = entity_id
+        if len(key) >= RESOLUTION_MIN_LENGTH:
+            grams = self.grams[entity_id] = trigrams(key)
+            for band in minhash_bands(grams):
+                self.buckets.setdefault(band, set()).add(entity_id)
+
+    def match(self, key, threshold):
+        if key in self.keys:
+            return self.keys[key]
+        if len(key) < RESOLUTION_MIN_LENGTH:
+            return None
+        grams = trigrams(key)
+        candidates = set()
+        for band in minhash_bands(grams):
+            candidates.update(self.buckets.get(band, ()))
+        best, best_score = None, threshold
+        for candidate in candidates:
+            score = jaccard(grams, self.grams[candidate])
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+
+class EntityResolver:
+    """Maps extracted entity ids to the canonical id of an entity of the same label that is already in
+    the graph (or was seen earlier in this process), so near-duplicates are written as one node.
+    Ids that match nothing become canonical themselves."""
+
+    def __init__(self, threshold=RESOLUTION_THRESHOLD, enabled=ENTITY_RESOLUTION):
+        self.threshold = threshold
+        self.enabled = enabled
+        self.labels = {}
+        self.merged = 0
+        self.lock = threading.Lock()
+
+    def register(self, label, entity_id):
+        with self.lock:
+            self.labels.setdefault(label, LabelIndex()).add(entity_id, resolution_key(entity_id))
+
+    def resolve(self, label, entity_id):
+        if not self.enabled:
+            return entity_id
+        key = resolution_key(entity_id)
+        if not key:
+            return entity_id
+        with self.lock:
+            index = self.labels.setdefault(label, LabelIndex())
+            if entity_id in index.ids:
+                return index.ids[entity_id]
+            canonical = index.match(key, self.threshold)
+            if canonical is None:
+                index.add(entity_id, key)
+                return entity_id
+            index.ids[entity_id] = canonical
+            self.merged += 1
+        print(f"Resolved {label} {entity_id!r} to {canonical!r}")
+        return canonical
+
+    def _load_rows(self, rows):
+        count = 0
+        for labels, entity_id in rows:
+            for label in labels:
+                self.register(label, str(entity_id))
+            count += 1
+        print(f"Entity resolution index loaded {count} entities")
+
+    def load(self, driver):
+        with driver.session() as session:
+            self._load_rows([(record["labels"], record["id"]) for record in session.run(LOAD_QUERY)])
+
+    async def aload(self, driver):
+        async with driver.session() as session:
+            result = await session.run(LOAD_QUERY)
+            rows = [(record["labels"], record["id"]) async for record in result]
+        await asyncio.to_thread(self._load_rows, rows)
+
+    def info(self):
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "merged": self.merged,
+                "entities_by_label": {label: len(index.keys) for label, index in self.labels.items()},
+            }
+
+
+entity_resolver = EntityResolver()
@@ -0,0 +1,155 @@
+import os
+import re
+import json
+import threading
+from graph_writer import quote_name, valid_name, normalize_search_text
+
+# Full-text entity search configuration
+SEARCH_INDEX_NAME = "entity_search"
+SEARCH_PROPERTIES = ["id", "search_name", "name", "description"]
+# A term matching more candidates than this is too broad to narrow down; its predicate is left as a scan
+SEARCH_RESOLVE_LIMIT = int(os.getenv("SEARCH_RESOLVE_LIMIT", "100"))
+
+SEARCH_QUERY = (
+    f"CALL db.index.fulltext.queryNodes('{SEARCH_INDEX_NAME}', $query, {{limit: $limit}}) "
+    "YIELD node, score RETURN node.id AS id, labels(node) AS labels, score"
+)
+EXISTING_INDEX_QUERY = (
+    f"SHOW FULLTEXT INDEXES YIELD name, labelsOrTypes WHERE name = '{SEARCH_INDEX_NAME}' RETURN labelsOrTypes"
+)
+# Entities without search_name are read and written back a page at a time, normalized as on ingest
+BACKFILL_BATCH_SIZE = 10000
+BACKFILL_READ_QUERY = (
+    "MATCH (n) WHERE n.id IS NOT NULL AND n.search_name IS NULL "
+    "RETURN elementId(n) AS key, coalesce(n.name, n.id) AS name LIMIT $limit"
+)
+BACKFILL_WRITE_QUERY = "UNWIND $rows AS row MATCH (n) WHERE elementId(n) = row.key SET n.search_name = row.search_name"
+# A CONTAINS predicate on `name` is looked up in search_name, its normalized copy
+SEARCH_FIELDS = {"name": "search_name"}
+
+
+# Every word of the term must match, as a prefix, in one of the indexed fields.
+# Normalized words are plain [a-z0-9], so nothing needs Lucene escaping.
+def lucene_query(term):
+    words = normalize_search_text(term).split()
+    return " AND ".join(f"{word}*" for word in words)
+
+
+# Nodes whose `prop` field holds every word of the term inside one of its words: a superset of the nodes
+# where toLower(prop) CONTAINS the term, as the term's words are substrings of the words of any such value
+def contains_query(term, prop):
+    field = SEARCH_FIELDS.get(prop, prop)
+    return " AND ".join(f"{field}:*{word}*" for word in normalize_search_text(term).split())
+
+
+def create_index_query(labels):
+    label_expr = "|".join(quote_name(label) for label in sorted(labels))
+    properties = ", ".join(f"n.{prop}" for prop in SEARCH_PROPERTIES)
+    return f"CREATE FULLTEXT INDEX {SEARCH_INDEX_NAME} IF NOT EXISTS FOR (n:{label_expr}) ON EACH [{properties}]"
+
+
+class SearchIndexManager:
+    """Keeps the full-text index over entity names/descriptions covering every entity label.
+    Full-text indexes cannot be altered, so a new label means dropping and recreating the index."""
+
+    def __init__(self):
+        self.labels = None
+        self.lock = threading.Lock()
+
+    def _plan(self, labels, existing):
+        with self.lock:
+            if self.labels is None:
+                self.labels = {label for label in existing if valid_name(label)}
+            wanted = self.labels | {label for label in labels if valid_name(label)}
+            if wanted == self.labels and self.labels:
+                return None
+            recreate = bool(self.labels)
+            self.labels = wanted
+            return recreate, wanted
+
+    def ensure(self, driver, labels):
+        with driver.session() as session:
+            existing = []
+            if self.labels is None:
+                record = session.run(EXISTING_INDEX_QUERY).single()
+                existing = record[0] if record else []
+            plan = self._plan(labels, existing)
+            if plan is None:
+                return
+            recreate, wanted = plan
+            if recreate:
+                session.run(f"DROP INDEX {SEARCH_INDEX_NAME} IF EXISTS").consume()
+            session.run(create_index_query(wanted)).consume()
+        print(f"Full-text index {SEARCH_INDEX_NAME} covers {sorted(wanted)}")
+
+    async def aensure(self, driver, labels):
+        async with driver.session() as session:
+            existing = []
+            if self.labels is None:
+                record = await (await session.run(EXISTING_INDEX_QUERY)).single()
+                existing = record[0] if record else []
+            plan = self._plan(labels, existing)
+            if plan is None:
+                return
+            recreate, wanted = plan
+            if recreate:
+                await (await session.run(f"DROP INDEX {SEARCH_INDEX_NAME} IF EXISTS")).consume()
+            await (await session.run(create_index_query(wanted))).consume()
+        print(f"Full-text index {SEARCH_INDEX_NAME} covers {sorted(wanted)}")
+
+    # Give entities written before search_name existed a value, so the index can find them
+    async def abackfill(self, driver, batch_size=BACKFILL_BATCH_SIZE):
+        async with driver.session() as session:
+            while True:
+                rows = [record.data() async for record in await session.run(BACKFILL_READ_QUERY, limit=batch_size)]
+                if not rows:
+                    return
+                rows = [{"key": row["key"], "search_name": normalize_search_text(row["name"])} for row in rows]
+                await (await session.run(BACKFILL_WRITE_QUERY, rows=rows)).consume()
+
+
+search_index = SearchIndexManager()
+
+
+# Matches `toLower(var.prop) CONTAINS 'term'` and `toLower(var.prop) CONTAINS toLower('term')`
+FUZZY_PREDICATE = re.compile(
+    r"toLower\(\s*(?P<var>\w+)\.(?P<prop>\w+)\s*\)\s+CONTAINS\s+"
+    r"(?:toLower\(\s*(?P<q1>['\"])(?P<t1>.*?)(?P=q1)\s*\)|(?P<q2>['\"])(?P<t2>.*?)(?P=q2))",
+    re.IGNORECASE,
+)
+
+
+def search_entities(query_fn, term, limit=SEARCH_RESOLVE_LIMIT, prop=None):
+    """Ids of the entities whose indexed fields match `term` (or, with `prop`, that may contain it in that
+    property); `query_fn(cypher, params)` returns a list of dicts."""
+    query = contains_query(term, prop) if prop else lucene_query(term)
+    if not query:
+        return []
+    return [row["id"] for row in query_fn(SEARCH_QUERY, {"query": query, "limit": limit + 1})]
+
+
+def rewrite_fuzzy_predicates(cypher, query_fn, limit=SEARCH_RESOLVE_LIMIT):
+    """Narrow the full-scan `toLower(x.prop) CONTAINS '...'` predicates the Cypher prompt asks for to
+    `x.id IN [...]`, the candidates found in that property through the full-text index, so the match becomes
+    an id index seek. The predicate itself stays as a filter on the candidates.
+    Predicates on unindexed properties, with non-ASCII terms (the index does not fold accents the way the
+    search words do), or whose term matches too much, are left untouched."""
+    resolved = {}
+
+    def replace(match):
+        prop = match.group("prop")
+        term = match.group("t1") if match.group("t1") is not None else match.group("t2")
+        if prop not in SEARCH_PROPERTIES or not normalize_search_text(term) or not term.isascii():
+            return match.group(0)
+        if (prop, term) not in resolved:
+            try:
+                resolved[(prop, term)] = search_entities(query_fn, term, limit, prop)
+            except Exception as e:
+                print(f"Full-text lookup failed for {term!r}: {e}")
+                resolved[(prop, term)] = None
+        ids = resolved[(prop, term)]
+        if ids is None or len(ids) > limit:
+            return match.group(0)
+        return f"({match.group('var')}.id IN {json.dumps(sorted(set(ids)))} AND {match.group(0)})"
+
+    return FUZZY_PREDICATE.sub(replace, cypher)
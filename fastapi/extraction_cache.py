@@ -0,0 +1,140 @@
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import threading
+from time import time
+from collections import OrderedDict
+
+# Extraction cache configuration
+CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "./cache/extraction_cache.sqlite")
+CACHE_MEMORY_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MEMORY_ENTRIES", "512"))
+CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_BUSY_TIMEOUT = float(os.getenv("EXTRACTION_CACHE_BUSY_TIMEOUT", "30"))
+
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+# Content-addressed key: the normalized text, the prompt template and the model configuration
+def cache_key(text, prompt_template, model_config):
+    digest = hashlib.sha256()
+    for part in (normalize_text(text), prompt_template, model_config):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Two-tier cache of extraction results: an in-memory LRU in front of a SQLite store
+    that evicts least recently used entries once it grows past `max_bytes`."""
+
+    def __init__(self, path=CACHE_PATH, memory_entries=CACHE_MEMORY_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.memory = OrderedDict()
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self.db = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            # WAL and a generous busy timeout let several processes (e.g. bulk_load.py workers) share the store
+            self.db = sqlite3.connect(path, timeout=CACHE_BUSY_TIMEOUT, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS extractions "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS extractions_accessed ON extractions (accessed)")
+            # running total of the stored sizes, kept up to date by every insert and eviction
+            self.db.execute("CREATE TABLE IF NOT EXISTS extraction_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self.db.execute(
+                "INSERT OR IGNORE INTO extraction_meta (name, value) "
+                "SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM extractions"
+            )
+            self.db.commit()
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self.memory[key]
+            if self.db is not None:
+                row = self.db.execute("SELECT value FROM extractions WHERE key = ?", (key,)).fetchone()
+                if row:
+                    self.db.execute("UPDATE extractions SET accessed = ? WHERE key = ?", (time(), key))
+                    self.db.commit()
+                    self._remember(key, row[0])
+                    self.stats["disk_hits"] += 1
+                    return row[0]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self._remember(key, value)
+            if self.db is None:
+                return
+            size = len(value.encode("utf-8"))
+            # the write lock is taken up front, so other processes sharing the store see a consistent total
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute("SELECT size FROM extractions WHERE key = ?", (key,)).fetchone()
+                self.db.execute(
+                    "INSERT OR REPLACE INTO extractions (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, size, time()),
+                )
+                total = self._add_bytes(size - (row[0] if row else 0))
+                if total > self.max_bytes:
+                    self._evict(total)
+                self.db.commit()
+            except BaseException:
+                self.db.rollback()
+                raise
+
+    def _add_bytes(self, delta):
+        self.db.execute("UPDATE extraction_meta SET value = value + ? WHERE name = 'total_bytes'", (delta,))
+        return self.db.execute("SELECT value FROM extraction_meta WHERE name = 'total_bytes'").fetchone()[0]
+
+    # Drop least recently used rows until the store fits in max_bytes; only the rows dropped are read
+    def _evict(self, total, batch=64):
+        freed = 0
+        while total - freed > self.max_bytes:
+            rows = self.db.execute("SELECT key, size FROM extractions ORDER BY accessed LIMIT ?", (batch,)).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total - freed <= self.max_bytes:
+                    break
+                self.db.execute("DELETE FROM extractions WHERE key = ?", (key,))
+                self.memory.pop(key, None)
+                freed += size
+                self.stats["evictions"] += 1
+        self._add_bytes(-freed)
+
+    def info(self):
+        with self.lock:
+            info = dict(self.stats)
+            info["memory_entries"] = len(self.memory)
+            if self.db is not None:
+                info["disk_entries"] = self.db.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+                info["disk_bytes"] = self.db.execute("SELECT value FROM extraction_meta WHERE name = 'total_bytes'").fetchone()[0]
+            return info
+
+
+# Only well-formed json results are worth caching
+def is_cacheable(result):
+    try:
+        return isinstance(json.loads(result), dict)
+    except (TypeError, ValueError):
+        return False
@@ -0,0 +1,311 @@
+import re
+import json
+import asyncio
+import hashlib
+import threading
+from time import sleep
+from urllib.parse import urlparse
+from langchain_core.language_models.llms import LLM
+from source_fetch import Fetcher, SourceRef
+
+# Local stand-ins for external services, used to exercise the pipeline without API keys or a network
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGemini:
+    """Drop-in for the `GEMINI` GenerativeModel. Each call sleeps `latency` seconds and returns either
+    `response` (a fixed string, or a callable taking the prompt) or entities synthesized from the prompt.
+    With `stream=True` the text arrives in `stream_chunk_size`-character pieces, the latency spread over them."""
+
+    def __init__(self, response=None, latency=0.0, stream_chunk_size=64):
+        self.response = response
+        self.latency = latency
+        self.stream_chunk_size = stream_chunk_size
+        self.calls = 0
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def _respond(self, prompt):
+        with self.lock:
+            self.calls += 1
+            self.prompts.append(prompt)
+        if self.response is None:
+            return synthesize_extraction(prompt)
+        if callable(self.response):
+            return self.response(prompt)
+        return self.response
+
+    def _pieces(self, prompt):
+        text = self._respond(prompt)
+        pieces = [text[i:i + self.stream_chunk_size] for i in range(0, len(text), self.stream_chunk_size)] or [""]
+        return pieces, self.latency / len(pieces)
+
+    def _stream(self, prompt):
+        pieces, delay = self._pieces(prompt)
+        for piece in pieces:
+            if delay:
+                sleep(delay)
+            yield FakeResponse(piece)
+
+    async def _astream(self, prompt):
+        pieces, delay = self._pieces(prompt)
+        for piece in pieces:
+            if delay:
+                await asyncio.sleep(delay)
+            yield FakeResponse(piece)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self._stream(prompt)
+        if self.latency:
+            sleep(self.latency)
+        return FakeResponse(self._respond(prompt))
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self._astream(prompt)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return FakeResponse(self._respond(prompt))
+
+
+# Deterministic extraction: capitalized words of the case sheet become Concepts, chained with IS_RELATED_TO
+def synthesize_extraction(prompt):
+    text = prompt.split("Case Sheet:", 1)[-1]
+    ids = []
+    for word in re.findall(r"\b[A-Z][a-zA-Z0-9]{2,}\b", text):
+        entity_id = word.lower()
+        if entity_id not in ids:
+            ids.append(entity_id)
+    entities = [{"label": "Concept", "id": entity_id, "name": entity_id.title()} for entity_id in ids]
+    relationships = [f"{a}|IS_RELATED_TO|{b}" for a, b in zip(ids, ids[1:])]
+    return json.dumps({"entities": entities, "relationships": relationships})
+
+
+class FakeQALLM(LLM):
+    """Drop-in for the QA chat model: returns `cypher` for Cypher-generation prompts and `answer` for answer
+    prompts, after `latency` seconds, so the QA chain can run without an API key."""
+
+    cypher: str
+    answer: str = "I don't know the answer."
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-qa"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            sleep(self.latency)
+        return self.cypher if "Cypher translator" in prompt else self.answer
+
+
+class FakeRecognizer:
+    """Drop-in for the speech recognizers of audio.py: each segment takes `latency` seconds and becomes a
+    sentence naming its position in the recording (or whatever `text(audio)` returns)."""
+
+    def __init__(self, latency=0.0, text=None):
+        self.latency = latency
+        self.text = text
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def transcribe(self, audio):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        if self.latency:
+            sleep(self.latency)
+        if self.text is not None:
+            return self.text(audio)
+        seconds = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+        return f"Segment{call} lasted {seconds:.1f} seconds and mentioned Topic{call}."
+
+
+class FakeFetcher(Fetcher):
+    """Drop-in for the fetchers of source_fetch.py serving recorded `pages` ({url: text}) after `latency` seconds,
+    with a hash of the text as validator (edit an entry to simulate a changed source). Records the most fetches
+    ever in flight at once for one host in `max_active`."""
+
+    name = "fake"
+
+    def __init__(self, pages, latency=0.0):
+        self.pages = pages
+        self.latency = latency
+        self.fetches = 0
+        self.revalidations = 0
+        self.active = {}
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def match(self, url):
+        if url not in self.pages:
+            return None
+        return SourceRef(f"fake:{url}", url, urlparse(url).netloc, url)
+
+    def _serve(self, ref):
+        with self.lock:
+            self.active[ref.host] = self.active.get(ref.host, 0) + 1
+            self.max_active = max(self.max_active, self.active[ref.host])
+        try:
+            if self.latency:
+                sleep(self.latency)
+            text = self.pages[ref.target]
+            return text, hashlib.sha256(text.encode("utf-8")).hexdigest()
+        finally:
+            with self.lock:
+                self.active[ref.host] -= 1
+
+    def fetch(self, ref):
+        with self.lock:
+            self.fetches += 1
+        return self._serve(ref)
+
+    def revalidate(self, ref, validator):
+        with self.lock:
+            self.revalidations += 1
+        return self._serve(ref)[1] == validator
+
+
+class FakeCounters:
+    def __init__(self, **counters):
+        self.__dict__.update(counters)
+
+    def __getattr__(self, name):
+        return 0
+
+
+class FakeGraphData:
+    """Shared state of the fake drivers: node keys and relationship keys written by the graph writer's queries."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.nodes = set()
+        self.relationships = set()
+        self.lock = threading.Lock()
+
+    def run(self, query, rows=None):
+        rows = rows or []
+        names = re.findall(r"`([A-Za-z0-9_]+)`", query)
+        with self.lock:
+            if "MERGE (n:" in query:
+                before = len(self.nodes)
+                self.nodes.update((names[0], row["id"]) for row in rows)
+                return [], FakeCounters(nodes_created=len(self.nodes) - before)
+            if "MERGE (a)-" in query:
+                src_label, tgt_label, rs_type = names
+                before = len(self.relationships)
+                for row in rows:
+                    if (src_label, row["src"]) in self.nodes and (tgt_label, row["tgt"]) in self.nodes:
+                        self.relationships.add((src_label, row["src"], rs_type, tgt_label, row["tgt"]))
+                return [], FakeCounters(relationships_created=len(self.relationships) - before)
+            if "labels(n) AS labels" in query:
+                return [{"labels": [label], "id": node_id} for label, node_id in sorted(self.nodes)], FakeCounters()
+            if "db.labels()" in query:
+                return [[label] for label in sorted({node[0] for node in self.nodes})], FakeCounters()
+            if "db.relationshipTypes()" in query:
+                return [[rs_type] for rs_type in sorted({rel[2] for rel in self.relationships})], FakeCounters()
+            if "count(r)" in query:
+                return [[sum(1 for rel in self.relationships if not names or rel[2] == names[0])]], FakeCounters()
+            if "count(n)" in query:
+                return [[sum(1 for node in self.nodes if not names or node[0] == names[0])]], FakeCounters()
+        return [], FakeCounters()
+
+
+class FakeResult:
+    def __init__(self, records, counters):
+        self.records = records
+        self.counters = counters
+
+    def single(self):
+        return self.records[0] if self.records else None
+
+    def consume(self):
+        return self
+
+    def __iter__(self):
+        return iter(self.records)
+
+
+class FakeSession:
+    def __init__(self, data):
+        self.data = data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, parameters=None, **kwargs):
+        if self.data.latency:
+            sleep(self.data.latency)
+        return FakeResult(*self.data.run(query, kwargs.get("rows")))
+
+    def execute_write(self, work, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+    execute_read = execute_write
+
+
+class FakeDriver:
+    """Stand-in for the neo4j sync Driver, with `latency` seconds per query."""
+
+    def __init__(self, latency=0.0, data=None):
+        self.data = data or FakeGraphData(latency)
+
+    def session(self, **kwargs):
+        return FakeSession(self.data)
+
+    def verify_connectivity(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeAsyncResult(FakeResult):
+    async def __aiter__(self):
+        for record in self.records:
+            yield record
+
+    async def single(self):
+        return self.records[0] if self.records else None
+
+    async def consume(self):
+        return self
+
+
+class FakeAsyncSession(FakeSession):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def run(self, query, parameters=None, **kwargs):
+        if self.data.latency:
+            await asyncio.sleep(self.data.latency)
+        return FakeAsyncResult(*self.data.run(query, kwargs.get("rows")))
+
+    async def execute_write(self, work, *args, **kwargs):
+        return await work(self, *args, **kwargs)
+
+    execute_read = execute_write
+
+
+class FakeAsyncDriver(FakeDriver):
+    """Stand-in for the neo4j AsyncDriver; shares FakeGraphData with a FakeDriver if given the same `data`."""
+
+    def session(self, **kwargs):
+        return FakeAsyncSession(self.data)
+
+    async def verify_connectivity(self):
+        pass
+
+    async def close(self):
+        pass
@@ -0,0 +1,233 @@
+import os
+import threading
+import numpy as np
+from graph_snapshot import GraphSnapshot, SnapshotMissingError, current_snapshot, GRAPH_SNAPSHOT_DIR
+from metrics import span
+
+# Analytics configuration
+PAGERANK_DAMPING = float(os.getenv("PAGERANK_DAMPING", "0.85"))
+PAGERANK_TOLERANCE = float(os.getenv("PAGERANK_TOLERANCE", "1e-6"))
+PAGERANK_MAX_ITERATIONS = int(os.getenv("PAGERANK_MAX_ITERATIONS", "100"))
+# Most nodes a k-hop neighborhood lists (all of them are counted)
+NEIGHBORHOOD_LIMIT = int(os.getenv("NEIGHBORHOOD_LIMIT", "200"))
+
+DIRECTIONS = ("out", "in", "both")
+
+
+class EntityNotFoundError(Exception):
+    pass
+
+
+### Algorithms ###
+# Plain functions over a GraphSnapshot, vectorized with NumPy; nodes are snapshot node numbers
+
+def degrees(snapshot):
+    """(out degree, in degree) of every node."""
+    return np.diff(snapshot.out_offsets), np.diff(snapshot.in_offsets)
+
+
+def pagerank(snapshot, damping=PAGERANK_DAMPING, tolerance=PAGERANK_TOLERANCE, max_iterations=PAGERANK_MAX_ITERATIONS):
+    """PageRank by power iteration, the rank of nodes without outgoing relationships spread over all nodes.
+    Returns (ranks, iterations); iteration stops once the ranks move less than `tolerance` in total."""
+    n = snapshot.node_count
+    if not n:
+        return np.zeros(0), 0
+    sources, targets = snapshot.edges()
+    out_degree = np.diff(snapshot.out_offsets).astype(np.float64)
+    dangling = out_degree == 0
+    share = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+    ranks = np.full(n, 1.0 / n)
+    for iteration in range(1, max_iterations + 1):
+        spread = np.bincount(targets, weights=(ranks * share)[sources], minlength=n)
+        updated = damping * (spread + ranks[dangling].sum() / n) + (1.0 - damping) / n
+        delta = np.abs(updated - ranks).sum()
+        ranks = updated
+        if delta < tolerance:
+            break
+    return ranks, iteration
+
+
+def connected_components(snapshot, mask=None):
+    """Weakly connected components of the subgraph induced by `mask` (all nodes by default): the component
+    of every node, named after its smallest node number (-1 outside the mask).
+
+    Components are merged by hooking the larger root of every relationship onto the smaller one and then
+    jumping every node to its root, which takes a few rounds even on long chains."""
+    n = snapshot.node_count
+    sources, targets = snapshot.edges()
+    if mask is not None:
+        inside = mask[sources] & mask[targets]
+        sources, targets = sources[inside], targets[inside]
+    roots = np.arange(n, dtype=np.int64)
+    while True:
+        low, high = np.minimum(roots[sources], roots[targets]), np.maximum(roots[sources], roots[targets])
+        merge = low != high
+        if not merge.any():
+            break
+        sources, targets = sources[merge], targets[merge]
+        np.minimum.at(roots, high[merge], low[merge])
+        while True:
+            jumped = roots[roots]
+            if np.array_equal(jumped, roots):
+                break
+            roots = jumped
+    if mask is not None:
+        roots[~mask] = -1
+    return roots
+
+
+def neighbors(offsets, columns, nodes):
+    """All CSR neighbors of `nodes`, concatenated."""
+    starts = np.asarray(offsets[nodes])
+    lengths = np.asarray(offsets[nodes + 1]) - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    # position of every neighbor: its list's start plus its place in the list
+    positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+    return np.asarray(columns[positions], dtype=np.int64)
+
+
+def k_hop(snapshot, node, hops, direction="both"):
+    """Nodes first reached at each of 1..`hops` relationships from `node`, one array per hop."""
+    visited = np.zeros(snapshot.node_count, dtype=bool)
+    visited[node] = True
+    frontier = np.array([node], dtype=np.int64)
+    layers = []
+    for _ in range(hops):
+        reached = []
+        if direction in ("out", "both"):
+            reached.append(neighbors(snapshot.out_offsets, snapshot.out_targets, frontier))
+        if direction in ("in", "both"):
+            reached.append(neighbors(snapshot.in_offsets, snapshot.in_sources, frontier))
+        frontier = np.unique(np.concatenate(reached))
+        frontier = frontier[~visited[frontier]]
+        if not len(frontier):
+            break
+        visited[frontier] = True
+        layers.append(frontier)
+    return layers
+
+
+# Function to pick the `top` highest scores (among `mask`), highest first
+def top_nodes(scores, top, mask=None):
+    candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(scores))
+    if len(candidates) > top:
+        candidates = candidates[np.argpartition(-scores[candidates], top - 1)[:top]]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+### Service ###
+
+class GraphAnalytics:
+    """Analytics over the current graph snapshot, answered off the database. The snapshot is reopened when a
+    newer one is exported, and whole-graph results (degrees, PageRank, components) are computed once per snapshot."""
+
+    def __init__(self, directory=GRAPH_SNAPSHOT_DIR):
+        self.directory = directory
+        self.snapshot = None
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def current(self):
+        path = current_snapshot(self.directory)
+        if path is None:
+            raise SnapshotMissingError("No graph snapshot has been exported yet (POST /snapshot).")
+        with self.lock:
+            if self.snapshot is None or self.snapshot.path != path:
+                self.snapshot = GraphSnapshot(path)
+                self.results = {}
+            return self.snapshot, self.results
+
+    # Function to compute a whole-graph result once per snapshot
+    def cached(self, key, compute):
+        snapshot, results = self.current()
+        if key not in results:
+            with span("graph_analytics", analysis=key[0], nodes=snapshot.node_count):
+                results[key] = compute(snapshot)
+        return snapshot, results[key]
+
+    def nodes(self, snapshot, nodes, **columns):
+        return [{**snapshot.node(node), **{name: values[node].item() for name, values in columns.items()}} for node in nodes]
+
+    def degree(self, top=10, label=None, direction="both"):
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction {direction!r}, expected one of {', '.join(DIRECTIONS)}")
+        snapshot, (out_degree, in_degree) = self.cached(("degree",), degrees)
+        scores = {"out": out_degree, "in": in_degree, "both": out_degree + in_degree}[direction]
+        nodes = top_nodes(scores, top, snapshot.label_mask(label) if label else None)
+        return {"snapshot": snapshot.info(), "direction": direction, "nodes": self.nodes(snapshot, nodes, degree=scores, out_degree=out_degree, in_degree=in_degree)}
+
+    def pagerank(self, top=10, label=None):
+        snapshot, (ranks, iterations) = self.cached(("pagerank",), pagerank)
+        nodes = top_nodes(ranks, top, snapshot.label_mask(label) if label else None)
+        return {"snapshot": snapshot.info(), "iterations": iterations, "nodes": self.nodes(snapshot, nodes, pagerank=ranks)}
+
+    def components(self, top=10, label=None, sample=10):
+        """The largest weakly connected components (of the nodes with `label`, if given), with their size,
+        labels and a sample of members."""
+        snapshot, roots = self.cached(("components", label), lambda snapshot: connected_components(snapshot, snapshot.label_mask(label) if label else None))
+        names, sizes = np.unique(roots[roots >= 0], return_counts=True)
+        largest = top_nodes(sizes, top)
+        components = []
+        for position in largest:
+            members = np.flatnonzero(roots == names[position])
+            codes, counts = np.unique(np.asarray(snapshot.node_labels[members]), return_counts=True)
+            components.append({
+                "size": int(sizes[position]),
+                "labels": {snapshot.labels[code] if code >= 0 else None: int(count) for code, count in zip(codes, counts)},
+                "sample": [snapshot.node_id(member) for member in members[:sample]],
+            })
+        return {
+            "snapshot": snapshot.info(),
+            "label": label,
+            "components": len(names),
+            "isolated": int((sizes == 1).sum()),
+            "largest": components,
+        }
+
+    def neighborhood(self, entity_id, label=None, hops=2, direction="both", limit=NEIGHBORHOOD_LIMIT):
+        """Nodes within `hops` relationships of an entity, nearest first, at most `limit` of them listed."""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction {direction!r}, expected one of {', '.join(DIRECTIONS)}")
+        snapshot, _ = self.current()
+        matches = snapshot.find(entity_id, label)
+        if not matches:
+            raise EntityNotFoundError(f"Unknown entity {entity_id!r}.")
+        if len(matches) > 1:
+            labels = sorted(snapshot.node(node)["label"] or "" for node in matches)
+            raise ValueError(f"{entity_id!r} has several labels ({', '.join(labels)}), pass one.")
+        with span("graph_analytics", analysis="neighborhood", hops=hops):
+            layers = k_hop(snapshot, matches[0], hops, direction)
+        listed = []
+        for hop, layer in enumerate(layers, 1):
+            listed += [{**snapshot.node(node), "hop": hop} for node in layer[:max(0, limit - len(listed))]]
+        return {
+            "snapshot": snapshot.info(),
+            "center": snapshot.node(matches[0]),
+            "hops": [{"hop": hop, "nodes": len(layer)} for hop, layer in enumerate(layers, 1)],
+            "nodes": listed,
+            "truncated": sum(len(layer) for layer in layers) > len(listed),
+        }
+
+    def info(self):
+        """Summary of the snapshot in the shape of /info, with its degree and component statistics."""
+        snapshot, (out_degree, in_degree) = self.cached(("degree",), degrees)
+        _, roots = self.cached(("components", None), connected_components)
+        labels = np.bincount(np.asarray(snapshot.node_labels) + 1, minlength=len(snapshot.labels) + 1)
+        types = np.bincount(np.asarray(snapshot.out_types), minlength=len(snapshot.types))
+        sizes = np.bincount(roots) if snapshot.node_count else np.zeros(0, dtype=np.int64)
+        return {
+            "snapshot": snapshot.info(),
+            "num_entity": snapshot.node_count,
+            "num_relation": snapshot.relationship_count,
+            "nodes_by_label": {label: int(count) for label, count in zip(snapshot.labels, labels[1:])},
+            "relationships_by_type": {rs_type: int(count) for rs_type, count in zip(snapshot.types, types)},
+            "max_degree": int((out_degree + in_degree).max()) if snapshot.node_count else 0,
+            "mean_degree": round(2 * snapshot.relationship_count / snapshot.node_count, 3) if snapshot.node_count else 0.0,
+            "components": int((sizes > 0).sum()),
+            "largest_component": int(sizes.max()) if snapshot.node_count else 0,
+        }
+
+
+graph_analytics = GraphAnalytics()
@@ -3,16 +3,24 @@ import google.generativeai as genai
 from google.generativeai.types import generation_types
 from string import Template
 import json
-from neo4j import GraphDatabase
-import glob
+import asyncio
+import queue
 from timeit import default_timer as timer
 from dotenv import load_dotenv
-from time import sleep
-import re
-from youtube_transcript_api import YouTubeTranscriptApi 
-from urllib.parse import urlparse,parse_qs
-from langchain_community.document_loaders import WikipediaLoader, WebBaseLoader
+from concurrent.futures import ThreadPoolExecutor
 from prompts import RELATION_EXTRACTION_TEMPLATE
+from graph_writer import WRITE_BATCH_SIZE, normalize_id, build_removal_statements, awrite_statements, StreamingGraphWriter
+from json_stream import ExtractionStreamParser
+from entity_resolution import entity_resolver
+from graph_state import graph_state
+from graph_store import create_driver, create_async_driver
+from constraints import constraint_manager, statement_labels
+from entity_search import search_index
+from text_chunking import split_into_chunks
+from rate_limiter import RateLimiter, estimate_tokens
+from extraction_cache import ExtractionCache, cache_key, is_cacheable
+from source_registry import source_registry
+from metrics import span, observe_stage, record_llm_call, submit_in_context, EXTRACTION_CACHE, EXTRACTION_ITEMS, EXTRACTION_PARSE_ERRORS
 
 load_dotenv()
 
@@ -44,21 +52,69 @@ system_instruction = "You are a helpful IT-project and account management expert
 genai.configure(api_key=os.getenv('GEMINI_KEY'))
 GEMINI = genai.GenerativeModel('gemini-1.5-flash', safety_settings = safety_settings, generation_config = generation_config, system_instruction = system_instruction)
 
-# Neo4j configuration & constraints
-neo4j_url = os.getenv("NEO4J_URI")
-neo4j_user = os.getenv("NEO4J_USERNAME")
-neo4j_password = os.getenv("NEO4J_PASSWORD")
-gds = GraphDatabase.driver(neo4j_url, auth=(neo4j_user, neo4j_password))
-gds.verify_connectivity()
+# Graph database drivers (Neo4j or the embedded graph, see graph_store.py); neither connects before its first query
+gds = create_driver()
+# Async driver used by the server; one pool shared by all concurrent uploads and queries
+async_gds = create_async_driver()
 
-# Function to call the Gemini API
-def process_gemini(file_prompt):
-    response = GEMINI.generate_content(file_prompt)
-    nlp_results = response.text
-    sleep(3)
-    return remove_outer_braces(nlp_results)
+# Extraction concurrency configuration
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "4"))
+gemini_limiter = RateLimiter()
+extraction_cache = ExtractionCache()
+
+# Everything besides the text that changes what the model returns; part of the cache key
+def model_config_key(model):
+    return f"{getattr(model, 'model_name', type(model).__name__)}|{generation_config}|{system_instruction}"
+
+# A streamed piece without text (e.g. the final chunk of a blocked response) raises on .text
+def piece_text(piece):
+    try:
+        return piece.text
+    except ValueError:
+        return ""
+
+# Function to call the Gemini API, throttled by the shared RPM/TPM token buckets. The response text is yielded
+# piece by piece as it is generated; the recorded call latency runs from the request to the last piece.
+def stream_gemini(file_prompt, model=None, limiter=None):
+    model = model or GEMINI
+    limiter = limiter or gemini_limiter
+    limiter.acquire(estimate_tokens(file_prompt))
+    start = timer()
+    received = 0
+    error = None
+    try:
+        for piece in model.generate_content(file_prompt, stream=True):
+            text = piece_text(piece)
+            received += len(text)
+            yield text
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        record_llm_call("extraction", timer() - start, estimate_tokens(file_prompt), received // 4, error)
+
+async def astream_gemini(file_prompt, model=None, limiter=None):
+    model = model or GEMINI
+    limiter = limiter or gemini_limiter
+    await limiter.acquire_async(estimate_tokens(file_prompt))
+    start = timer()
+    received = 0
+    error = None
+    try:
+        response = await model.generate_content_async(file_prompt, stream=True)
+        async for piece in response:
+            text = piece_text(piece)
+            received += len(text)
+            yield text
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        record_llm_call("extraction", timer() - start, estimate_tokens(file_prompt), received // 4, error)
 
 def remove_outer_braces(input_string):
+    if not input_string:
+        return input_string
     if (input_string[0] == '{' and input_string[-1] == '}'):
         return input_string
     start_index = input_string.find('{')
@@ -67,132 +123,350 @@ def remove_outer_braces(input_string):
         return input_string    
     return input_string[start_index:end_index+1]
 
-# Function to take a file and a prompt template, and return a json-object of all the entities and relationships
-def extract_entities_relationships(file, prompt_template):
-    start = timer()
-    print(f"Extracting entities and relationships for {file}")
+# Function to merge the entities/relationships streamed from a document's chunks, in chunk order, into one extraction
+def merge_extractions(items):
+    entities = {}
+    relationships = {}
+    for kind, value in items:
+        if kind == "entity":
+            key = (value.get("label"), normalize_id(value.get("id")))
+            if key in entities:
+                # keep the first value seen for each property, fill in the ones that were missing
+                for k, v in value.items():
+                    if v and not entities[key].get(k):
+                        entities[key][k] = v
+            else:
+                entities[key] = dict(value)
+        elif kind == "relationship":
+            parts = [normalize_id(part.strip()) for part in str(value).split("|")]
+            relationships.setdefault("|".join(parts), value)
+    return {"entities": list(entities.values()), "relationships": list(relationships.values())}
+
+def read_text(file):
+    with open(file, "r") as f:
+        return f.read()
+
+
+# Function to log the statements of the latest update for inspection
+def dump_statements(statements, mode="w"):
+    with open("latest_update_cypher.txt", mode) as outfile:
+        outfile.write("".join(f"{stmt.query} - rows: {json.dumps(stmt.rows)}\n" for stmt in statements))
+
+# Marks the end of one chunk's stream on the item queue
+CHUNK_DONE = object()
+# Marks the end of a streamed source's chunks on the item queue
+CHUNKS_END = object()
+
+# Function to stream one chunk's extraction, calling emit((kind, value)) for every entity/relationship as it closes.
+# Cached results are replayed through the same parser. If the stream fails or its output is cut off, the items
+# emitted so far are kept and the chunk raises, so the ingestion is marked incomplete and removes nothing.
+def stream_chunk(chunk, prompt_template, config_key, emit, model=None, limiter=None, cache=extraction_cache):
+    parser = ExtractionStreamParser()
     try:
-        with open(file, "r") as f:
-            text = f.read().rstrip()
-            prompt = Template(prompt_template).substitute(ctext=text)
-            result = process_gemini(prompt)
+        _stream_chunk(parser, chunk, prompt_template, config_key, emit, model, limiter, cache)
+    finally:
+        record_parse(parser)
+
+def _stream_chunk(parser, chunk, prompt_template, config_key, emit, model, limiter, cache):
+    key = cache_key(chunk, prompt_template, config_key)
+    cached = cache.get(key) if cache is not None else None
+    if cache is not None:
+        EXTRACTION_CACHE.inc(result="miss" if cached is None else "hit")
+    if cached is not None:
+        for item in parser.feed(cached):
+            emit(item)
+        return
+    prompt = Template(prompt_template).substitute(ctext=chunk)
+    try:
+        for piece in stream_gemini(prompt, model, limiter):
+            for item in parser.feed(piece):
+                emit(item)
     except Exception as e:
-        print(f"Error processing {file}: {e}")
-    end = timer()
-    print(f"Extract pipeline completed in {end-start} seconds.")
-    return result
+        raise Exception(f"Extraction stream failed after {parser.items} items: {e}") from e
+    if not parser.complete:
+        raise Exception(f"Extraction output was cut off after {parser.items} items")
+    result = remove_outer_braces(parser.text)
+    if cache is not None and is_cacheable(result):
+        cache.put(key, result)
+
+# Function to export how long parsing one chunk's output took and what it produced
+def record_parse(parser):
+    EXTRACTION_ITEMS.inc(parser.entities, kind="entity")
+    EXTRACTION_ITEMS.inc(parser.relationships, kind="relationship")
+    EXTRACTION_PARSE_ERRORS.inc(parser.errors)
+    observe_stage("json_parse", parser.parse_seconds, items=parser.items, errors=parser.errors, complete=parser.complete)
+
+async def astream_chunk(chunk, prompt_template, config_key, emit, model=None, limiter=None, cache=extraction_cache):
+    parser = ExtractionStreamParser()
+    try:
+        await _astream_chunk(parser, chunk, prompt_template, config_key, emit, model, limiter, cache)
+    finally:
+        record_parse(parser)
+
+async def _astream_chunk(parser, chunk, prompt_template, config_key, emit, model, limiter, cache):
+    key = cache_key(chunk, prompt_template, config_key)
+    cached = await asyncio.to_thread(cache.get, key) if cache is not None else None
+    if cache is not None:
+        EXTRACTION_CACHE.inc(result="miss" if cached is None else "hit")
+    if cached is not None:
+        for item in parser.feed(cached):
+            await emit(item)
+        return
+    prompt = Template(prompt_template).substitute(ctext=chunk)
+    try:
+        async for piece in astream_gemini(prompt, model, limiter):
+            for item in parser.feed(piece):
+                await emit(item)
+    except Exception as e:
+        raise Exception(f"Extraction stream failed after {parser.items} items: {e}") from e
+    if not parser.complete:
+        raise Exception(f"Extraction output was cut off after {parser.items} items")
+    result = remove_outer_braces(parser.text)
+    if cache is not None and is_cacheable(result):
+        await asyncio.to_thread(cache.put, key, result)
+
+# Function to write whatever the streaming writer has ready, creating constraints/indexes for new labels first
+def flush_writer(writer, driver, final=False):
+    with span("cypher_generation", final=final) as attributes:
+        statements = writer.take(final)
+        attributes["statements"] = len(statements)
+    if not statements:
+        return
+    dump_statements(statements, "a")
+    with span("graph_write", statements=len(statements), rows=sum(len(stmt.rows) for stmt in statements)) as attributes:
+        constraint_manager.ensure(driver, statement_labels(statements))
+        search_index.ensure(driver, statement_labels(statements))
+        result = writer.write(driver, statements)
+        attributes["failed_rows"] = result["failed_rows"]
+    graph_state.record_write(result)
+
+async def aflush_writer(writer, driver, final=False):
+    with span("cypher_generation", final=final) as attributes:
+        statements = writer.take(final)
+        attributes["statements"] = len(statements)
+    if not statements:
+        return
+    await asyncio.to_thread(dump_statements, statements, "a")
+    with span("graph_write", statements=len(statements), rows=sum(len(stmt.rows) for stmt in statements)) as attributes:
+        await constraint_manager.aensure(driver, statement_labels(statements))
+        await search_index.aensure(driver, statement_labels(statements))
+        result = await writer.awrite(driver, statements)
+        attributes["failed_rows"] = result["failed_rows"]
+    graph_state.record_write(result)
 
+# Function to record what an ingestion left in the graph under its source; a document that was only partly
+# extracted or written is recorded as incomplete
+def record_source(writer, version):
+    if writer.result["failed_rows"]:
+        version.complete = False
+    source_registry.record(version, writer.entities, writer.relationships)
+    writer.result["source"] = version.summary(writer.entities, writer.relationships)
 
-# Function to take a json-object of entitites and relationships and generate cypher query for creating those entities
-def generate_cypher(string_json):
-    e_statements = []
-    r_statements = []
-    e_label_map = {}
-    # loop through our json object 
-    # for entity in json_obj["entities"]:
-    json_obj = json.loads(string_json)
-    for key, value in json_obj.items():
-        if key == "entities":
-            for entity in value:
-                label = entity["label"]
-                id = entity["id"]
-                id = id.replace("-", "").replace("_", "")
-                properties = {k: v for k, v in entity.items() if k not in ["label", "id"]}
-                # cypher to add new entities
-                cypher = f'MERGE (n:{label} {{id: "{id}"}})'
-                if properties:
-                    props_str = ", ".join(
-                        [f'n.{key} = "{val}"' for key, val in properties.items()]
-                    )
-                    cypher += f" ON CREATE SET {props_str}"
-                e_statements.append(cypher)
-                e_label_map[id] = label
-        elif key == "relationships":
-            for rs in value:
-                src_id, rs_type, tgt_id = rs.split("|")
-                src_id = src_id.replace("-", "").replace("_", "")
-                tgt_id = tgt_id.replace("-", "").replace("_", "")
-                src_label = e_label_map[src_id]
-                tgt_label = e_label_map[tgt_id]
-                # cypher to add new relations 
-                cypher = f'MERGE (a:{src_label} {{id: "{src_id}"}}) MERGE (b:{tgt_label} {{id: "{tgt_id}"}}) MERGE (a)-[:{rs_type}]->(b)'
-                r_statements.append(cypher)
-
-    with open("latest_update_cypher.txt", "w") as outfile:
-        outfile.write("\n".join(e_statements + r_statements))
-
-    return e_statements + r_statements
-
-# Full pipeline extract-cypher-execute
-def construct_graph(filepath):
-    entities_relationships = extract_entities_relationships(filepath, RELATION_EXTRACTION_TEMPLATE)
-    cypher_statements = generate_cypher(entities_relationships)
-    for i, stmt in enumerate(cypher_statements):
-        print(f"Executing cypher statement {i+1} of {len(cypher_statements)}")
+# Streaming pipeline: chunks are extracted concurrently, and the entities/relationships they stream are written
+# in batches by this thread while generation is still running. Returns the writer's summed write result.
+# With a source `version` (see source_registry.py) the document is diffed against the source's previous version.
+def ingest_chunks(chunks, prompt_template, driver=None, batch_size=WRITE_BATCH_SIZE, model=None, limiter=None, max_workers=EXTRACTION_WORKERS, cache=extraction_cache, on_progress=None, version=None):
+    driver = driver or gds
+    config_key = model_config_key(model or GEMINI)
+    writer = StreamingGraphWriter(batch_size, resolver=entity_resolver, source=version)
+    items = queue.Queue()
+    dump_statements([])
+    failed = []
+
+    def extract_chunk(i, chunk):
         try:
-            gds.execute_query(stmt)
+            stream_chunk(chunk, prompt_template, config_key, items.put, model, limiter, cache)
         except Exception as e:
-            with open("failed_statements.txt", "w") as f:
-                f.write(f"{stmt} - Exception: {e}\n")
-            break
-
-
-# Helper functions to process uploaded URL
-def get_youtube_transcript(youtube_id):
-  try:
-    transcript = YouTubeTranscriptApi.get_transcript(youtube_id)
-    return transcript
-  except Exception as e:
-    message = f"Youtube transcript is not available for youtube Id: {youtube_id}"
-    raise Exception(message)
-  
-def get_documents_from_Wikipedia(wiki_query:str, language:str):
-  try:
-    pages = WikipediaLoader(query=wiki_query.strip(), lang=language, load_max_docs=1, load_all_available_meta=False).load()
-    file_name = wiki_query.strip()
-    return file_name, pages
-  except Exception as e:
-    message = f"Cannot load Wikipedia page."
-    raise Exception(message)
-
-def process_url(url:str=None):
-    def create_youtube_url(url):
-        you_tu_url = "https://www.youtube.com/watch?v="
-        u_pars = urlparse(url)
-        quer_v = parse_qs(u_pars.query).get('v')
-        if quer_v:
-            return  you_tu_url + quer_v[0].strip()
-        pth = u_pars.path.split('/')
-        if pth:
-            return you_tu_url + pth[-1].strip()
-        
+            print(f"Error extracting chunk {i+1} of {len(chunks)}: {e}")
+            failed.append(i)
+        finally:
+            items.put(CHUNK_DONE)
+
+    if on_progress:
+        on_progress("extracting", 0.0)
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i, chunk in enumerate(chunks):
+            submit_in_context(executor, extract_chunk, i, chunk)
+        while done < len(chunks):
+            item = items.get()
+            if item is CHUNK_DONE:
+                done += 1
+                if on_progress:
+                    on_progress("extracting", done / len(chunks))
+                continue
+            writer.add(*item)
+            if writer.ready():
+                flush_writer(writer, driver)
+    if version is not None and failed:
+        version.complete = False
+    if on_progress:
+        on_progress("writing", 0.0)
+    flush_writer(writer, driver, final=True)
+    if version is not None:
+        record_source(writer, version)
+    if on_progress:
+        on_progress("writing", 1.0)
+    return writer.result
+
+# Async streaming pipeline: one task per chunk (at most max_workers streaming at once) feeds a queue
+# that this coroutine drains into batched writes. `chunks` may also be an async iterable (e.g. a live transcript):
+# each chunk is then extracted as it arrives, and an error raised by the source is re-raised once what it
+# produced has been written.
+async def aingest_chunks(chunks, prompt_template, driver=None, batch_size=WRITE_BATCH_SIZE, model=None, limiter=None, max_workers=EXTRACTION_WORKERS, cache=extraction_cache, on_progress=None, version=None):
+    driver = driver or async_gds
+    config_key = model_config_key(model or GEMINI)
+    writer = StreamingGraphWriter(batch_size, resolver=entity_resolver, source=version)
+    items = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max_workers)
+    await asyncio.to_thread(dump_statements, [])
+    streamed = hasattr(chunks, "__aiter__")
+    total = None if streamed else len(chunks)
+    failed = []
+
+    async def extract_chunk(i, chunk):
+        try:
+            async with semaphore:
+                await astream_chunk(chunk, prompt_template, config_key, items.put, model, limiter, cache)
+        except Exception as e:
+            print(f"Error extracting chunk {i+1}: {e}")
+            failed.append(i)
+        finally:
+            await items.put(CHUNK_DONE)
+
+    tasks = []
+
+    async def read_source():
+        nonlocal total
+        try:
+            async for chunk in chunks:
+                tasks.append(asyncio.create_task(extract_chunk(len(tasks), chunk)))
+        finally:
+            total = len(tasks)
+            # put without awaiting: the task is then already done when the end marker is read
+            items.put_nowait(CHUNKS_END)
+
+    if streamed:
+        source = asyncio.create_task(read_source())
+    else:
+        source = None
+        if on_progress:
+            on_progress("extracting", 0.0)
+        tasks = [asyncio.create_task(extract_chunk(i, chunk)) for i, chunk in enumerate(chunks)]
+    done = 0
     try:
-        # For Youtube URL
-        # if re.match('(?:https?:\/\/)?(?:www\.)?youtu\.?be(?:\.com)?\/?.*(?:watch|embed)?(?:.*v=|v\/|\/)([\w\-_]+)\&?', url.strip()):
-        if re.match(r'(?:https?://)?(?:www\.)?youtu\.?be(?:\.com)?/?.*(?:watch|embed)?(?:.*v=|v/|/)([\w\-_]+)\&?', url.strip()):
-          youtube_url = create_youtube_url(url.strip())
-          youtube_id = re.search(r'(?:v=)([0-9A-Za-z_-]{11})\s*',youtube_url)
-          transcript = get_youtube_transcript(youtube_id)
-          return transcript[:1000], f"youtube_{youtube_id}"
-        
-        # For Wiki URL
-        wiki_query_id=''
-        wikipedia_url_regex = r'https?:\/\/(www\.)?([a-zA-Z]{2,3})\.wikipedia\.org\/wiki\/(.*)'        
-        match = re.search(wikipedia_url_regex, url.strip())
-        if match:
-            language = match.group(2)
-            wiki_query_id = match.group(3)
-            pages = WikipediaLoader(query=wiki_query_id.strip(), lang=language, load_max_docs=1, load_all_available_meta=True).load()
-            return pages[0].page_content[:1000], f"wiki_{wiki_query_id.strip()}"
-    except Exception as e:
-      raise Exception(e)
+        while total is None or done < total:
+            item = await items.get()
+            if item is CHUNKS_END:
+                continue
+            if item is CHUNK_DONE:
+                done += 1
+                # a streamed source's share of the work is only known once it has ended
+                if on_progress and total is not None:
+                    on_progress("extracting", done / total)
+                continue
+            writer.add(*item)
+            if writer.ready():
+                await aflush_writer(writer, driver)
+    finally:
+        for task in tasks + ([source] if source else []):
+            task.cancel()
+    source_error = source.exception() if source is not None and not source.cancelled() else None
+    if version is not None and (failed or source_error is not None):
+        version.complete = False
+    if on_progress:
+        on_progress("writing", 0.0)
+    await aflush_writer(writer, driver, final=True)
+    if version is not None:
+        await asyncio.to_thread(record_source, writer, version)
+    if on_progress:
+        on_progress("writing", 1.0)
+    if source_error is not None:
+        raise source_error
+    return writer.result
+
+# Full pipeline extract-cypher-execute over text already in memory; on_progress(stage, fraction) is called as the stages advance.
+# Extraction is streamed, so writes start with the first completed entities rather than after the last chunk.
+def construct_graph_from_text(text, source="text", batch_size=WRITE_BATCH_SIZE, on_progress=None, version=None):
+    start = timer()
+    text = text.rstrip()
+    chunks = split_into_chunks(text)
+    print(f"Split {source} into {len(chunks)} chunks")
+    with span("ingest", chunks=len(chunks), characters=len(text)):
+        result = ingest_chunks(chunks, RELATION_EXTRACTION_TEMPLATE, gds, batch_size, on_progress=on_progress, version=version)
+    print(f"Graph write completed in {timer()-start} seconds: {result}")
+    return result
+
+def construct_graph(filepath, batch_size=WRITE_BATCH_SIZE, on_progress=None):
+    with span("file_read"):
+        text = read_text(filepath)
+    return construct_graph_from_text(text, filepath, batch_size, on_progress)
+
+# Async full pipeline, used by the server so uploads never block the event loop
+async def aconstruct_graph_from_text(text, source="text", batch_size=WRITE_BATCH_SIZE, on_progress=None, version=None):
+    start = timer()
+    text = text.rstrip()
+    chunks = split_into_chunks(text)
+    print(f"Split {source} into {len(chunks)} chunks")
+    with span("ingest", chunks=len(chunks), characters=len(text)):
+        result = await aingest_chunks(chunks, RELATION_EXTRACTION_TEMPLATE, async_gds, batch_size, on_progress=on_progress, version=version)
+    print(f"Graph write completed in {timer()-start} seconds: {result}")
+    return result
+
+async def aconstruct_graph(filepath, batch_size=WRITE_BATCH_SIZE, on_progress=None):
+    with span("file_read"):
+        text = await asyncio.to_thread(read_text, filepath)
+    return await aconstruct_graph_from_text(text, filepath, batch_size, on_progress)
+
+# Async full pipeline over chunks that arrive over time (e.g. an audio transcript): extraction and writes start
+# with the first chunk instead of after the whole source has been read
+async def aconstruct_graph_from_chunks(chunks, batch_size=WRITE_BATCH_SIZE, on_progress=None, version=None):
+    start = timer()
+    with span("ingest", chunks=0, characters=0) as attributes:
+        async def counted():
+            async for chunk in chunks:
+                attributes["chunks"] += 1
+                attributes["characters"] += len(chunk)
+                yield chunk
+
+        result = await aingest_chunks(counted(), RELATION_EXTRACTION_TEMPLATE, async_gds, batch_size, on_progress=on_progress, version=version)
+    print(f"Graph write completed in {timer()-start} seconds: {result}")
+    return result
+
+# Function to take a source out of the graph: its id comes off everything it put there, and entities and
+# relationships no other source mentions are deleted. Returns the write result, None for an unknown source.
+async def aremove_source(source_id, batch_size=WRITE_BATCH_SIZE):
+    record = await asyncio.to_thread(source_registry.get, source_id)
+    if record is None:
+        return None
+    statements = build_removal_statements(source_id, {tuple(key) for key in record["entities"]}, {tuple(key) for key in record["relationships"]}, batch_size)
+    with span("graph_write", statements=len(statements), rows=sum(len(stmt.rows) for stmt in statements)) as attributes:
+        result = await awrite_statements(async_gds, statements)
+        attributes["failed_rows"] = result["failed_rows"]
+    graph_state.record_write(result)
+    # rows that failed keep the source in the registry, so that deleting it again retries them
+    if not result["failed_rows"]:
+        await asyncio.to_thread(source_registry.delete, source_id)
+    print(f"Removed source {source_id}: {result['counters']}")
+    return result
+
 
 # Function to query the number of nodes and relations
 def get_info():
-    with gds.session() as session:
-        result = session.run("MATCH (n) RETURN count(n)")
-        node_count = result.single()[0]
-    with gds.session() as session:
-        result = session.run("MATCH ()-[r]->() RETURN count(r)")
-        relation_count = result.single()[0]
+    with span("graph_info"):
+        with gds.session() as session:
+            result = session.run("MATCH (n) RETURN count(n)")
+            node_count = result.single()[0]
+        with gds.session() as session:
+            result = session.run("MATCH ()-[r]->() RETURN count(r)")
+            relation_count = result.single()[0]
+    return node_count, relation_count
+
+async def aget_info():
+    with span("graph_info"):
+        async with async_gds.session() as session:
+            result = await session.run("MATCH (n) RETURN count(n)")
+            node_count = (await result.single())[0]
+            result = await session.run("MATCH ()-[r]->() RETURN count(r)")
+            relation_count = (await result.single())[0]
     return node_count, relation_count
@@ -1,15 +1,29 @@
-from langchain_community.graphs import Neo4jGraph
 from langchain.chains import GraphCypherQAChain
+from langchain_community.chains.graph_qa.cypher import extract_cypher
 from langchain_google_genai import (
     ChatGoogleGenerativeAI,
     HarmBlockThreshold,
     HarmCategory,
 )
 from prompts import cypher_prompt, qa_prompt
+from rate_limiter import RateLimiter, estimate_tokens
+from graph_state import graph_state
+from qa_cache import TTLCache, normalize_question
+from entity_search import rewrite_fuzzy_predicates
+from intent_router import intent_router, route_info
+from graph_store import create_qa_graph
+from metrics import observe_stage, record_llm_call, QA_CACHE
 import dotenv
 import os
+import asyncio
+import threading
+from time import time
+from timeit import default_timer as timer
 dotenv.load_dotenv()
 
+# Batch QA configuration: questions of one batch answered at the same time
+QA_BATCH_CONCURRENCY = int(os.getenv("QA_BATCH_CONCURRENCY", "8"))
+
 # Google Gemini configuration
 llm = ChatGoogleGenerativeAI(
     model="gemini-1.5-flash",
@@ -24,16 +38,15 @@ llm = ChatGoogleGenerativeAI(
     temperature=0
 )
 
-# Neo4j configuration
-neo4j_url = os.getenv("NEO4J_URI")
-neo4j_user = os.getenv("NEO4J_USERNAME")
-neo4j_password = os.getenv("NEO4J_PASSWORD")
-graph = Neo4jGraph(url=neo4j_url, username=neo4j_user, password=neo4j_password)
+# QA calls share the Gemini quota, so they are throttled the same way as extraction
+qa_limiter = RateLimiter(name="qa")
 
-# LangChain QA on knowledge graph
-def qa_on_graph(user_input):
-    # graph = Neo4jGraph(url=neo4j_url, username=neo4j_user, password=neo4j_password)
-    chain = GraphCypherQAChain.from_llm(
+# Graph store for the QA chain (Neo4jGraph or the embedded graph). It is created, and the schema introspected,
+# on first use; afterwards the schema is only refreshed when SchemaSnapshot sees new labels or relationship types
+graph = create_qa_graph()
+
+def build_chain():
+    return GraphCypherQAChain.from_llm(
         llm=llm,
         graph=graph,
         verbose=True,
@@ -42,6 +55,299 @@ def qa_on_graph(user_input):
         qa_prompt=qa_prompt,
         validate_cypher=True
         )
-    result = chain.invoke(user_input)
+
+class SchemaSnapshot:
+    """The QA chain together with the graph schema it was built from.
+    Rebuilt only when ingestion has written a label or relationship pattern the snapshot does not know."""
+
+    def __init__(self):
+        self.chain = None
+        self.taken_at = None
+        self.graph_version = None
+        self.schema_version = None
+        self.lock = threading.Lock()
+
+    def is_stale(self):
+        return self.chain is None or self.schema_version != graph_state.schema_version
+
+    def refresh(self, introspect=True):
+        schema_version = graph_state.schema_version
+        if introspect:
+            graph.refresh_schema()
+        structured = graph.get_structured_schema
+        labels = set(structured.get("node_props", {}))
+        patterns = {(rel["start"], rel["type"], rel["end"]) for rel in structured.get("relationships", [])}
+        graph_state.seed_schema(labels, patterns)
+        self.chain = build_chain()
+        self.taken_at = time()
+        self.graph_version = graph_state.version
+        self.schema_version = schema_version
+        print(f"Schema snapshot refreshed at graph version {self.graph_version}")
+
+    def get(self):
+        """The current (chain, schema version), refreshed first if stale."""
+        with self.lock:
+            if self.is_stale():
+                # the graph store introspects the schema when it is created
+                self.refresh(introspect=self.chain is not None)
+            return self.chain, self.schema_version
+
+    def get_chain(self):
+        return self.get()[0]
+
+    def info(self):
+        return {
+            "schema": graph.schema,
+            "taken_at": self.taken_at,
+            "age_seconds": round(time() - self.taken_at, 3) if self.taken_at else None,
+            "snapshot_graph_version": self.graph_version,
+            "stale": self.is_stale(),
+            **graph_state.info(),
+        }
+
+schema_snapshot = SchemaSnapshot()
+
+# Two-level QA cache: the normalized question maps to its generated Cypher (valid for one schema version),
+# and (Cypher, graph version) maps to the database context plus the answers already phrased from it
+cypher_cache = TTLCache()
+result_cache = TTLCache()
+
+def on_graph_write(version, write_result):
+    result_cache.clear()
+
+graph_state.add_listener(on_graph_write)
+
+def chain_output(result, runnable):
+    return result[runnable.output_key] if isinstance(result, dict) else result
+
+def finalize_cypher(chain, generated):
+    # Extract Cypher code if it is wrapped in backticks, then validate it against the schema
+    cypher = extract_cypher(generated)
+    if chain.cypher_query_corrector:
+        cypher = chain.cypher_query_corrector(cypher)
+    return cypher
+
+# Entity lookups in the generated Cypher are routed through the full-text index before running it
+def query_graph(chain, cypher):
+    if not cypher:
+        return cypher, []
+    cypher = rewrite_fuzzy_predicates(cypher, graph.query)
+    return cypher, graph.query(cypher)[: chain.top_k]
+
+# Cache a stage's result is served from, and the LLM call a miss costs
+QA_STAGES = {
+    "routing": (None, None),
+    "cypher_generation": ("cypher", "qa_cypher"),
+    "graph_query": ("result", None),
+    "answer": ("answer", "qa_answer"),
+    "template_answer": (None, None),
+}
+
+# Function to export the stage timings, cache hits and (estimated) LLM usage of one answered question
+def record_qa(question, cypher, context, answer, cache, timings):
+    for stage, seconds in timings.items():
+        cache_name, purpose = QA_STAGES[stage]
+        hit = cache[cache_name] if cache_name else False
+        if cache_name:
+            QA_CACHE.inc(stage=cache_name, result="hit" if hit else "miss")
+        observe_stage(f"qa_{stage}", seconds, cache_hit=hit)
+        if purpose and not hit:
+            completion = cypher if purpose == "qa_cypher" else answer
+            prompt_tokens = estimate_tokens(question + (str(context) if purpose == "qa_answer" else graph.schema))
+            record_llm_call(purpose, seconds, prompt_tokens, estimate_tokens(str(completion or "")))
+
+def qa_response(question, cypher, context, answer, cache, timings, route):
+    return {
+        "query": question,
+        "result": answer,
+        "intermediate_steps": [{"query": cypher, **({"params": route.params} if route.params else {})}, {"context": context}],
+        "cache": cache,
+        "timings": {stage: round(seconds, 4) for stage, seconds in timings.items()},
+        "route": route_info(route),
+    }
+
+# Function to answer a question the intent router matched: its template query is run and the rows are phrased
+# locally, so neither the Cypher generation nor the answer costs an LLM call
+def templated_qa(user_input, route, timings):
+    start = timer()
+    context = graph.query(route.cypher, route.params)
+    timings["graph_query"] = timer() - start
+    start = timer()
+    answer = route.intent.answer(context)
+    timings["template_answer"] = timer() - start
+    cache = {"cypher": False, "result": False, "answer": False}
+    record_qa(user_input, route.cypher, context, answer, cache, timings)
+    intent_router.log(user_input, route)
+    return qa_response(user_input, route.cypher, context, answer, cache, timings, route)
+
+# LangChain QA on knowledge graph, run stage by stage so each stage can be served from cache
+def qa_on_graph(user_input):
+    # graph = Neo4jGraph(url=neo4j_url, username=neo4j_user, password=neo4j_password)
+    chain = schema_snapshot.get_chain()
+    question = normalize_question(user_input)
+    timings = {}
+
+    start = timer()
+    route = intent_router.route(user_input, graph.query)
+    timings["routing"] = timer() - start
+    if route.intent is not None:
+        result = templated_qa(user_input, route, timings)
+        print(result)
+        return result
+
+    start = timer()
+    question_key = (question, schema_snapshot.schema_version)
+    cypher = cypher_cache.get(question_key)
+    cypher_hit = cypher is not None
+    if not cypher_hit:
+        qa_limiter.acquire(estimate_tokens(user_input))
+        generated = chain.cypher_generation_chain.invoke({"question": user_input, "schema": chain.graph_schema})
+        cypher = finalize_cypher(chain, chain_output(generated, chain.cypher_generation_chain))
+        cypher_cache.put(question_key, cypher)
+    timings["cypher_generation"] = timer() - start
+    intent_router.log(user_input, route, cypher)
+
+    start = timer()
+    result_key = (cypher, graph_state.version)
+    entry = result_cache.get(result_key)
+    result_hit = entry is not None
+    if not result_hit:
+        executed, context = query_graph(chain, cypher)
+        entry = {"cypher": executed, "context": context, "answers": {}}
+        result_cache.put(result_key, entry)
+    timings["graph_query"] = timer() - start
+
+    start = timer()
+    answer = entry["answers"].get(question)
+    answer_hit = answer is not None
+    if not answer_hit:
+        qa_limiter.acquire(estimate_tokens(str(entry["context"])))
+        answered = chain.qa_chain.invoke({"question": user_input, "context": entry["context"]})
+        answer = entry["answers"][question] = chain_output(answered, chain.qa_chain)
+    timings["answer"] = timer() - start
+
+    cache = {"cypher": cypher_hit, "result": result_hit, "answer": answer_hit}
+    record_qa(user_input, cypher, entry["context"], answer, cache, timings)
+    result = qa_response(user_input, entry["cypher"], entry["context"], answer, cache, timings, route)
     print(result)
-    return result
\ No newline at end of file
+    return result
+
+# Streaming QA used by the server: yields (event, data) pairs as soon as each stage has output -
+# "cypher", then "context", then one "token" per answer chunk from the LLM, then "done" with the full result.
+# A full cache miss costs two LLM calls (Cypher generation and answer); a question matching a template none.
+# `snapshot` is a (chain, schema version) pair from SchemaSnapshot.get, by default the current one.
+async def astream_qa_on_graph(user_input, snapshot=None):
+    if snapshot is None:
+        snapshot = (schema_snapshot.chain, schema_snapshot.schema_version) if not schema_snapshot.is_stale() else await asyncio.to_thread(schema_snapshot.get)
+    chain, schema_version = snapshot
+    question = normalize_question(user_input)
+    timings = {}
+
+    start = timer()
+    route = await asyncio.to_thread(intent_router.route, user_input, graph.query)
+    timings["routing"] = timer() - start
+    if route.intent is not None:
+        result = await asyncio.to_thread(templated_qa, user_input, route, timings)
+        yield "cypher", {"query": route.cypher, "params": route.params}
+        yield "context", {"query": route.cypher, "params": route.params, "context": result["intermediate_steps"][1]["context"]}
+        yield "token", result["result"]
+        print(result)
+        yield "done", result
+        return
+
+    start = timer()
+    question_key = (question, schema_version)
+    cypher = cypher_cache.get(question_key)
+    cypher_hit = cypher is not None
+    if not cypher_hit:
+        await qa_limiter.acquire_async(estimate_tokens(user_input))
+        generated = await chain.cypher_generation_chain.ainvoke({"question": user_input, "schema": chain.graph_schema})
+        cypher = finalize_cypher(chain, chain_output(generated, chain.cypher_generation_chain))
+        cypher_cache.put(question_key, cypher)
+    timings["cypher_generation"] = timer() - start
+    # the log is a file append, kept off the event loop
+    await asyncio.to_thread(intent_router.log, user_input, route, cypher)
+    yield "cypher", {"query": cypher}
+
+    start = timer()
+    result_key = (cypher, graph_state.version)
+    entry = result_cache.get(result_key)
+    result_hit = entry is not None
+    if not result_hit:
+        executed, context = await asyncio.to_thread(query_graph, chain, cypher)
+        entry = {"cypher": executed, "context": context, "answers": {}}
+        result_cache.put(result_key, entry)
+    timings["graph_query"] = timer() - start
+    # the executed query can differ from the generated one once fuzzy lookups are resolved
+    yield "context", {"query": entry["cypher"], "context": entry["context"]}
+
+    start = timer()
+    answer = entry["answers"].get(question)
+    answer_hit = answer is not None
+    if not answer_hit:
+        await qa_limiter.acquire_async(estimate_tokens(str(entry["context"])))
+        parts = []
+        async for chunk in llm.astream(qa_prompt.format(question=user_input, context=entry["context"])):
+            text = getattr(chunk, "content", chunk)
+            if text:
+                parts.append(text)
+                yield "token", text
+        answer = entry["answers"][question] = "".join(parts)
+    timings["answer"] = timer() - start
+    if answer_hit:
+        yield "token", answer
+
+    cache = {"cypher": cypher_hit, "result": result_hit, "answer": answer_hit}
+    record_qa(user_input, cypher, entry["context"], answer, cache, timings)
+    result = qa_response(user_input, entry["cypher"], entry["context"], answer, cache, timings, route)
+    print(result)
+    yield "done", result
+
+# Async QA returning only the final result
+async def aqa_on_graph(user_input, snapshot=None):
+    async for event, data in astream_qa_on_graph(user_input, snapshot):
+        if event == "done":
+            return data
+
+async def abatch_qa_on_graph(questions, concurrency=QA_BATCH_CONCURRENCY):
+    """Answer many questions against one schema snapshot, `concurrency` at a time, yielding one entry per
+    distinct (normalized) question as soon as it is answered - `indexes` are its positions in `questions` - and
+    finally a summary. A failed question is reported in its entry and does not stop the others."""
+    start = timer()
+    groups = {}
+    for i, user_input in enumerate(questions):
+        groups.setdefault(normalize_question(user_input), []).append(i)
+    snapshot = await asyncio.to_thread(schema_snapshot.get)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(question, indexes):
+        queued = timer()
+        async with semaphore:
+            started = timer()
+            entry = {"indexes": indexes, "question": questions[indexes[0]], "status": "ok", "wait_seconds": round(started - queued, 4)}
+            try:
+                if not question:
+                    raise ValueError("Empty question.")
+                entry["result"] = await aqa_on_graph(questions[indexes[0]], snapshot)
+            except Exception as e:
+                print(f"Error answering {questions[indexes[0]]!r}: {e}")
+                entry["status"] = "error"
+                entry["error"] = str(e)
+            entry["seconds"] = round(timer() - started, 4)
+            return entry
+
+    tasks = [asyncio.create_task(answer(question, indexes)) for question, indexes in groups.items()]
+    failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            entry = await next_done
+            failed += entry["status"] == "error"
+            yield entry
+    finally:
+        # the consumer went away (e.g. the client disconnected): stop the questions still running
+        for task in tasks:
+            task.cancel()
+    yield {"summary": {"questions": len(questions), "distinct": len(groups), "failed": failed, "seconds": round(timer() - start, 4)}}
+
+def qa_cache_info():
+    return {"cypher": cypher_cache.info(), "result": result_cache.info()}
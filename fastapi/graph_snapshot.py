@@ -0,0 +1,215 @@
+import os
+import json
+import uuid
+import shutil
+import threading
+from array import array
+from time import time
+import numpy as np
+from graph_state import graph_state
+from metrics import span
+
+# Graph snapshot configuration: the graph is exported to GRAPH_SNAPSHOT_DIR, streamed from the database in
+# pages of GRAPH_SNAPSHOT_PAGE_SIZE records
+GRAPH_SNAPSHOT_DIR = os.getenv("GRAPH_SNAPSHOT_DIR", "./cache/graph_snapshot")
+GRAPH_SNAPSHOT_PAGE_SIZE = int(os.getenv("GRAPH_SNAPSHOT_PAGE_SIZE", "10000"))
+
+SNAPSHOT_FORMAT = 1
+# The snapshot readers open, by directory name
+CURRENT_FILE = "CURRENT"
+
+NODES_QUERY = "MATCH (n) RETURN id(n) AS key, labels(n) AS labels, n.id AS id"
+RELATIONSHIPS_QUERY = "MATCH (a)-[r]->(b) RETURN id(a) AS source, id(b) AS target, type(r) AS type"
+
+# Columns of a snapshot directory, besides manifest.json:
+#   node_labels       int16  label code of each node (first label, -1 for none)
+#   node_id_offsets   int64  node i's id is node_id_bytes[node_id_offsets[i]:node_id_offsets[i+1]] (UTF-8)
+#   out_offsets       int64  CSR of outgoing relationships: node i's are out_targets/out_types[out_offsets[i]:out_offsets[i+1]]
+#   in_offsets        int64  CSR of incoming relationships, over in_sources
+ARRAYS = ["node_labels", "node_id_offsets", "node_id_bytes", "out_offsets", "out_targets", "out_types", "in_offsets", "in_sources"]
+
+_export_lock = threading.Lock()
+
+
+class SnapshotMissingError(Exception):
+    pass
+
+
+# Function to turn row numbers grouped by `rows` into CSR offsets and the order that sorts the edges by row
+def csr(rows, node_count):
+    offsets = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=node_count), out=offsets[1:])
+    return offsets, np.argsort(rows, kind="stable")
+
+
+def current_snapshot(directory=GRAPH_SNAPSHOT_DIR):
+    """Path of the snapshot readers should open, None before the first export."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(directory, name) if name else None
+
+
+def export_snapshot(driver, directory=GRAPH_SNAPSHOT_DIR, page_size=GRAPH_SNAPSHOT_PAGE_SIZE):
+    """Stream the nodes and relationships out of the database into a new snapshot under `directory` and make it
+    the current one; readers of the previous snapshot keep their arrays. Returns the manifest.
+
+    Nodes are numbered in the order they are read; relationships whose ends were created after the node scan
+    are left out (counted as `skipped_relationships`)."""
+    with _export_lock, span("snapshot_export") as attributes:
+        start = time()
+        graph_version = graph_state.version
+        keys, node_labels, node_id_offsets, node_id_bytes = array("q"), array("h"), array("q", [0]), bytearray()
+        sources, targets, types = array("q"), array("q"), array("h")
+        label_codes, type_codes = {}, {}
+        with driver.session(fetch_size=page_size) as session:
+            for record in session.run(NODES_QUERY):
+                keys.append(record["key"])
+                labels = record["labels"]
+                node_labels.append(label_codes.setdefault(labels[0], len(label_codes)) if labels else -1)
+                node_id_bytes += ("" if record["id"] is None else str(record["id"])).encode("utf-8")
+                node_id_offsets.append(len(node_id_bytes))
+            for record in session.run(RELATIONSHIPS_QUERY):
+                sources.append(record["source"])
+                targets.append(record["target"])
+                types.append(type_codes.setdefault(record["type"], len(type_codes)))
+
+        # database ids to node numbers, through a sorted copy of the ids (-1 for nodes missing from the scan)
+        node_count = len(keys)
+        keys = np.frombuffer(keys, dtype=np.int64)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+
+        def node_numbers(ids):
+            ids = np.frombuffer(ids, dtype=np.int64)
+            if not node_count:
+                return np.full(len(ids), -1, dtype=np.int64)
+            positions = np.minimum(np.searchsorted(sorted_keys, ids), node_count - 1)
+            return np.where(sorted_keys[positions] == ids, order[positions], -1)
+
+        sources, targets = node_numbers(sources), node_numbers(targets)
+        types = np.frombuffer(types, dtype=np.int16)
+        found = (sources >= 0) & (targets >= 0)
+        skipped = int(len(found) - found.sum())
+        sources, targets, types = sources[found], targets[found], types[found]
+        out_offsets, out_order = csr(sources, node_count)
+        in_offsets, in_order = csr(targets, node_count)
+        columns = {
+            "node_labels": np.frombuffer(node_labels, dtype=np.int16),
+            "node_id_offsets": np.frombuffer(node_id_offsets, dtype=np.int64),
+            "node_id_bytes": np.frombuffer(bytes(node_id_bytes), dtype=np.uint8),
+            "out_offsets": out_offsets,
+            "out_targets": targets[out_order].astype(np.int32),
+            "out_types": types[out_order],
+            "in_offsets": in_offsets,
+            "in_sources": sources[in_order].astype(np.int32),
+        }
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "nodes": node_count,
+            "relationships": len(sources),
+            "skipped_relationships": skipped,
+            "labels": list(label_codes),
+            "types": list(type_codes),
+            "graph_version": graph_version,
+            "exported_at": time(),
+        }
+
+        # written next to the current snapshot, then switched to by replacing the CURRENT file
+        name = f"snapshot-{int(start)}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(directory, name)
+        os.makedirs(path)
+        for column, values in columns.items():
+            np.save(os.path.join(path, f"{column}.npy"), values)
+        manifest["bytes"] = sum(os.path.getsize(os.path.join(path, f"{column}.npy")) for column in columns)
+        manifest["seconds"] = round(time() - start, 3)
+        with open(os.path.join(path, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        pointer = os.path.join(directory, f".{CURRENT_FILE}-{name}")
+        with open(pointer, "w") as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+        # arrays already memory-mapped from the old snapshots stay readable after their files are removed
+        for entry in os.listdir(directory):
+            if entry.startswith("snapshot-") and entry != name:
+                shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+        attributes.update(nodes=manifest["nodes"], relationships=manifest["relationships"])
+    print(f"Exported graph snapshot {name}: {manifest['nodes']} nodes, {manifest['relationships']} relationships in {manifest['seconds']}s")
+    return manifest
+
+
+class GraphSnapshot:
+    """A snapshot opened from disk. Its arrays are memory-mapped: opening is cheap, and only the pages an
+    analysis touches are read."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != SNAPSHOT_FORMAT:
+            raise SnapshotMissingError(f"Graph snapshot {self.name} has an unsupported format.")
+        for column in ARRAYS:
+            setattr(self, column, np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r"))
+        self.labels = self.manifest["labels"]
+        self.types = self.manifest["types"]
+        self.node_count = self.manifest["nodes"]
+        self.relationship_count = self.manifest["relationships"]
+        self._ids = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, directory=GRAPH_SNAPSHOT_DIR):
+        path = current_snapshot(directory)
+        if path is None:
+            raise SnapshotMissingError("No graph snapshot has been exported yet (POST /snapshot).")
+        return cls(path)
+
+    def node_id(self, node):
+        return bytes(self.node_id_bytes[self.node_id_offsets[node]:self.node_id_offsets[node + 1]]).decode("utf-8")
+
+    def node(self, node):
+        code = int(self.node_labels[node])
+        return {"id": self.node_id(node), "label": self.labels[code] if code >= 0 else None}
+
+    def label_code(self, label):
+        if label not in self.labels:
+            raise ValueError(f"Unknown label {label!r}, expected one of {', '.join(self.labels)}")
+        return self.labels.index(label)
+
+    # Nodes with `label` (all nodes for None), as a boolean mask
+    def label_mask(self, label=None):
+        if label is None:
+            return np.ones(self.node_count, dtype=bool)
+        return np.asarray(self.node_labels) == self.label_code(label)
+
+    def find(self, entity_id, label=None):
+        """Node numbers with this id (and label); the id lookup is built on first use."""
+        with self._lock:
+            if self._ids is None:
+                data, offsets = bytes(self.node_id_bytes), self.node_id_offsets
+                ids = {}
+                for node in range(self.node_count):
+                    ids.setdefault(data[offsets[node]:offsets[node + 1]].decode("utf-8"), []).append(node)
+                self._ids = ids
+        nodes = self._ids.get(entity_id, [])
+        if label is not None:
+            code = self.label_code(label)
+            nodes = [node for node in nodes if self.node_labels[node] == code]
+        return nodes
+
+    # Source and target of every relationship, as parallel arrays in CSR order
+    def edges(self):
+        sources = np.repeat(np.arange(self.node_count, dtype=np.int32), np.diff(self.out_offsets))
+        return sources, np.asarray(self.out_targets)
+
+    def info(self):
+        return {
+            "name": self.name,
+            **{key: self.manifest[key] for key in ["nodes", "relationships", "skipped_relationships", "graph_version", "exported_at", "bytes", "seconds"]},
+            "age_seconds": round(time() - self.manifest["exported_at"], 3),
+            # the graph changed since the export (graph versions count the writes of this process only)
+            "stale": graph_state.version != self.manifest["graph_version"],
+        }
@@ -0,0 +1,59 @@
+import threading
+from time import time
+
+
+class GraphState:
+    """Process-wide record of graph changes made through the ingestion pipeline.
+
+    `version` increases on every write that changed the graph; caches keyed on it are invalidated by ingestion.
+    `schema_version` increases only when a write introduces a label or relationship pattern not seen before,
+    which is the only time the QA schema snapshot needs to be rebuilt."""
+
+    def __init__(self):
+        self.version = 0
+        self.schema_version = 0
+        self.updated_at = time()
+        self.labels = set()
+        self.patterns = set()
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    # Register labels/patterns already present in the database (e.g. from a schema introspection)
+    def seed_schema(self, labels, patterns):
+        with self.lock:
+            self.labels.update(labels)
+            self.patterns.update(tuple(pattern) for pattern in patterns)
+
+    def record_write(self, result):
+        counters = result["counters"]
+        if not any(counters.values()):
+            return False
+        labels = {label for label, created in result["nodes_by_label"].items() if created > 0}
+        patterns = {tuple(key.split("|")) for key, created in result["relationships_by_pattern"].items() if created > 0}
+        with self.lock:
+            self.version += 1
+            self.updated_at = time()
+            new_labels = labels - self.labels
+            new_patterns = patterns - self.patterns
+            if new_labels or new_patterns:
+                self.schema_version += 1
+                self.labels.update(new_labels)
+                self.patterns.update(new_patterns)
+            version = self.version
+        for listener in list(self.listeners):
+            listener(version, result)
+        return True
+
+    def add_listener(self, listener):
+        """`listener(version, write_result)` is called after every write that changed the graph."""
+        self.listeners.append(listener)
+
+    def info(self):
+        return {
+            "graph_version": self.version,
+            "schema_version": self.schema_version,
+            "updated_at": self.updated_at,
+        }
+
+
+graph_state = GraphState()
@@ -0,0 +1,105 @@
+import os
+import uuid
+import threading
+from time import time
+from graph_state import graph_state
+from graph_writer import quote_name, valid_name
+from metrics import span
+
+# Interval between reconciliations of the in-memory counts with the database
+STATS_RECONCILE_SECONDS = float(os.getenv("STATS_RECONCILE_SECONDS", "300"))
+
+LABELS_QUERY = "CALL db.labels() YIELD label RETURN label"
+TYPES_QUERY = "CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType"
+NODE_COUNT_QUERY = "MATCH (n) RETURN count(n)"
+RELATIONSHIP_COUNT_QUERY = "MATCH ()-[r]->() RETURN count(r)"
+
+
+def label_count_query(label):
+    return f"MATCH (n:{quote_name(label)}) RETURN count(n)"
+
+
+def type_count_query(rs_type):
+    return f"MATCH ()-[r:{quote_name(rs_type)}]->() RETURN count(r)"
+
+
+class GraphStats:
+    """Node and relationship counts, per label and per type, kept up to date from the write counters of
+    each ingestion batch and periodically reconciled with the database (all queries hit the count store)."""
+
+    def __init__(self):
+        self.node_total = 0
+        self.relationship_total = 0
+        self.nodes_by_label = {}
+        self.relationships_by_type = {}
+        self.version = 0
+        # distinguishes versions of this process from those of a previous run
+        self.epoch = uuid.uuid4().hex[:8]
+        self.reconciled_at = None
+        self.lock = threading.Lock()
+
+    def apply(self, write_result):
+        counters = write_result["counters"]
+        with self.lock:
+            self.node_total += counters["nodes_created"] - counters["nodes_deleted"]
+            self.relationship_total += counters["relationships_created"] - counters["relationships_deleted"]
+            for label, created in write_result["nodes_by_label"].items():
+                self.nodes_by_label[label] = self.nodes_by_label.get(label, 0) + created
+            for pattern, created in write_result["relationships_by_pattern"].items():
+                rs_type = pattern.split("|")[1]
+                self.relationships_by_type[rs_type] = self.relationships_by_type.get(rs_type, 0) + created
+            self.version += 1
+
+    def _replace(self, node_total, relationship_total, nodes_by_label, relationships_by_type):
+        with self.lock:
+            changed = (node_total, relationship_total, nodes_by_label, relationships_by_type) != (
+                self.node_total, self.relationship_total, self.nodes_by_label, self.relationships_by_type)
+            self.node_total = node_total
+            self.relationship_total = relationship_total
+            self.nodes_by_label = nodes_by_label
+            self.relationships_by_type = relationships_by_type
+            self.reconciled_at = time()
+            if changed:
+                self.version += 1
+
+    def reconcile(self, driver):
+        with span("count_refresh"), driver.session() as session:
+            labels = [record[0] for record in session.run(LABELS_QUERY) if valid_name(record[0])]
+            types = [record[0] for record in session.run(TYPES_QUERY) if valid_name(record[0])]
+            nodes_by_label = {label: session.run(label_count_query(label)).single()[0] for label in labels}
+            relationships_by_type = {rs_type: session.run(type_count_query(rs_type)).single()[0] for rs_type in types}
+            node_total = session.run(NODE_COUNT_QUERY).single()[0]
+            relationship_total = session.run(RELATIONSHIP_COUNT_QUERY).single()[0]
+        self._replace(node_total, relationship_total, nodes_by_label, relationships_by_type)
+
+    async def areconcile(self, driver):
+        with span("count_refresh"):
+            async with driver.session() as session:
+                labels = [record[0] async for record in await session.run(LABELS_QUERY) if valid_name(record[0])]
+                types = [record[0] async for record in await session.run(TYPES_QUERY) if valid_name(record[0])]
+                nodes_by_label = {}
+                for label in labels:
+                    nodes_by_label[label] = (await (await session.run(label_count_query(label))).single())[0]
+                relationships_by_type = {}
+                for rs_type in types:
+                    relationships_by_type[rs_type] = (await (await session.run(type_count_query(rs_type))).single())[0]
+                node_total = (await (await session.run(NODE_COUNT_QUERY)).single())[0]
+                relationship_total = (await (await session.run(RELATIONSHIP_COUNT_QUERY)).single())[0]
+            self._replace(node_total, relationship_total, nodes_by_label, relationships_by_type)
+
+    def etag(self):
+        return f'"{self.epoch}-{self.version}"'
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "num_entity": self.node_total,
+                "num_relation": self.relationship_total,
+                "nodes_by_label": dict(self.nodes_by_label),
+                "relationships_by_type": dict(self.relationships_by_type),
+                "reconciled_at": self.reconciled_at,
+            }
+
+
+graph_stats = GraphStats()
+graph_state.add_listener(lambda version, write_result: graph_stats.apply(write_result))
@@ -0,0 +1,329 @@
+import os
+import hashlib
+import threading
+from dotenv import load_dotenv
+from neo4j import GraphDatabase, AsyncGraphDatabase
+from langchain_community.graphs import Neo4jGraph
+from langchain_community.graphs.graph_store import GraphStore
+from graph_writer import COUNTER_FIELDS, entity_row, valid_name, build_statements, write_statements
+from graph_state import graph_state
+from constraints import constraint_manager, statement_labels
+from entity_search import search_index
+from memory_graph import MemoryGraph
+
+load_dotenv()
+
+# Graph backend: "neo4j" (default) or "memory" for the embedded in-process graph
+GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "neo4j").lower()
+
+# Neo4j configuration
+neo4j_url = os.getenv("NEO4J_URI")
+neo4j_user = os.getenv("NEO4J_USERNAME")
+neo4j_password = os.getenv("NEO4J_PASSWORD")
+# One async pool shared by all concurrent uploads and queries
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "30"))
+
+_memory_graph = None
+_memory_lock = threading.Lock()
+
+
+# The process-wide embedded graph, shared by the drivers and the QA graph store
+def memory_graph():
+    global _memory_graph
+    with _memory_lock:
+        if _memory_graph is None:
+            _memory_graph = MemoryGraph()
+        return _memory_graph
+
+
+### neo4j driver interface over the embedded graph ###
+
+class MemoryRecord(dict):
+    """Record with both key and positional access, like neo4j.Record."""
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return dict.__getitem__(self, key)
+
+    def data(self):
+        return dict(self)
+
+
+class MemoryCounters:
+    def __init__(self, counters):
+        for field in COUNTER_FIELDS:
+            setattr(self, field, counters.get(field, 0))
+        self.contains_updates = any(counters.values())
+
+
+class MemorySummary:
+    def __init__(self, query, counters):
+        self.query = query
+        self.counters = MemoryCounters(counters)
+
+
+class MemoryResult:
+    def __init__(self, graph, query, params):
+        columns, rows, counters = graph.run(query, params)
+        self._keys = columns
+        self.records = [MemoryRecord((column, row[column]) for column in columns) for row in rows]
+        self.summary = MemorySummary(query, counters)
+
+    def keys(self):
+        return self._keys
+
+    def single(self):
+        return self.records[0] if self.records else None
+
+    def data(self):
+        return [record.data() for record in self.records]
+
+    def consume(self):
+        return self.summary
+
+    def __iter__(self):
+        return iter(self.records)
+
+
+class MemorySession:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, parameters=None, **kwargs):
+        return MemoryResult(self.graph, query, {**(parameters or {}), **kwargs})
+
+    # Every query already runs atomically, so the session doubles as the transaction
+    def execute_write(self, work, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+    execute_read = execute_write
+
+    def close(self):
+        pass
+
+
+class MemoryDriver:
+    """The subset of neo4j.Driver the application uses, backed by a MemoryGraph."""
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def session(self, **kwargs):
+        return MemorySession(self.graph)
+
+    def execute_query(self, query, parameters=None, **kwargs):
+        result = MemoryResult(self.graph, query, {**(parameters or {}), **kwargs})
+        return result.records, result.summary, result.keys()
+
+    def verify_connectivity(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class AsyncMemoryResult(MemoryResult):
+    async def __aiter__(self):
+        for record in self.records:
+            yield record
+
+    async def single(self):
+        return self.records[0] if self.records else None
+
+    async def data(self):
+        return [record.data() for record in self.records]
+
+    async def consume(self):
+        return self.summary
+
+
+class AsyncMemorySession(MemorySession):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def run(self, query, parameters=None, **kwargs):
+        return AsyncMemoryResult(self.graph, query, {**(parameters or {}), **kwargs})
+
+    async def execute_write(self, work, *args, **kwargs):
+        return await work(self, *args, **kwargs)
+
+    execute_read = execute_write
+
+    async def close(self):
+        pass
+
+
+class AsyncMemoryDriver(MemoryDriver):
+    """The subset of neo4j.AsyncDriver the application uses, backed by a MemoryGraph."""
+
+    def session(self, **kwargs):
+        return AsyncMemorySession(self.graph)
+
+    async def execute_query(self, query, parameters=None, **kwargs):
+        return super().execute_query(query, parameters, **kwargs)
+
+    async def verify_connectivity(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+### LangChain graph stores ###
+
+def format_properties(props):
+    return ", ".join(f"{prop['property']}: {prop['type']}" for prop in props)
+
+
+# Same text layout as Neo4jGraph's (non-enhanced) schema, which the Cypher prompt is written against
+def format_schema(schema):
+    node_props = [f"{label} {{{format_properties(props)}}}" for label, props in schema["node_props"].items()]
+    rel_props = [f"{rs_type} {{{format_properties(props)}}}" for rs_type, props in schema["rel_props"].items()]
+    rels = [f"(:{rel['start']})-[:{rel['type']}]->(:{rel['end']})" for rel in schema["relationships"]]
+    return "\n".join(["Node properties:", "\n".join(node_props), "Relationship properties:", "\n".join(rel_props), "The relationships:", "\n".join(rels)])
+
+
+class MemoryGraphStore(GraphStore):
+    """LangChain graph store over the embedded graph, used by GraphCypherQAChain in place of Neo4jGraph."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.schema = ""
+        self.structured_schema = {}
+        self.refresh_schema()
+
+    def query(self, query, params={}):
+        return self.graph.query(query, params)
+
+    def refresh_schema(self):
+        self.structured_schema = self.graph.structured_schema()
+        self.schema = format_schema(self.structured_schema)
+
+    @property
+    def get_schema(self):
+        return self.schema
+
+    @property
+    def get_structured_schema(self):
+        return self.structured_schema
+
+    def add_graph_documents(self, graph_documents, include_source=False):
+        """Write LangChain GraphDocuments through the batched MERGE statements of the ingestion pipeline, ids
+        normalized like extracted ones (relationship properties are not stored). With `include_source` every
+        document also becomes a Document node that MENTIONS its nodes, as with Neo4jGraph."""
+        entity_groups, relationship_groups = {}, {}
+        seen = set()
+
+        # Function to add a node's row once, returning its (label, id); None if it cannot be written
+        def add_node(label, node_id, properties):
+            parsed = entity_row({**properties, "label": label, "id": node_id})
+            if parsed is None:
+                return None
+            label, row = parsed
+            if (label, row["id"]) not in seen:
+                seen.add((label, row["id"]))
+                entity_groups.setdefault(label, []).append(row)
+            return label, row["id"]
+
+        def add_relationship(src, rs_type, tgt):
+            if src is not None and tgt is not None and valid_name(rs_type):
+                relationship_groups.setdefault((src[0], rs_type, tgt[0]), []).append({"src": src[1], "tgt": tgt[1]})
+
+        for document in graph_documents:
+            nodes = [add_node(node.type, node.id, node.properties) for node in document.nodes]
+            for rel in document.relationships:
+                src = add_node(rel.source.type, rel.source.id, rel.source.properties)
+                tgt = add_node(rel.target.type, rel.target.id, rel.target.properties)
+                add_relationship(src, rel.type, tgt)
+            if include_source:
+                source = document.source
+                source_id = source.metadata.get("id") or hashlib.md5(source.page_content.encode("utf-8")).hexdigest()
+                document_node = add_node("Document", source_id, {**source.metadata, "text": source.page_content})
+                for node in nodes:
+                    add_relationship(document_node, "MENTIONS", node)
+        statements = build_statements(entity_groups, relationship_groups)
+        driver = MemoryDriver(self.graph)
+        constraint_manager.ensure(driver, statement_labels(statements))
+        search_index.ensure(driver, statement_labels(statements))
+        result = write_statements(driver, statements)
+        graph_state.record_write(result)
+        return result
+
+
+class LazyGraphStore(GraphStore):
+    """Creates the real graph store on first use, so importing the QA module neither connects to the
+    database nor introspects its schema."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._store = None
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        with self._lock:
+            if self._store is None:
+                self._store = self.factory()
+            return self._store
+
+    def query(self, query, params={}):
+        return self.store.query(query, params)
+
+    def refresh_schema(self):
+        self.store.refresh_schema()
+
+    @property
+    def schema(self):
+        return self.store.schema
+
+    @property
+    def structured_schema(self):
+        return self.store.structured_schema
+
+    @property
+    def get_schema(self):
+        return self.store.get_schema
+
+    @property
+    def get_structured_schema(self):
+        return self.store.get_structured_schema
+
+    def add_graph_documents(self, graph_documents, include_source=False):
+        return self.store.add_graph_documents(graph_documents, include_source)
+
+
+### Factories ###
+
+# Neither driver connects before its first query
+def create_driver():
+    if GRAPH_BACKEND == "memory":
+        return MemoryDriver(memory_graph())
+    return GraphDatabase.driver(neo4j_url, auth=(neo4j_user, neo4j_password))
+
+
+def create_async_driver():
+    if GRAPH_BACKEND == "memory":
+        return AsyncMemoryDriver(memory_graph())
+    return AsyncGraphDatabase.driver(
+        neo4j_url,
+        auth=(neo4j_user, neo4j_password),
+        max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+        connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+    )
+
+
+def create_qa_graph():
+    if GRAPH_BACKEND == "memory":
+        return LazyGraphStore(lambda: MemoryGraphStore(memory_graph()))
+    return LazyGraphStore(lambda: Neo4jGraph(url=neo4j_url, username=neo4j_user, password=neo4j_password))
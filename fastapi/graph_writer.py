@@ -0,0 +1,447 @@
+import os
+import re
+import json
+import asyncio
+import unicodedata
+from collections import namedtuple
+from metrics import WRITE_BATCHES, WRITE_ROWS, WRITE_RETRIES, WRITE_FAILED_ROWS, current_trace
+
+# Batched graph writer: entities are grouped by label and relationships by (src label, type, tgt label),
+# then sent as parameter lists through UNWIND so Neo4j can reuse one cached plan per group.
+WRITE_BATCH_SIZE = int(os.getenv("GRAPH_WRITE_BATCH_SIZE", "500"))
+WRITE_RETRY_LIMIT = int(os.getenv("GRAPH_WRITE_RETRIES", "2"))
+# While extraction is streaming, pending rows are written as soon as this many have accumulated
+STREAM_FLUSH_ROWS = int(os.getenv("GRAPH_STREAM_FLUSH_ROWS", "100"))
+
+# One batch of parameter rows for a single MERGE query. `label` is set for entity batches,
+# `pattern` = (src label, type, tgt label) for relationship batches.
+Statement = namedtuple("Statement", ["query", "rows", "label", "pattern"])
+
+COUNTER_FIELDS = [
+    "nodes_created",
+    "nodes_deleted",
+    "relationships_created",
+    "relationships_deleted",
+    "properties_set",
+    "labels_added",
+    "labels_removed",
+]
+
+
+def normalize_id(entity_id):
+    return str(entity_id).replace("-", "").replace("_", "")
+
+
+# Lower-case, accent-free, punctuation-free form of a name, stored on every entity as `search_name`
+def normalize_search_text(text):
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+# Labels and relationship types cannot be passed as parameters, so they are validated and backtick-quoted
+def valid_name(name):
+    return re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", str(name)) is not None
+
+
+def quote_name(name):
+    if not valid_name(name):
+        raise ValueError(f"Invalid label or relationship type: {name!r}")
+    return f"`{name}`"
+
+
+# Provenance: rows written for a source carry its id, which is added to the element's `sources` list
+def add_source(var):
+    return f"SET {var}.sources = CASE WHEN row.source IN coalesce({var}.sources, []) THEN {var}.sources ELSE coalesce({var}.sources, []) + row.source END"
+
+
+def entity_merge_query(label, provenance=False):
+    return (
+        f"UNWIND $rows AS row "
+        f"MERGE (n:{quote_name(label)} {{id: row.id}}) "
+        f"ON CREATE SET n += row.properties"
+        + (f" {add_source('n')}" if provenance else "")
+    )
+
+
+def relationship_merge_query(src_label, rs_type, tgt_label, provenance=False):
+    return (
+        f"UNWIND $rows AS row "
+        f"MATCH (a:{quote_name(src_label)} {{id: row.src}}) "
+        f"MATCH (b:{quote_name(tgt_label)} {{id: row.tgt}}) "
+        + (f"MERGE (a)-[r:{quote_name(rs_type)}]->(b) {add_source('r')}" if provenance else f"MERGE (a)-[:{quote_name(rs_type)}]->(b)")
+    )
+
+
+# Take the source off the relationship; one that no source mentions any more is deleted
+def relationship_remove_query(src_label, rs_type, tgt_label):
+    return (
+        f"UNWIND $rows AS row "
+        f"MATCH (a:{quote_name(src_label)} {{id: row.src}})-[r:{quote_name(rs_type)}]->(b:{quote_name(tgt_label)} {{id: row.tgt}}) "
+        f"SET r.sources = [s IN coalesce(r.sources, []) WHERE s <> row.source] "
+        f"WITH r WHERE size(r.sources) = 0 "
+        f"DELETE r"
+    )
+
+
+# Take the source off the entity; one that no source mentions any more is deleted once it has no relationships left
+def entity_remove_query(label):
+    return (
+        f"UNWIND $rows AS row "
+        f"MATCH (n:{quote_name(label)} {{id: row.id}}) "
+        f"SET n.sources = [s IN coalesce(n.sources, []) WHERE s <> row.source] "
+        f"WITH n WHERE size(n.sources) = 0 "
+        f"OPTIONAL MATCH (n)-[r]-() "
+        f"WITH n, count(r) AS degree WHERE degree = 0 "
+        f"DELETE n"
+    )
+
+
+# Neo4j properties must be primitives, so nested values are stringified and empty ones dropped
+def clean_properties(properties):
+    cleaned = {}
+    for key, val in properties.items():
+        if val is None or val == "" or not valid_name(key):
+            continue
+        cleaned[key] = val if isinstance(val, (str, int, float, bool)) else json.dumps(val)
+    return cleaned
+
+
+# Function to turn one extracted entity into (label, parameter row); None if it cannot be written
+def entity_row(entity):
+    label = str(entity.get("label", "")).strip()
+    if not valid_name(label) or entity.get("id") is None:
+        print(f"Skipping entity with invalid label or id: {entity}")
+        return None
+    entity_id = normalize_id(entity["id"])
+    properties = clean_properties({k: v for k, v in entity.items() if k not in ["label", "id"]})
+    properties["search_name"] = normalize_search_text(properties.get("name", entity_id))
+    return label, {"id": entity_id, "properties": properties}
+
+
+# Function to split an extracted "src|TYPE|tgt" relationship into normalized parts; None if malformed
+def parse_relationship(rs):
+    parts = str(rs).split("|")
+    if len(parts) != 3:
+        print(f"Skipping malformed relationship: {rs}")
+        return None
+    src_id, rs_type, tgt_id = parts
+    rs_type = rs_type.strip()
+    if not valid_name(rs_type):
+        print(f"Skipping relationship with invalid type: {rs}")
+        return None
+    return normalize_id(src_id.strip()), rs_type, normalize_id(tgt_id.strip())
+
+
+# Function to turn the extracted json into parameter rows, grouped by label and by relationship shape.
+# A `resolver` (see entity_resolution.py) maps each extracted id to the canonical id it is written under.
+def group_extraction(json_obj, resolver=None):
+    if isinstance(json_obj, str):
+        json_obj = json.loads(json_obj)
+    entity_groups = {}
+    relationship_groups = {}
+    e_label_map = {}
+    for entity in json_obj.get("entities", []):
+        parsed = entity_row(entity)
+        if parsed is None:
+            continue
+        label, row = parsed
+        extracted_id = row["id"]
+        if resolver is not None:
+            row["id"] = resolver.resolve(label, extracted_id)
+        entity_groups.setdefault(label, []).append(row)
+        e_label_map[extracted_id] = (label, row["id"])
+    for rs in json_obj.get("relationships", []):
+        parsed = parse_relationship(rs)
+        if parsed is None:
+            continue
+        src_id, rs_type, tgt_id = parsed
+        if src_id not in e_label_map or tgt_id not in e_label_map:
+            print(f"Skipping relationship with unknown endpoint: {rs}")
+            continue
+        (src_label, src_id), (tgt_label, tgt_id) = e_label_map[src_id], e_label_map[tgt_id]
+        relationship_groups.setdefault((src_label, rs_type, tgt_label), []).append({"src": src_id, "tgt": tgt_id})
+    return entity_groups, relationship_groups
+
+
+def empty_counters():
+    return {field: 0 for field in COUNTER_FIELDS}
+
+
+def empty_result():
+    return {"counters": empty_counters(), "batches": 0, "failed_rows": 0, "nodes_by_label": {}, "relationships_by_pattern": {}}
+
+
+# Accepts either a neo4j SummaryCounters object or a plain dict of counters
+def add_counters(total, counters):
+    for field in COUNTER_FIELDS:
+        if isinstance(counters, dict):
+            total[field] += counters.get(field, 0)
+        else:
+            total[field] += getattr(counters, field, 0)
+    return total
+
+
+# Add one batch's counters to the result, attributing created (net of deleted) nodes/relationships to the batch's label/pattern
+def record_batch(result, statement, counters, rows=()):
+    WRITE_BATCHES.inc()
+    WRITE_ROWS.inc(len(rows), kind="entity" if statement.label else "relationship")
+    before = dict(result["counters"])
+    add_counters(result["counters"], counters)
+    result["batches"] += 1
+    if statement.label:
+        created = result["counters"]["nodes_created"] - before["nodes_created"] - (result["counters"]["nodes_deleted"] - before["nodes_deleted"])
+        result["nodes_by_label"][statement.label] = result["nodes_by_label"].get(statement.label, 0) + created
+    if statement.pattern:
+        created = result["counters"]["relationships_created"] - before["relationships_created"] - (result["counters"]["relationships_deleted"] - before["relationships_deleted"])
+        key = "|".join(statement.pattern)
+        result["relationships_by_pattern"][key] = result["relationships_by_pattern"].get(key, 0) + created
+
+
+# Fold the result of one write into a running total
+def merge_results(total, part):
+    add_counters(total["counters"], part["counters"])
+    total["batches"] += part["batches"]
+    total["failed_rows"] += part["failed_rows"]
+    for key in ("nodes_by_label", "relationships_by_pattern"):
+        for name, created in part[key].items():
+            total[key][name] = total[key].get(name, 0) + created
+    return total
+
+
+def record_failure(result, statement, rows, error):
+    result["failed_rows"] += 1
+    WRITE_FAILED_ROWS.inc()
+    with open("failed_statements.txt", "a") as f:
+        f.write(f"{statement.query} - rows: {json.dumps(rows)} - Exception: {error} - trace: {current_trace.get()}\n")
+
+
+def _run_batch(tx, query, rows):
+    return tx.run(query, rows=rows).consume().counters
+
+
+# Write one batch in its own transaction; on failure retry, then bisect to isolate the bad rows
+def write_batch(driver, statement, rows, result, retries=WRITE_RETRY_LIMIT):
+    for attempt in range(retries + 1):
+        if attempt:
+            WRITE_RETRIES.inc()
+        try:
+            with driver.session() as session:
+                counters = session.execute_write(_run_batch, statement.query, rows)
+            record_batch(result, statement, counters, rows)
+            return
+        except Exception as e:
+            error = e
+    if len(rows) > 1:
+        middle = len(rows) // 2
+        write_batch(driver, statement, rows[:middle], result, retries=0)
+        write_batch(driver, statement, rows[middle:], result, retries=0)
+        return
+    record_failure(result, statement, rows, error)
+
+
+# Function to split the grouped rows into batched statements; entities come first so relationships can MATCH them.
+# With `provenance` the rows carry a `source` id that is added to every element written.
+def build_statements(entity_groups, relationship_groups, batch_size=WRITE_BATCH_SIZE, provenance=False):
+    statements = []
+    for label, rows in entity_groups.items():
+        query = entity_merge_query(label, provenance)
+        for i in range(0, len(rows), batch_size):
+            statements.append(Statement(query, rows[i:i + batch_size], label, None))
+    for pattern, rows in relationship_groups.items():
+        query = relationship_merge_query(*pattern, provenance)
+        for i in range(0, len(rows), batch_size):
+            statements.append(Statement(query, rows[i:i + batch_size], None, pattern))
+    return statements
+
+
+# Function to build the statements that take `source_id` off entities (label, id) and relationships
+# (src label, src id, type, tgt label, tgt id); relationships go first so orphaned entities can be deleted
+def build_removal_statements(source_id, entities, relationships, batch_size=WRITE_BATCH_SIZE):
+    relationship_groups = {}
+    for src_label, src, rs_type, tgt_label, tgt in sorted(relationships):
+        relationship_groups.setdefault((src_label, rs_type, tgt_label), []).append({"src": src, "tgt": tgt, "source": source_id})
+    entity_groups = {}
+    for label, entity_id in sorted(entities):
+        entity_groups.setdefault(label, []).append({"id": entity_id, "source": source_id})
+    statements = []
+    for pattern, rows in relationship_groups.items():
+        query = relationship_remove_query(*pattern)
+        for i in range(0, len(rows), batch_size):
+            statements.append(Statement(query, rows[i:i + batch_size], None, pattern))
+    for label, rows in entity_groups.items():
+        query = entity_remove_query(label)
+        for i in range(0, len(rows), batch_size):
+            statements.append(Statement(query, rows[i:i + batch_size], label, None))
+    return statements
+
+
+def write_statements(driver, statements, on_progress=None):
+    """Execute batched statements, one transaction each. Returns the summed write counters,
+    plus the nodes created per label and relationships created per pattern."""
+    result = empty_result()
+    for i, statement in enumerate(statements):
+        print(f"Executing batch {i+1} of {len(statements)} ({len(statement.rows)} rows)")
+        write_batch(driver, statement, statement.rows, result)
+        if on_progress:
+            on_progress("writing", (i + 1) / len(statements))
+    return result
+
+
+async def _arun_batch(tx, query, rows):
+    result = await tx.run(query, rows=rows)
+    summary = await result.consume()
+    return summary.counters
+
+
+# Async counterpart of write_batch for the neo4j AsyncDriver
+async def awrite_batch(driver, statement, rows, result, retries=WRITE_RETRY_LIMIT):
+    for attempt in range(retries + 1):
+        if attempt:
+            WRITE_RETRIES.inc()
+        try:
+            async with driver.session() as session:
+                counters = await session.execute_write(_arun_batch, statement.query, rows)
+            record_batch(result, statement, counters, rows)
+            return
+        except Exception as e:
+            error = e
+    if len(rows) > 1:
+        middle = len(rows) // 2
+        await awrite_batch(driver, statement, rows[:middle], result, retries=0)
+        await awrite_batch(driver, statement, rows[middle:], result, retries=0)
+        return
+    # the failure log is a file append, keep it off the event loop
+    await asyncio.to_thread(record_failure, result, statement, rows, error)
+
+
+async def awrite_statements(driver, statements, on_progress=None):
+    """Async counterpart of write_statements."""
+    result = empty_result()
+    for i, statement in enumerate(statements):
+        await awrite_batch(driver, statement, statement.rows, result)
+        if on_progress:
+            on_progress("writing", (i + 1) / len(statements))
+    return result
+
+
+class StreamingGraphWriter:
+    """Collects entities and relationships one at a time as a streaming extraction produces them, and hands
+    out batched statements once `flush_rows` rows are pending, so the graph fills up while generation runs.
+
+    Entities are deduplicated by (label, id) and relationships by their normalized triple across the whole
+    document, after `resolver` (if given) has mapped ids to canonical ones. A relationship waits until both of
+    its endpoints have been seen; the ones still waiting at the final flush are dropped, like in group_extraction.
+
+    With a `source` (a source_registry.SourceVersion) every element written is tagged with the source id, and
+    the document is diffed against the source's previous version: triples the previous complete ingestion
+    already wrote are skipped, and the final flush takes the source off the ones no longer extracted
+    (unless `source.complete` was cleared because part of the document failed)."""
+
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, flush_rows=STREAM_FLUSH_ROWS, resolver=None, source=None):
+        self.batch_size = batch_size
+        self.flush_rows = flush_rows
+        self.resolver = resolver
+        self.source = source
+        self.entities = set()
+        self.relationships = set()
+        self.entity_groups = {}
+        self.relationship_groups = {}
+        self.waiting = []
+        self.labels = {}
+        self.seen_entities = set()
+        self.seen_relationships = set()
+        self.pending = 0
+        self.result = empty_result()
+
+    def add(self, kind, value):
+        if kind == "entity":
+            self.add_entity(value)
+        elif kind == "relationship":
+            self.add_relationship(value)
+
+    def add_entity(self, entity):
+        parsed = entity_row(entity) if isinstance(entity, dict) else None
+        if parsed is None:
+            return
+        label, row = parsed
+        extracted_id = row["id"]
+        if self.resolver is not None:
+            row["id"] = self.resolver.resolve(label, extracted_id)
+        self.labels.setdefault(extracted_id, (label, row["id"]))
+        if (label, row["id"]) in self.seen_entities:
+            return
+        self.seen_entities.add((label, row["id"]))
+        if self.source is not None:
+            self.entities.add((label, row["id"]))
+            if self.known(label, row["id"]):
+                return
+            row["source"] = self.source.id
+        self.entity_groups.setdefault(label, []).append(row)
+        self.pending += 1
+
+    # Whether the previous complete ingestion of the source already wrote this entity/relationship key
+    def known(self, *key):
+        if not self.source.trusted:
+            return False
+        previous = self.source.previous_entities if len(key) == 2 else self.source.previous_relationships
+        return key in previous
+
+    def add_relationship(self, rs):
+        parsed = parse_relationship(rs)
+        if parsed is None or parsed in self.seen_relationships:
+            return
+        self.seen_relationships.add(parsed)
+        self.waiting.append(parsed)
+        self.pending += 1
+
+    def ready(self):
+        return self.pending >= self.flush_rows
+
+    def take(self, final=False):
+        """Statements for everything writable now; entities come first so relationships can MATCH them."""
+        still_waiting = []
+        for src_id, rs_type, tgt_id in self.waiting:
+            if src_id in self.labels and tgt_id in self.labels:
+                (src_label, src), (tgt_label, tgt) = self.labels[src_id], self.labels[tgt_id]
+                row = {"src": src, "tgt": tgt}
+                if self.source is not None:
+                    key = (src_label, src, rs_type, tgt_label, tgt)
+                    if key in self.relationships:
+                        continue
+                    self.relationships.add(key)
+                    if self.known(*key):
+                        continue
+                    row["source"] = self.source.id
+                self.relationship_groups.setdefault((src_label, rs_type, tgt_label), []).append(row)
+            elif final:
+                print(f"Skipping relationship with unknown endpoint: {src_id}|{rs_type}|{tgt_id}")
+            else:
+                still_waiting.append((src_id, rs_type, tgt_id))
+        statements = build_statements(self.entity_groups, self.relationship_groups, self.batch_size, self.source is not None)
+        if final and self.source is not None and self.source.complete:
+            removed_entities, removed_relationships = self.removed()
+            statements += build_removal_statements(self.source.id, removed_entities, removed_relationships, self.batch_size)
+        self.entity_groups = {}
+        self.relationship_groups = {}
+        self.waiting = still_waiting
+        self.pending = 0
+        return statements
+
+    # Keys the source's previous version had and this one no longer does
+    def removed(self):
+        return self.source.previous_entities - self.entities, self.source.previous_relationships - self.relationships
+
+    def write(self, driver, statements):
+        part = empty_result()
+        for statement in statements:
+            write_batch(driver, statement, statement.rows, part)
+        merge_results(self.result, part)
+        return part
+
+    async def awrite(self, driver, statements):
+        part = empty_result()
+        for statement in statements:
+            await awrite_batch(driver, statement, statement.rows, part)
+        merge_results(self.result, part)
+        return part
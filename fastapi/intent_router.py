@@ -0,0 +1,272 @@
+import os
+import re
+import json
+import math
+import threading
+from time import time
+from collections import namedtuple
+from prompts import RELATION_EXTRACTION_TEMPLATE
+from graph_writer import quote_name, normalize_search_text
+from entity_search import SEARCH_QUERY, SEARCH_RESOLVE_LIMIT, lucene_query
+from metrics import INTENT_ROUTES
+
+# Intent routing configuration: questions that match a template with enough confidence are answered without the LLM
+INTENT_ROUTING = os.getenv("INTENT_ROUTING", "true").lower() in ("1", "true", "yes")
+INTENT_MIN_CONFIDENCE = float(os.getenv("INTENT_MIN_CONFIDENCE", "0.6"))
+# The best intent must beat the runner-up by this much, or the question is left to the LLM
+INTENT_MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", "0.25"))
+INTENT_RESULT_LIMIT = int(os.getenv("INTENT_RESULT_LIMIT", "25"))
+# Entity name candidates looked up in the full-text index per question
+INTENT_MAX_LOOKUPS = int(os.getenv("INTENT_MAX_LOOKUPS", "6"))
+# Every routing decision is appended here as a JSON line, for growing the templates from real questions
+INTENT_LOG_PATH = os.getenv("INTENT_LOG_PATH", "./logs/intent_routing.jsonl")
+
+STOPWORDS = set("""
+a an the of to in on at by for from about into is are was were be been being do does did done has have had
+which who whom whose what where list show me tell give find all any some there their them they it its this that
+these those s please can could would should i you we us our your person people
+""".split())
+# Questions asking to count, rank, compare or negate need more than a one-hop lookup
+FALLBACK_WORDS = set("""
+how many count number most least more less average total compare versus vs not never without both first last
+when why between only except
+""".split())
+
+# Keywords and answer phrasing per (relationship type, direction); "out" asks for what the given entity points to,
+# "in" for what points to it. Relationship types without an entry get their own words as keywords.
+INTENT_PHRASES = {
+    ("WORK_AT", "out"): ("work works working employer employed company organization job workplace", "{entity} works at {items}."),
+    ("WORK_AT", "in"): ("work works working employee employees staff employed team members", "People who work at {entity}: {items}."),
+    ("DEVELOPE", "out"): ("develop developed develops create created build built make made technologies technology", "{entity} developed {items}."),
+    ("DEVELOPE", "in"): ("develop developed developer developers create created creator build built inventor invented", "{entity} was developed by {items}."),
+    ("STUDY_AT", "out"): ("study studied studies attend attended graduate graduated university school college education alma mater", "{entity} studied at {items}."),
+    ("STUDY_AT", "in"): ("study studied studies attend attended graduate graduated student students alumni", "People who studied at {entity}: {items}."),
+    ("PROPOSE", "out"): ("propose proposed proposes introduce introduced suggest suggested concepts concept ideas idea", "{entity} proposed {items}."),
+    ("PROPOSE", "in"): ("propose proposed proposer introduce introduced suggest suggested coined author", "{entity} was proposed by {items}."),
+    ("RELEASE", "out"): ("release released releases launch launched publish published ship shipped products technologies", "{entity} released {items}."),
+    ("RELEASE", "in"): ("release released launch launched publish published vendor maker company organization", "{entity} was released by {items}."),
+    ("IS_RELATED_TO", "both"): ("related relate relates relation relationship connected linked associated similar with concepts concept", "{entity} is related to {items}."),
+}
+
+Route = namedtuple("Route", ["intent", "confidence", "margin", "entity", "ids", "cypher", "params", "reason"])
+
+
+# Crude suffix stemming, enough for "works"/"worked"/"working" or "studies"/"studied" to meet
+def stem(word):
+    for suffix, replacement in (("ies", "y"), ("ied", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("s", "")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:len(word) - len(suffix)] + replacement
+            break
+    return word[:-1] if word.endswith("e") and len(word) > 4 else word
+
+
+def tokenize(question):
+    return normalize_search_text(re.sub(r"['’]s\b", "", question)).split()
+
+
+def schema_relationships(template=RELATION_EXTRACTION_TEMPLATE):
+    """(source label, type, target label) of the relationship types the extraction prompt defines."""
+    labels = {label.lower(): label for label in re.findall(r"label:'(\w+)'", template)}
+    return [
+        (labels[src], rs_type, labels[tgt])
+        for src, rs_type, tgt in re.findall(r"^\s*(\w+)\|(\w+)\|(\w+)\s*$", template, re.MULTILINE)
+        if src in labels and tgt in labels
+    ]
+
+
+class Intent:
+    """One question shape: a one-hop lookup from an entity labelled `given` along `rs_type` to `target`s."""
+
+    def __init__(self, src_label, rs_type, tgt_label, direction):
+        keywords, answer = INTENT_PHRASES.get((rs_type, direction), (rs_type.lower().replace("_", " "), None))
+        self.name = f"{rs_type}:{direction}"
+        self.rs_type = rs_type
+        self.direction = direction
+        self.given = tgt_label if direction == "in" else src_label
+        self.target = src_label if direction == "in" else tgt_label
+        self.keywords = {stem(word) for word in keywords.split()}
+        self.phrase = answer or f"{{entity}} {rs_type.lower().replace('_', ' ')} {{items}}."
+        given, target, rs_type = quote_name(self.given), quote_name(self.target), quote_name(self.rs_type)
+        pattern = {
+            "out": f"(e:{given})-[:{rs_type}]->(x:{target})",
+            "in": f"(x:{target})-[:{rs_type}]->(e:{given})",
+            "both": f"(e:{given})-[:{rs_type}]-(x:{target})",
+        }[self.direction]
+        # one parameterized query per intent, so the database plans it once whatever the entities
+        self.cypher = f"MATCH {pattern} WHERE e.id IN $ids RETURN coalesce(e.name, e.id) AS entity, coalesce(x.name, x.id) AS result LIMIT $limit"
+
+    def params(self, ids):
+        return {"ids": sorted(ids), "limit": INTENT_RESULT_LIMIT}
+
+    def answer(self, rows):
+        """Phrase the query result; no rows means the graph does not know."""
+        found = {}
+        for row in rows:
+            items = found.setdefault(row["entity"], [])
+            if row["result"] not in items:
+                items.append(row["result"])
+        if not found:
+            return "I don't know the answer."
+        return " ".join(self.phrase.format(entity=entity, items=join_items(items)) for entity, items in found.items())
+
+
+def join_items(items):
+    items = [str(item) for item in items]
+    return items[0] if len(items) == 1 else f"{', '.join(items[:-1])} and {items[-1]}"
+
+
+class IntentRouter:
+    """Matches questions to one-hop Cypher templates over the extraction schema without calling the LLM.
+
+    The words of a question that belong to no intent's keywords are taken as the entity name and looked up
+    in the full-text entity index; each intent is scored by the share of the remaining words' TF-IDF weight that
+    its keywords cover. Only intents starting from the resolved entity's label compete, and a question is
+    routed when the best of them is both confident and clearly ahead of the next one."""
+
+    def __init__(self, relationships=None, min_confidence=INTENT_MIN_CONFIDENCE, min_margin=INTENT_MIN_MARGIN,
+                 log_path=INTENT_LOG_PATH, enabled=INTENT_ROUTING):
+        self.intents = []
+        for src_label, rs_type, tgt_label in (relationships if relationships is not None else schema_relationships()):
+            directions = ["both"] if src_label == tgt_label else ["out", "in"]
+            self.intents.extend(Intent(src_label, rs_type, tgt_label, direction) for direction in directions)
+        self.vocabulary = set().union(*(intent.keywords for intent in self.intents)) if self.intents else set()
+        self.idf = {
+            word: math.log(len(self.intents) / sum(1 for intent in self.intents if word in intent.keywords)) + 1.0
+            for word in self.vocabulary
+        }
+        # a word no template knows weighs as much as the rarest keyword
+        self.unknown_weight = max(self.idf.values()) if self.idf else 1.0
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+        self.log_path = log_path
+        self.enabled = enabled
+        self.lock = threading.Lock()
+
+    def score(self, words):
+        """Share of the question words' TF-IDF weight covered by each intent's keywords (0 to 1). Unlike cosine
+        similarity this does not penalize intents for having many keywords, which suits questions of a few words.
+        Words no template knows ("before", "2010") count against every intent, so a question that says more than
+        a template can answer is left to the LLM."""
+        weights = {}
+        for word in words:
+            weights[word] = weights.get(word, 0.0) + self.idf.get(word, self.unknown_weight)
+        total = sum(weights.values())
+        if not total:
+            return {intent.name: 0.0 for intent in self.intents}
+        return {
+            intent.name: sum(weight for word, weight in weights.items() if word in intent.keywords) / total
+            for intent in self.intents
+        }
+
+    # Runs of words that are neither stopwords nor intent keywords, longest candidates first
+    def entity_candidates(self, tokens):
+        runs, run = [], []
+        for token in tokens:
+            if token in STOPWORDS or stem(token) in self.vocabulary:
+                if run:
+                    runs.append(run)
+                run = []
+            else:
+                run.append(token)
+        if run:
+            runs.append(run)
+        return runs
+
+    def resolve(self, run, query_fn, lookups):
+        """(term, {id: labels}) for the longest part of the run naming entities, counting index lookups in `lookups`."""
+        for size in range(len(run), 0, -1):
+            for start in range(len(run) - size + 1):
+                if lookups[0] >= INTENT_MAX_LOOKUPS:
+                    return None, {}
+                term = " ".join(run[start:start + size])
+                lookups[0] += 1
+                # words are matched as prefixes, so a plural finds the singular too
+                singular = " ".join(word[:-1] if word.endswith("s") and not word.endswith("ss") and len(word) > 3 else word for word in term.split())
+                rows = query_fn(SEARCH_QUERY, {"query": lucene_query(singular), "limit": SEARCH_RESOLVE_LIMIT + 1})
+                if rows:
+                    return term, {row["id"]: set(row["labels"]) for row in rows}
+        return None, {}
+
+    def route(self, question, query_fn):
+        """Route for a question: `intent` is None when it is left to the LLM, with the reason why.
+        `query_fn(cypher, params)` runs a query and returns a list of dicts."""
+        fallback = lambda reason, **fields: Route(None, fields.get("confidence", 0.0), fields.get("margin", 0.0), fields.get("entity"), [], None, None, reason)
+        if not self.enabled or not self.intents:
+            return fallback("routing disabled")
+        tokens = tokenize(question)
+        if FALLBACK_WORDS.intersection(tokens):
+            return fallback("aggregate, comparison or negation")
+        runs = self.entity_candidates(tokens)
+        if not runs:
+            return fallback("no entity named")
+        lookups = [0]
+        try:
+            resolved = [(term, matches) for term, matches in (self.resolve(run, query_fn, lookups) for run in runs) if term]
+        except Exception as e:
+            print(f"Entity lookup failed while routing {question!r}: {e}")
+            return fallback("entity lookup failed")
+        if not resolved:
+            return fallback("no entity found")
+        term, matches = resolved[0]
+        # a name split by stopwords ("bank of america") resolves to the same entities from each of its parts
+        for other_term, other in resolved[1:]:
+            common = matches.keys() & other.keys()
+            if not common:
+                return fallback("several entities named")
+            term, matches = f"{term} {other_term}", {entity_id: matches[entity_id] for entity_id in common}
+        if len(matches) > SEARCH_RESOLVE_LIMIT:
+            return fallback("entity name too broad", entity=term)
+
+        entity_words = set(term.split())
+        scores = self.score([stem(token) for token in tokens if token not in STOPWORDS and token not in entity_words])
+        candidates = sorted(
+            ((scores[intent.name], intent) for intent in self.intents if any(intent.given in labels for labels in matches.values())),
+            key=lambda candidate: -candidate[0],
+        )
+        if not candidates:
+            return fallback("no template for the entity", entity=term)
+        confidence, intent = candidates[0]
+        margin = confidence - (candidates[1][0] if len(candidates) > 1 else 0.0)
+        if confidence < self.min_confidence or margin < self.min_margin:
+            return fallback("low confidence", confidence=confidence, margin=margin, entity=term)
+        ids = [entity_id for entity_id, labels in matches.items() if intent.given in labels]
+        return Route(intent, confidence, margin, term, ids, intent.cypher, intent.params(ids), "template")
+
+    def log(self, question, route, cypher=None):
+        """Record a routing decision; for questions left to the LLM, `cypher` is what it generated."""
+        INTENT_ROUTES.inc(decision="template" if route.intent else "fallback", intent=route.intent.name if route.intent else route.reason)
+        if not self.log_path:
+            return
+        entry = {
+            "time": round(time(), 3),
+            "question": question,
+            "decision": "template" if route.intent else "fallback",
+            "intent": route.intent.name if route.intent else None,
+            "reason": route.reason,
+            "confidence": round(route.confidence, 3),
+            "margin": round(route.margin, 3),
+            "entity": route.entity,
+            "cypher": route.cypher or cypher,
+            "params": route.params,
+        }
+        try:
+            with self.lock:
+                if os.path.dirname(self.log_path):
+                    os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Writing the intent routing log failed: {e}")
+
+
+def route_info(route):
+    return {
+        "intent": route.intent.name if route.intent else None,
+        "reason": route.reason,
+        "confidence": round(route.confidence, 3),
+        "margin": round(route.margin, 3),
+        "entity": route.entity,
+    }
+
+
+intent_router = IntentRouter()
@@ -0,0 +1,148 @@
+import os
+import uuid
+import asyncio
+import threading
+from time import time
+from collections import OrderedDict
+from metrics import span, use_trace, current_trace, new_trace_id
+
+# Ingestion queue configuration
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "20"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "200"))
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    """One ingestion request: its current stage, progress, per-stage timings and final graph delta."""
+
+    def __init__(self, kind, source, payload):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.source = source
+        self.payload = payload
+        # the job's spans join the trace of the request that queued it
+        self.trace_id = current_trace.get() or new_trace_id()
+        self.status = "queued"
+        self.stage = "queued"
+        self.progress = 0.0
+        self.timings = {}
+        self.result = None
+        self.error = None
+        self.created_at = time()
+        self.started_at = None
+        self.finished_at = None
+        self._stage_started = None
+        self._lock = threading.Lock()
+
+    # Called from the pipeline thread; closes the timing of the previous stage
+    def set_stage(self, stage, progress=None):
+        with self._lock:
+            now = time()
+            if stage != self.stage:
+                if self._stage_started is not None:
+                    self.timings[self.stage] = round(self.timings.get(self.stage, 0) + now - self._stage_started, 3)
+                self.stage = stage
+                self._stage_started = now
+            if progress is not None:
+                self.progress = round(min(max(progress, 0.0), 1.0), 3)
+
+    def start(self):
+        self.status = "running"
+        self.started_at = time()
+        self.set_stage("starting", 0.0)
+
+    def finish(self, result=None, error=None):
+        self.set_stage("done" if error is None else "failed", 1.0)
+        self.status = "done" if error is None else "failed"
+        self.result = result
+        self.error = error
+        self.finished_at = time()
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "trace_id": self.trace_id,
+                "kind": self.kind,
+                "source": self.source,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": self.progress,
+                "timings": dict(self.timings),
+                "queued_seconds": round((self.started_at or time()) - self.created_at, 3),
+                "total_seconds": round(self.finished_at - self.created_at, 3) if self.finished_at else None,
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class JobQueue:
+    """Bounded queue of ingestion jobs processed by a pool of background workers.
+    `handler(job)` may be a coroutine function, or a blocking function that then runs in a worker thread;
+    its return value becomes the job result."""
+
+    def __init__(self, handler, workers=INGEST_WORKERS, max_depth=INGEST_QUEUE_SIZE, history=JOB_HISTORY):
+        self.handler = handler
+        self.workers = workers
+        self.max_depth = max_depth
+        self.history = history
+        self.jobs = OrderedDict()
+        self.queue = None
+        self.tasks = []
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_depth)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def submit(self, kind, source, payload=None):
+        job = Job(kind, source, payload)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Ingestion queue is full ({self.max_depth} pending jobs).")
+        self.jobs[job.id] = job
+        self._trim()
+        return job
+
+    # Forget the oldest finished jobs once history is exceeded
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at]
+        for job_id in finished[:max(0, len(self.jobs) - self.history)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        return [job.to_dict() for job in reversed(self.jobs.values())]
+
+    def depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            job.start()
+            try:
+                with use_trace(job.trace_id), span("job", kind=job.kind, queued_seconds=round(job.started_at - job.created_at, 3)):
+                    if asyncio.iscoroutinefunction(self.handler):
+                        result = await self.handler(job)
+                    else:
+                        result = await asyncio.to_thread(self.handler, job)
+                job.finish(result=result)
+            except Exception as e:
+                print(f"Job {job.id} failed: {e}")
+                job.finish(error=str(e))
+            finally:
+                job.payload = None
+                self.queue.task_done()
@@ -0,0 +1,102 @@
+import json
+from timeit import default_timer as timer
+
+
+class ExtractionStreamParser:
+    """Incremental parser for the extraction output `{"entities": [{...}, ...], "relationships": ["a|T|b", ...]}`.
+
+    Text is fed piece by piece as the model streams it; every entity object and relationship string is
+    yielded as ("entity", dict) / ("relationship", value) as soon as it closes. Anything before the first `{`
+    (e.g. a ```json fence) is ignored, and when the output is cut off the items completed so far have already
+    been yielded, so only the unfinished one is lost."""
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.started = False
+        self.complete = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.last_key = None
+        self.array = None
+        self.item_start = None
+        self.items = 0
+        self.entities = 0
+        self.relationships = 0
+        self.errors = 0
+        self.parse_seconds = 0.0
+
+    # Add the next piece of text and return the items it completed
+    def feed(self, piece):
+        start = timer()
+        self.text += piece
+        items = list(self._scan())
+        self.parse_seconds += timer() - start
+        return items
+
+    def _emit(self, start, end):
+        try:
+            value = json.loads(self.text[start:end])
+        except ValueError as e:
+            self.errors += 1
+            print(f"Skipping unparseable {self.array} item: {e}")
+            return None
+        if self.array == "entities" and isinstance(value, dict):
+            self.items += 1
+            self.entities += 1
+            return "entity", value
+        if self.array == "relationships":
+            self.items += 1
+            self.relationships += 1
+            return "relationship", value
+        return None
+
+    def _scan(self):
+        text = self.text
+        for i in range(self.pos, len(text)):
+            c = text[i]
+            if self.complete:
+                break
+            if not self.started:
+                if c == "{":
+                    self.started = True
+                    self.depth = 1
+                continue
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_key = text[self.string_start + 1:i]
+                    elif self.depth == 2 and self.array is not None:
+                        item = self._emit(self.string_start, i + 1)
+                        if item:
+                            yield item
+                continue
+            if c == '"':
+                self.in_string = True
+                self.string_start = i
+            elif c in "{[":
+                if self.depth == 1 and c == "[":
+                    self.array = self.last_key
+                elif self.depth == 2 and c == "{":
+                    self.item_start = i
+                self.depth += 1
+            elif c in "}]":
+                self.depth -= 1
+                if self.depth == 2 and c == "}" and self.item_start is not None:
+                    item = self._emit(self.item_start, i + 1)
+                    self.item_start = None
+                    if item:
+                        yield item
+                elif self.depth == 1:
+                    self.array = None
+                elif self.depth == 0:
+                    self.complete = True
+        self.pos = len(text)
+
@@ -0,0 +1,81 @@
+"""Load test of the upload pipeline against local stand-ins for Gemini and Neo4j.
+
+Compares the old request handling, where each upload ran the synchronous pipeline on the event loop
+(so concurrent uploads were served one after another), with the async pipeline serving them concurrently.
+
+    python load_test.py --uploads 20 --llm-latency 0.5 --db-latency 0.01
+"""
+import os
+import asyncio
+import argparse
+from timeit import default_timer as timer
+
+import neo4j
+from fakes import FakeGemini, FakeDriver, FakeAsyncDriver, FakeGraphData
+
+# The stand-ins must be in place before graph_construct creates its drivers at import time
+os.environ.setdefault("EXTRACTION_CACHE_PATH", "")
+os.environ.setdefault("EXTRACTION_CACHE_MEMORY_ENTRIES", "0")
+os.environ.setdefault("GEMINI_KEY", "load-test")
+graph_data = FakeGraphData()
+neo4j.GraphDatabase.driver = lambda *args, **kwargs: FakeDriver(data=graph_data)
+neo4j.AsyncGraphDatabase.driver = lambda *args, **kwargs: FakeAsyncDriver(data=graph_data)
+
+import graph_construct
+from rate_limiter import RateLimiter
+
+SAMPLE = "Alice Smith works at Acme Corporation. She developed Widget Engine with Bob Jones, who studied at State University. "
+
+
+def write_documents(directory, uploads, sentences):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(uploads):
+        path = os.path.join(directory, f"load_test_{i}.txt")
+        with open(path, "w") as f:
+            f.write(f"Document{i} Topic{i}. " + SAMPLE * sentences)
+        paths.append(path)
+    return paths
+
+
+# Old behaviour: the sync pipeline runs inside the request, blocking the loop for every other client
+async def blocking_upload(path):
+    graph_construct.construct_graph(path)
+    graph_construct.get_info()
+
+
+async def async_upload(path):
+    await graph_construct.aconstruct_graph(path)
+    await graph_construct.aget_info()
+
+
+async def run(upload, paths):
+    start = timer()
+    await asyncio.gather(*(upload(path) for path in paths))
+    return timer() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=20, help="concurrent uploads")
+    parser.add_argument("--sentences", type=int, default=20, help="sample sentences per document")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per fake Gemini call")
+    parser.add_argument("--db-latency", type=float, default=0.01, help="seconds per fake Neo4j query")
+    parser.add_argument("--directory", default="./load-test-content")
+    args = parser.parse_args()
+
+    graph_construct.GEMINI = FakeGemini(latency=args.llm_latency)
+    graph_construct.gemini_limiter = RateLimiter(10**6, 10**9)
+    graph_data.latency = args.db_latency
+    paths = write_documents(args.directory, args.uploads, args.sentences)
+
+    results = {}
+    for name, upload in [("blocking", blocking_upload), ("async", async_upload)]:
+        elapsed = asyncio.run(run(upload, paths))
+        results[name] = elapsed
+        print(f"{name:>8}: {args.uploads} uploads in {elapsed:.2f}s ({args.uploads / elapsed:.2f} uploads/sec)")
+    print(f"speedup: {results['blocking'] / results['async']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
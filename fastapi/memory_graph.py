@@ -0,0 +1,1711 @@
+import os
+import re
+import bisect
+import threading
+from array import array
+from collections import namedtuple, OrderedDict
+from graph_writer import COUNTER_FIELDS, normalize_search_text
+
+# Embedded graph store: an in-process alternative to Neo4j for small deployments, tests and benchmarks.
+# It understands the Cypher the application itself sends (UNWIND/MERGE ingestion, counts, schema and
+# index statements, full-text lookups) and the MATCH ... WHERE ... RETURN subset the QA prompt produces.
+
+# Upper bound for unbounded variable-length patterns such as -[*]->
+MEMORY_GRAPH_MAX_HOPS = int(os.getenv("MEMORY_GRAPH_MAX_HOPS", "10"))
+# Parsed queries kept for reuse; ingestion sends the same few UNWIND statements over and over
+MEMORY_GRAPH_PLAN_CACHE = int(os.getenv("MEMORY_GRAPH_PLAN_CACHE", "256"))
+
+AGGREGATES = {"count", "collect", "sum", "avg", "min", "max"}
+
+
+class CypherError(Exception):
+    """Invalid Cypher, or Cypher outside the subset the in-memory graph supports."""
+
+
+class Node:
+    __slots__ = ["idx"]
+
+    def __init__(self, idx):
+        self.idx = idx
+
+    def __eq__(self, other):
+        return isinstance(other, Node) and other.idx == self.idx
+
+    def __hash__(self):
+        return hash(("node", self.idx))
+
+
+class Rel:
+    __slots__ = ["idx"]
+
+    def __init__(self, idx):
+        self.idx = idx
+
+    def __eq__(self, other):
+        return isinstance(other, Rel) and other.idx == self.idx
+
+    def __hash__(self):
+        return hash(("rel", self.idx))
+
+
+### Parsing ###
+
+Token = namedtuple("Token", ["kind", "value", "start", "end"])
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+|//[^\n]*)
+  | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<quoted>`[^`]+`)
+  | (?P<number>\d+\.\d+(?:[eE][-+]?\d+)?|\d+)
+  | (?P<param>\$\w+)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op><>|!=|<=|>=|->|<-|=~|\+=|\.\.|[-+*/%^=<>()\[\]{}:,.|;])
+""", re.VERBOSE)
+
+STRING_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "\\": "\\", "'": "'", '"': '"'}
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = TOKEN_PATTERN.match(text, pos)
+        if not match:
+            raise CypherError(f"Unexpected character {text[pos]!r} at position {pos}")
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "string":
+            value = re.sub(r"\\(.)", lambda m: STRING_ESCAPES.get(m.group(1), m.group(1)), value[1:-1])
+        elif kind == "quoted":
+            value = value[1:-1]
+        elif kind == "number":
+            value = float(value) if "." in value or "e" in value.lower() else int(value)
+        elif kind == "param":
+            value = value[1:]
+        if kind != "space":
+            tokens.append(Token(kind, value, match.start(), match.end()))
+        pos = match.end()
+    return tokens
+
+
+# A node pattern (var, labels, {prop: expr}); a relationship pattern adds a direction ("out", "in" or "both")
+# and, for variable-length patterns, (min hops, max hops)
+NodePattern = namedtuple("NodePattern", ["var", "labels", "props"])
+RelPattern = namedtuple("RelPattern", ["var", "types", "props", "direction", "hops"])
+
+
+class Parser:
+    """Recursive-descent parser producing a list of clauses; expressions are nested tuples."""
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else None
+
+    def at_kw(self, *words):
+        for offset, word in enumerate(words):
+            token = self.peek(offset)
+            if token is None or token.kind != "ident" or token.value.upper() != word:
+                return False
+        return True
+
+    def accept_kw(self, *words):
+        if self.at_kw(*words):
+            self.pos += len(words)
+            return True
+        return False
+
+    def expect_kw(self, *words):
+        if not self.accept_kw(*words):
+            raise CypherError(f"Expected {' '.join(words)} at {self.describe()}")
+
+    def at_op(self, op, offset=0):
+        token = self.peek(offset)
+        return token is not None and token.kind == "op" and token.value == op
+
+    def accept_op(self, op):
+        if self.at_op(op):
+            self.pos += 1
+            return True
+        return False
+
+    def expect_op(self, op):
+        if not self.accept_op(op):
+            raise CypherError(f"Expected '{op}' at {self.describe()}")
+
+    def name(self):
+        token = self.peek()
+        if token is None or token.kind not in ("ident", "quoted"):
+            raise CypherError(f"Expected a name at {self.describe()}")
+        self.pos += 1
+        return token.value
+
+    def number(self):
+        token = self.peek()
+        if token is None or token.kind != "number":
+            raise CypherError(f"Expected a number at {self.describe()}")
+        self.pos += 1
+        return token.value
+
+    def describe(self):
+        token = self.peek()
+        return "end of query" if token is None else f"{token.value!r} (position {token.start})"
+
+    # Clauses
+
+    def parse_query(self):
+        clauses = []
+        while self.peek() is not None:
+            if not self.accept_op(";"):
+                clauses.append(self.parse_clause())
+        return clauses
+
+    def parse_clause(self):
+        if self.accept_kw("OPTIONAL", "MATCH"):
+            return self.parse_match(optional=True)
+        if self.accept_kw("MATCH"):
+            return self.parse_match(optional=False)
+        if self.accept_kw("UNWIND"):
+            expr = self.parse_expr()
+            self.expect_kw("AS")
+            return ("unwind", expr, self.name())
+        if self.accept_kw("MERGE"):
+            pattern = self.parse_pattern()
+            on_create, on_match = [], []
+            while self.at_kw("ON"):
+                if self.accept_kw("ON", "CREATE", "SET"):
+                    on_create += self.parse_set_items()
+                else:
+                    self.expect_kw("ON", "MATCH", "SET")
+                    on_match += self.parse_set_items()
+            return ("merge", pattern, on_create, on_match)
+        if self.accept_kw("CREATE"):
+            return ("create", self.parse_patterns())
+        if self.accept_kw("SET"):
+            return ("set", self.parse_set_items())
+        if self.accept_kw("DETACH", "DELETE"):
+            return ("delete", self.parse_expr_list(), True)
+        if self.accept_kw("DELETE"):
+            return ("delete", self.parse_expr_list(), False)
+        if self.accept_kw("WITH"):
+            projection = self.parse_projection()
+            where = self.parse_expr() if self.accept_kw("WHERE") else None
+            return ("with", projection, where)
+        if self.accept_kw("RETURN"):
+            return ("return", self.parse_projection())
+        if self.accept_kw("CALL"):
+            if self.accept_op("{"):
+                clauses = []
+                while not self.accept_op("}"):
+                    if self.peek() is None:
+                        raise CypherError("Unterminated CALL { ... } subquery")
+                    clauses.append(self.parse_clause())
+                # batching is irrelevant in memory
+                if self.accept_kw("IN", "TRANSACTIONS"):
+                    if self.accept_kw("OF"):
+                        self.number()
+                        self.accept_kw("ROWS") or self.accept_kw("ROW")
+                return ("subquery", clauses)
+            return self.parse_call()
+        if self.accept_kw("SHOW"):
+            words = []
+            while not (self.at_kw("YIELD") or self.at_kw("WHERE") or self.peek() is None or self.at_op(";")):
+                words.append(self.name().upper())
+            yields = self.parse_yield()
+            where = self.parse_expr() if self.accept_kw("WHERE") else None
+            return ("show", words, yields, where)
+        if self.at_kw("UNION"):
+            raise CypherError("UNION is not supported")
+        raise CypherError(f"Unsupported clause at {self.describe()}")
+
+    def parse_match(self, optional):
+        patterns = self.parse_patterns()
+        where = self.parse_expr() if self.accept_kw("WHERE") else None
+        return ("match", patterns, where, optional)
+
+    def parse_call(self):
+        name = self.name()
+        while self.accept_op("."):
+            name += "." + self.name()
+        args = []
+        if self.accept_op("("):
+            if not self.accept_op(")"):
+                args = self.parse_expr_list()
+                self.expect_op(")")
+        yields = self.parse_yield()
+        where = self.parse_expr() if self.accept_kw("WHERE") else None
+        return ("call", name.lower(), args, yields, where)
+
+    def parse_yield(self):
+        if not self.accept_kw("YIELD"):
+            return None
+        if self.accept_op("*"):
+            return None
+        yields = []
+        while True:
+            field = self.name()
+            alias = self.name() if self.accept_kw("AS") else field
+            yields.append((field, alias))
+            if not self.accept_op(","):
+                return yields
+
+    def parse_projection(self):
+        distinct = self.accept_kw("DISTINCT")
+        items = []
+        if self.accept_op("*"):
+            items = "*"
+        else:
+            while True:
+                start = self.peek().start if self.peek() else len(self.text)
+                expr = self.parse_expr()
+                end = self.tokens[self.pos - 1].end
+                name = self.name() if self.accept_kw("AS") else self.text[start:end]
+                items.append((expr, name))
+                if not self.accept_op(","):
+                    break
+        order = []
+        if self.accept_kw("ORDER", "BY"):
+            while True:
+                expr = self.parse_expr()
+                descending = False
+                if self.accept_kw("DESC") or self.accept_kw("DESCENDING"):
+                    descending = True
+                else:
+                    self.accept_kw("ASC") or self.accept_kw("ASCENDING")
+                order.append((expr, descending))
+                if not self.accept_op(","):
+                    break
+        skip = self.parse_expr() if self.accept_kw("SKIP") else None
+        limit = self.parse_expr() if self.accept_kw("LIMIT") else None
+        return {"distinct": distinct, "items": items, "order": order, "skip": skip, "limit": limit}
+
+    def parse_set_items(self):
+        items = []
+        while True:
+            var = self.name()
+            if self.accept_op("."):
+                key = self.name()
+                self.expect_op("=")
+                items.append(("prop", var, key, self.parse_expr()))
+            elif self.accept_op("+="):
+                items.append(("merge_map", var, self.parse_expr()))
+            elif self.accept_op("="):
+                items.append(("replace_map", var, self.parse_expr()))
+            elif self.at_op(":"):
+                labels = []
+                while self.accept_op(":"):
+                    labels.append(self.name())
+                items.append(("label", var, labels))
+            else:
+                raise CypherError(f"Unsupported SET item at {self.describe()}")
+            if not self.accept_op(","):
+                return items
+
+    # Patterns
+
+    def parse_patterns(self):
+        patterns = [self.parse_pattern()]
+        while self.accept_op(","):
+            patterns.append(self.parse_pattern())
+        return patterns
+
+    def parse_pattern(self):
+        if self.peek(1) is not None and self.peek().kind == "ident" and self.at_op("=", 1):
+            raise CypherError("Path variables are not supported")
+        elements = [self.parse_node()]
+        while self.at_op("-") or self.at_op("<-"):
+            elements.append(self.parse_rel())
+            elements.append(self.parse_node())
+        return elements
+
+    # A parenthesized node followed by a relationship, e.g. `(n)-[:KNOWS]->()` used as an expression
+    def at_pattern(self):
+        if not self.at_op("("):
+            return False
+        if self.at_op(":", 1) or self.at_op(")", 1):
+            return True
+        depth = 0
+        for offset in range(len(self.tokens) - self.pos):
+            if self.at_op("(", offset):
+                depth += 1
+            elif self.at_op(")", offset):
+                depth -= 1
+                if not depth:
+                    break
+        else:
+            return False
+        if self.at_op("->", offset + 1) or self.at_op("<-", offset + 1):
+            return True
+        return self.at_op("-", offset + 1) and any(self.at_op(op, offset + 2) for op in ("[", "-", "->"))
+
+    def parse_node(self):
+        self.expect_op("(")
+        var = None
+        if self.peek() is not None and self.peek().kind in ("ident", "quoted"):
+            var = self.name()
+        labels = []
+        while self.accept_op(":"):
+            labels.append(self.name())
+        props = self.parse_map() if self.at_op("{") else {}
+        self.expect_op(")")
+        return NodePattern(var, labels, props)
+
+    def parse_rel(self):
+        incoming = self.accept_op("<-")
+        if not incoming:
+            self.expect_op("-")
+        var, types, props, hops = None, [], {}, None
+        if self.accept_op("["):
+            if self.peek() is not None and self.peek().kind in ("ident", "quoted"):
+                var = self.name()
+            if self.accept_op(":"):
+                types.append(self.name())
+                while self.accept_op("|"):
+                    self.accept_op(":")
+                    types.append(self.name())
+            if self.accept_op("*"):
+                low, high = 1, MEMORY_GRAPH_MAX_HOPS
+                if self.peek() is not None and self.peek().kind == "number":
+                    low = high = self.number()
+                if self.accept_op(".."):
+                    high = self.number() if self.peek() is not None and self.peek().kind == "number" else MEMORY_GRAPH_MAX_HOPS
+                hops = (low, high)
+            if self.at_op("{"):
+                props = self.parse_map()
+            self.expect_op("]")
+        outgoing = self.accept_op("->")
+        if not outgoing:
+            self.expect_op("-")
+        direction = "both" if incoming == outgoing else ("in" if incoming else "out")
+        return RelPattern(var, types, props, direction, hops)
+
+    def parse_map(self):
+        self.expect_op("{")
+        entries = {}
+        if self.accept_op("}"):
+            return entries
+        while True:
+            key = self.name()
+            self.expect_op(":")
+            entries[key] = self.parse_expr()
+            if not self.accept_op(","):
+                break
+        self.expect_op("}")
+        return entries
+
+    # Expressions
+
+    def parse_expr_list(self):
+        exprs = [self.parse_expr()]
+        while self.accept_op(","):
+            exprs.append(self.parse_expr())
+        return exprs
+
+    def parse_expr(self):
+        left = self.parse_xor()
+        while self.accept_kw("OR"):
+            left = ("op", "OR", left, self.parse_xor())
+        return left
+
+    def parse_xor(self):
+        left = self.parse_and()
+        while self.accept_kw("XOR"):
+            left = ("op", "XOR", left, self.parse_and())
+        return left
+
+    def parse_and(self):
+        left = self.parse_not()
+        while self.accept_kw("AND"):
+            left = ("op", "AND", left, self.parse_not())
+        return left
+
+    def parse_not(self):
+        if self.accept_kw("NOT"):
+            return ("not", self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left = self.parse_additive()
+        while True:
+            token = self.peek()
+            if token is not None and token.kind == "op" and token.value in ("=", "<>", "!=", "<", ">", "<=", ">=", "=~"):
+                self.pos += 1
+                left = ("op", "<>" if token.value == "!=" else token.value, left, self.parse_additive())
+            elif self.accept_kw("CONTAINS"):
+                left = ("op", "CONTAINS", left, self.parse_additive())
+            elif self.accept_kw("STARTS", "WITH"):
+                left = ("op", "STARTS WITH", left, self.parse_additive())
+            elif self.accept_kw("ENDS", "WITH"):
+                left = ("op", "ENDS WITH", left, self.parse_additive())
+            elif self.accept_kw("IN"):
+                left = ("op", "IN", left, self.parse_additive())
+            elif self.accept_kw("IS", "NOT", "NULL"):
+                left = ("isnull", left, True)
+            elif self.accept_kw("IS", "NULL"):
+                left = ("isnull", left, False)
+            else:
+                return left
+
+    def parse_additive(self):
+        left = self.parse_multiplicative()
+        while self.at_op("+") or self.at_op("-"):
+            op = self.peek().value
+            self.pos += 1
+            left = ("op", op, left, self.parse_multiplicative())
+        return left
+
+    def parse_multiplicative(self):
+        left = self.parse_unary()
+        while self.at_op("*") or self.at_op("/") or self.at_op("%") or self.at_op("^"):
+            op = self.peek().value
+            self.pos += 1
+            left = ("op", op, left, self.parse_unary())
+        return left
+
+    def parse_unary(self):
+        if self.accept_op("-"):
+            return ("neg", self.parse_unary())
+        self.accept_op("+")
+        return self.parse_postfix()
+
+    def parse_postfix(self):
+        expr = self.parse_atom()
+        while True:
+            if self.at_op(".") and not self.at_op("..") and self.peek(1) is not None and self.peek(1).kind in ("ident", "quoted"):
+                self.pos += 1
+                expr = ("prop", expr, self.name())
+            elif self.accept_op("["):
+                low = None if self.at_op("..") else self.parse_expr()
+                if self.accept_op(".."):
+                    high = None if self.at_op("]") else self.parse_expr()
+                    expr = ("slice", expr, low, high)
+                else:
+                    expr = ("index", expr, low)
+                self.expect_op("]")
+            elif self.at_op(":") and expr[0] == "var":
+                labels = []
+                while self.accept_op(":"):
+                    labels.append(self.name())
+                expr = ("haslabel", expr, labels)
+            else:
+                return expr
+
+    def parse_atom(self):
+        token = self.peek()
+        if token is None:
+            raise CypherError("Unexpected end of query")
+        if token.kind in ("string", "number"):
+            self.pos += 1
+            return ("lit", token.value)
+        if token.kind == "param":
+            self.pos += 1
+            return ("param", token.value)
+        if token.kind == "op":
+            if self.at_pattern():
+                raise CypherError(f"Pattern expressions are not supported (position {token.start}), MATCH the pattern instead")
+            if self.accept_op("("):
+                expr = self.parse_expr()
+                self.expect_op(")")
+                return expr
+            if self.accept_op("["):
+                return self.parse_list()
+            if self.at_op("{"):
+                return ("map", self.parse_map())
+            raise CypherError(f"Unexpected {token.value!r} at position {token.start}")
+        word = token.value.upper() if token.kind == "ident" else None
+        if word in ("EXISTS", "COUNT", "COLLECT") and self.at_op("{", 1):
+            raise CypherError(f"{word} {{ ... }} subqueries are not supported")
+        if word in ("TRUE", "FALSE"):
+            self.pos += 1
+            return ("lit", word == "TRUE")
+        if word == "NULL":
+            self.pos += 1
+            return ("lit", None)
+        if word == "CASE":
+            self.pos += 1
+            return self.parse_case()
+        # function call, possibly namespaced (e.g. apoc.text.join)
+        end = 0
+        while self.at_op(".", end + 1) and self.peek(end + 2) is not None and self.peek(end + 2).kind == "ident":
+            end += 2
+        if token.kind == "ident" and self.at_op("(", end + 1):
+            name = "".join(str(t.value) for t in self.tokens[self.pos:self.pos + end + 1]).lower()
+            self.pos += end + 2
+            if name == "count" and self.accept_op("*"):
+                self.expect_op(")")
+                return ("count_star",)
+            distinct = self.accept_kw("DISTINCT")
+            args = [] if self.at_op(")") else self.parse_expr_list()
+            self.expect_op(")")
+            return ("call", name, args, distinct)
+        self.pos += 1
+        return ("var", token.value)
+
+    def parse_list(self):
+        if self.peek() is not None and self.peek().kind == "ident" and self.peek(1) is not None \
+                and self.peek(1).kind == "ident" and self.peek(1).value.upper() == "IN":
+            var = self.name()
+            self.expect_kw("IN")
+            source = self.parse_expr()
+            where = self.parse_expr() if self.accept_kw("WHERE") else None
+            projection = self.parse_expr() if self.accept_op("|") else None
+            self.expect_op("]")
+            return ("listcomp", var, source, where, projection)
+        items = []
+        if not self.accept_op("]"):
+            items = self.parse_expr_list()
+            self.expect_op("]")
+        return ("list", items)
+
+    def parse_case(self):
+        subject = None if self.at_kw("WHEN") else self.parse_expr()
+        branches = []
+        while self.accept_kw("WHEN"):
+            condition = self.parse_expr()
+            self.expect_kw("THEN")
+            branches.append((condition, self.parse_expr()))
+        default = self.parse_expr() if self.accept_kw("ELSE") else None
+        self.expect_kw("END")
+        return ("case", subject, branches, default)
+
+
+def contains_aggregate(expr):
+    if not isinstance(expr, tuple):
+        return False
+    if expr[0] == "count_star" or (expr[0] == "call" and expr[1] in AGGREGATES):
+        return True
+    for part in expr[1:]:
+        if isinstance(part, tuple) and contains_aggregate(part):
+            return True
+        if isinstance(part, list) and any(contains_aggregate(p) for p in part if isinstance(p, tuple)):
+            return True
+        if isinstance(part, dict) and any(contains_aggregate(p) for p in part.values()):
+            return True
+    return False
+
+
+def references_variables(expr):
+    if not isinstance(expr, tuple):
+        return False
+    if expr[0] in ("var", "listcomp"):
+        return True
+    for part in expr[1:]:
+        if isinstance(part, tuple) and references_variables(part):
+            return True
+        if isinstance(part, list) and any(references_variables(p) for p in part if isinstance(p, tuple)):
+            return True
+        if isinstance(part, dict) and any(references_variables(p) for p in part.values()):
+            return True
+    return False
+
+
+def conjuncts(expr):
+    if expr is None:
+        return []
+    if expr[0] == "op" and expr[1] == "AND":
+        return conjuncts(expr[2]) + conjuncts(expr[3])
+    return [expr]
+
+
+def pattern_variables(patterns):
+    names = []
+    for pattern in patterns:
+        for element in pattern:
+            if element.var and element.var not in names:
+                names.append(element.var)
+    return names
+
+
+### Values ###
+
+def truthy(value):
+    return value is True
+
+
+def hashable(value):
+    if isinstance(value, list):
+        return ("list",) + tuple(hashable(v) for v in value)
+    if isinstance(value, dict):
+        return ("map",) + tuple(sorted((k, hashable(v)) for k, v in value.items()))
+    return value
+
+
+TYPE_ORDER = {dict: 0, Node: 1, Rel: 2, list: 3, str: 4, bool: 5, int: 6, float: 6}
+
+
+def sort_key(value):
+    if value is None:
+        return (9, 0)
+    rank = TYPE_ORDER.get(type(value), 8)
+    if rank in (0, 1, 2, 3, 8):
+        return (rank, str(hashable(value)))
+    return (rank, value)
+
+
+def compare(op, a, b):
+    if a is None or b is None:
+        return None
+    if op == "=":
+        return a == b
+    if op == "<>":
+        return a != b
+    try:
+        if op == "<":
+            return a < b
+        if op == ">":
+            return a > b
+        if op == "<=":
+            return a <= b
+        if op == ">=":
+            return a >= b
+    except TypeError:
+        return None
+
+
+def arithmetic(op, a, b):
+    if a is None or b is None:
+        return None
+    if op == "+":
+        if isinstance(a, list):
+            return a + (b if isinstance(b, list) else [b])
+        if isinstance(b, list):
+            return [a] + b
+        if isinstance(a, str) or isinstance(b, str):
+            return f"{to_string(a)}{to_string(b)}"
+        return a + b
+    if op == "-":
+        return a - b
+    if op == "*":
+        return a * b
+    if op == "/":
+        if isinstance(a, int) and isinstance(b, int):
+            return int(a / b)
+        return a / b
+    if op == "%":
+        return a % b
+    if op == "^":
+        return float(a) ** b
+    raise CypherError(f"Unsupported operator {op}")
+
+
+def to_string(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def to_number(value, kind):
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return kind(float(value)) if kind is int else kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def string_function(fn):
+    return lambda graph, value, *args: None if value is None else fn(str(value), *args)
+
+
+FUNCTIONS = {
+    "tolower": string_function(str.lower),
+    "toupper": string_function(str.upper),
+    "lower": string_function(str.lower),
+    "upper": string_function(str.upper),
+    "trim": string_function(str.strip),
+    "ltrim": string_function(str.lstrip),
+    "rtrim": string_function(str.rstrip),
+    "reverse": lambda graph, value: None if value is None else value[::-1],
+    "replace": lambda graph, value, old, new: None if value is None else str(value).replace(old, new),
+    "split": lambda graph, value, sep: None if value is None else str(value).split(sep),
+    "substring": lambda graph, value, start, length=None: None if value is None else str(value)[start:None if length is None else start + length],
+    "left": lambda graph, value, n: None if value is None else str(value)[:n],
+    "right": lambda graph, value, n: None if value is None else str(value)[-n:] if n else "",
+    "tostring": lambda graph, value: to_string(value),
+    "tointeger": lambda graph, value: to_number(value, int),
+    "tofloat": lambda graph, value: to_number(value, float),
+    "size": lambda graph, value: None if value is None else len(value),
+    "length": lambda graph, value: None if value is None else len(value),
+    "coalesce": lambda graph, *values: next((v for v in values if v is not None), None),
+    "head": lambda graph, value: value[0] if value else None,
+    "last": lambda graph, value: value[-1] if value else None,
+    "tail": lambda graph, value: None if value is None else value[1:],
+    "range": lambda graph, start, end, step=1: list(range(start, end + (1 if step > 0 else -1), step)),
+    "abs": lambda graph, value: None if value is None else abs(value),
+    "round": lambda graph, value, digits=0: None if value is None else (round(value, digits) if digits else float(round(value))),
+    "ceil": lambda graph, value: None if value is None else float(-(-value // 1)),
+    "floor": lambda graph, value: None if value is None else float(value // 1),
+    "sqrt": lambda graph, value: None if value is None else value ** 0.5,
+    "exists": lambda graph, value: value is not None,
+    "labels": lambda graph, node: None if node is None else list(graph.node_labels[node.idx]),
+    "type": lambda graph, rel: None if rel is None else graph.types[graph.rel_type[rel.idx]],
+    "id": lambda graph, entity: None if entity is None else entity.idx,
+    "elementid": lambda graph, entity: None if entity is None else str(entity.idx),
+    "keys": lambda graph, entity: None if entity is None else list(graph.properties(entity)),
+    "properties": lambda graph, entity: None if entity is None else dict(graph.properties(entity)),
+    "startnode": lambda graph, rel: None if rel is None else Node(graph.rel_src[rel.idx]),
+    "endnode": lambda graph, rel: None if rel is None else Node(graph.rel_tgt[rel.idx]),
+}
+
+
+# A full-text query term `[field:][*]word[*]` as (field, normalized word, leading wildcard, trailing wildcard)
+def parse_text_term(text):
+    field, _, word = text.rpartition(":")
+    return field, normalize_search_text(word.strip("*")), word.startswith("*"), word.endswith("*")
+
+
+# Whether an indexed word ("word" or "field:word") matches a parsed term
+def text_word_matches(indexed, term):
+    field, word, leading, trailing = term
+    indexed_field, _, indexed = indexed.rpartition(":")
+    if indexed_field != field:
+        return False
+    if leading:
+        return word in indexed if trailing else indexed.endswith(word)
+    return indexed.startswith(word) if trailing else indexed == word
+
+
+### Storage ###
+
+class MemoryGraph:
+    """In-memory property graph. Relationships live in parallel arrays (source, target, type code) with
+    per-node outgoing/incoming adjacency lists of relationship numbers; nodes are found through a label
+    index and an (label, id) index. Deleted entries are tombstoned, so numbers stay stable.
+    All queries run under one lock, which also makes every query atomic with respect to the others."""
+
+    def __init__(self):
+        self.node_labels = []
+        self.node_props = []
+        self.node_alive = bytearray()
+        self.out_rels = []
+        self.in_rels = []
+        self.rel_src = array("q")
+        self.rel_tgt = array("q")
+        self.rel_type = array("q")
+        self.rel_props = []
+        self.rel_alive = bytearray()
+        self.types = []
+        self.type_codes = {}
+        self.type_counts = {}
+        self.label_index = {}
+        self.id_index = {}
+        self.id_nodes = {}
+        self.edge_index = {}
+        self.patterns = {}
+        self.indexes = {}
+        self.text_postings = {}
+        self.text_words = {}
+        self.text_vocabulary = {}
+        self.node_count = 0
+        self.rel_count = 0
+        self.plans = OrderedDict()
+        self.lock = threading.RLock()
+
+    # Nodes
+
+    def _index_id(self, idx, labels, entity_id, add):
+        if entity_id is None:
+            return
+        nodes = self.id_nodes.setdefault(hashable(entity_id), {})
+        if add:
+            nodes[idx] = None
+        else:
+            nodes.pop(idx, None)
+            if not nodes:
+                del self.id_nodes[hashable(entity_id)]
+        for label in labels:
+            key = (label, hashable(entity_id))
+            if add:
+                self.id_index[key] = idx
+            elif self.id_index.get(key) == idx:
+                del self.id_index[key]
+
+    # Full-text indexes are inverted (normalized word -> nodes), so queries only touch the nodes they match.
+    # Every word is indexed as is and qualified by its property ("name:smith"), for field-restricted queries.
+    def _index_text(self, idx, names=None):
+        for name in names if names is not None else list(self.text_postings):
+            index = self.indexes[name]
+            postings, node_words = self.text_postings[name], self.text_words[name]
+            for word in node_words.pop(idx, ()):
+                postings[word].pop(idx, None)
+                if not postings[word]:
+                    del postings[word]
+                    self.text_vocabulary[name] = None
+            if not self.node_alive[idx] or not any(label in self.node_labels[idx] for label in index["labelsOrTypes"]):
+                continue
+            props = self.node_props[idx]
+            words = set()
+            for prop in index["properties"]:
+                if props.get(prop) is not None:
+                    prop_words = normalize_search_text(props[prop]).split()
+                    words.update(prop_words)
+                    words.update(f"{prop}:{word}" for word in prop_words)
+            if words:
+                node_words[idx] = words
+            for word in words:
+                if word not in postings:
+                    postings[word] = {}
+                    self.text_vocabulary[name] = None
+                postings[word][idx] = None
+
+    def _text_indexes_on(self, key):
+        return [name for name in self.text_postings if key in self.indexes[name]["properties"]]
+
+    def create_node(self, labels, props, counters):
+        idx = len(self.node_labels)
+        labels = tuple(dict.fromkeys(labels))
+        props = {k: v for k, v in props.items() if v is not None}
+        self.node_labels.append(labels)
+        self.node_props.append(props)
+        self.node_alive.append(1)
+        self.out_rels.append([])
+        self.in_rels.append([])
+        for label in labels:
+            self.label_index.setdefault(label, {})[idx] = None
+        self._index_id(idx, labels, props.get("id"), True)
+        self._index_text(idx)
+        self.node_count += 1
+        counters["nodes_created"] += 1
+        counters["labels_added"] += len(labels)
+        counters["properties_set"] += len(props)
+        return idx
+
+    def add_labels(self, idx, labels, counters):
+        new = [label for label in labels if label not in self.node_labels[idx]]
+        if new:
+            self.node_labels[idx] += tuple(new)
+            for label in new:
+                self.label_index.setdefault(label, {})[idx] = None
+            self._index_id(idx, new, self.node_props[idx].get("id"), True)
+            self._index_text(idx)
+            counters["labels_added"] += len(new)
+
+    def set_node_prop(self, idx, key, value, counters):
+        props = self.node_props[idx]
+        if key == "id":
+            self._index_id(idx, self.node_labels[idx], props.get("id"), False)
+        if value is None:
+            props.pop(key, None)
+        else:
+            props[key] = value
+        if key == "id":
+            self._index_id(idx, self.node_labels[idx], value, True)
+        names = self._text_indexes_on(key)
+        if names:
+            self._index_text(idx, names)
+        counters["properties_set"] += 1
+
+    def delete_node(self, idx, detach, counters):
+        if not self.node_alive[idx]:
+            return
+        attached = [r for r in self.out_rels[idx] + self.in_rels[idx] if self.rel_alive[r]]
+        if attached and not detach:
+            raise CypherError(f"Cannot delete node {idx}, it still has relationships; use DETACH DELETE")
+        for r in attached:
+            self.delete_rel(r, counters)
+        self._index_id(idx, self.node_labels[idx], self.node_props[idx].get("id"), False)
+        for label in self.node_labels[idx]:
+            self.label_index[label].pop(idx, None)
+            if not self.label_index[label]:
+                del self.label_index[label]
+        self.node_alive[idx] = 0
+        self.node_props[idx] = {}
+        self._index_text(idx)
+        self.node_count -= 1
+        counters["nodes_deleted"] += 1
+
+    def nodes_with_id(self, labels, entity_id):
+        if labels:
+            idx = self.id_index.get((labels[0], hashable(entity_id)))
+            return [] if idx is None else [idx]
+        return list(self.id_nodes.get(hashable(entity_id), {}))
+
+    # Relationships
+
+    def _pattern_keys(self, src, code, tgt):
+        rs_type = self.types[code]
+        return [(s, rs_type, t) for s in self.node_labels[src] for t in self.node_labels[tgt]]
+
+    def create_rel(self, src, rs_type, tgt, props, counters):
+        code = self.type_codes.get(rs_type)
+        if code is None:
+            code = self.type_codes[rs_type] = len(self.types)
+            self.types.append(rs_type)
+        idx = len(self.rel_src)
+        self.rel_src.append(src)
+        self.rel_tgt.append(tgt)
+        self.rel_type.append(code)
+        props = {k: v for k, v in props.items() if v is not None}
+        self.rel_props.append(props)
+        self.rel_alive.append(1)
+        self.out_rels[src].append(idx)
+        self.in_rels[tgt].append(idx)
+        self.edge_index.setdefault((src, code, tgt), idx)
+        self.type_counts[rs_type] = self.type_counts.get(rs_type, 0) + 1
+        for key in self._pattern_keys(src, code, tgt):
+            self.patterns[key] = self.patterns.get(key, 0) + 1
+        self.rel_count += 1
+        counters["relationships_created"] += 1
+        counters["properties_set"] += len(props)
+        return idx
+
+    def delete_rel(self, idx, counters):
+        if not self.rel_alive[idx]:
+            return
+        src, tgt, code = self.rel_src[idx], self.rel_tgt[idx], self.rel_type[idx]
+        self.rel_alive[idx] = 0
+        self.out_rels[src].remove(idx)
+        self.in_rels[tgt].remove(idx)
+        if self.edge_index.get((src, code, tgt)) == idx:
+            del self.edge_index[(src, code, tgt)]
+            for other in self.out_rels[src]:
+                if self.rel_tgt[other] == tgt and self.rel_type[other] == code:
+                    self.edge_index[(src, code, tgt)] = other
+                    break
+        rs_type = self.types[code]
+        self.type_counts[rs_type] -= 1
+        if not self.type_counts[rs_type]:
+            del self.type_counts[rs_type]
+        for key in self._pattern_keys(src, code, tgt):
+            self.patterns[key] -= 1
+            if not self.patterns[key]:
+                del self.patterns[key]
+        self.rel_props[idx] = {}
+        self.rel_count -= 1
+        counters["relationships_deleted"] += 1
+
+    def properties(self, entity):
+        if isinstance(entity, Node):
+            return self.node_props[entity.idx]
+        if isinstance(entity, Rel):
+            return self.rel_props[entity.idx]
+        if isinstance(entity, dict):
+            return entity
+        raise CypherError(f"Expected a node, relationship or map, got {entity!r}")
+
+    # Queries
+
+    def plan(self, query):
+        with self.lock:
+            clauses = self.plans.get(query)
+            if clauses is not None:
+                self.plans.move_to_end(query)
+                return clauses
+        clauses = Parser(query).parse_query()
+        with self.lock:
+            self.plans[query] = clauses
+            while len(self.plans) > MEMORY_GRAPH_PLAN_CACHE:
+                self.plans.popitem(last=False)
+        return clauses
+
+    def run(self, query, params=None):
+        """Execute one Cypher statement. Returns (column names, rows as dicts of raw values, counters)."""
+        admin = ADMIN_STATEMENT.match(query)
+        count = NODE_COUNT.match(query) or RELATIONSHIP_COUNT.match(query)
+        with self.lock:
+            if admin:
+                return [], [], self.run_admin(query)
+            if count:
+                return self.count_store(count)
+            execution = Execution(self, params or {})
+            rows = execution.run(self.plan(query))
+            return execution.columns, rows, execution.counters
+
+    def query(self, query, params=None):
+        """Execute a statement and return its records as plain dicts, the way Neo4jGraph.query does."""
+        columns, rows, counters = self.run(query, params)
+        return [{column: self.export(row[column]) for column in columns} for row in rows]
+
+    # Nodes as property maps and relationships as (start properties, type, end properties), like neo4j's Record.data()
+    def export(self, value):
+        if isinstance(value, Node):
+            return dict(self.node_props[value.idx])
+        if isinstance(value, Rel):
+            idx = value.idx
+            return (dict(self.node_props[self.rel_src[idx]]), self.types[self.rel_type[idx]], dict(self.node_props[self.rel_tgt[idx]]))
+        if isinstance(value, list):
+            return [self.export(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self.export(v) for k, v in value.items()}
+        return value
+
+    # Whole-graph and per-label/type counts are kept up to date, like Neo4j's count store
+    def count_store(self, match):
+        var, name, alias = match.group("var"), match.group("name"), match.group("alias")
+        if match.re is NODE_COUNT:
+            value = len(self.label_index.get(name, {})) if name else self.node_count
+        else:
+            value = self.type_counts.get(name, 0) if name else self.rel_count
+        column = alias or f"count({var})"
+        return [column], [{column: value}], {field: 0 for field in COUNTER_FIELDS}
+
+    # Schema and index statements: indexes are recorded (and used by full-text queries), lookups by id always use the id index
+    def run_admin(self, query):
+        counters = {field: 0 for field in COUNTER_FIELDS}
+        words = query.split()
+        name_match = re.search(r"\b(?:INDEX|CONSTRAINT)\s+`?(\w+)`?", query, re.IGNORECASE)
+        name = name_match.group(1) if name_match and name_match.group(1).upper() not in ("IF", "FOR") else None
+        if words[0].upper() == "DROP":
+            if name not in self.indexes and not re.search(r"IF\s+EXISTS", query, re.IGNORECASE):
+                raise CypherError(f"No such index or constraint: {name}")
+            self.indexes.pop(name, None)
+            self.text_postings.pop(name, None)
+            self.text_words.pop(name, None)
+            self.text_vocabulary.pop(name, None)
+            return counters
+        target = re.search(r"FOR\s*\(\s*\w*\s*:\s*([^)]+?)\s*\)", query, re.IGNORECASE)
+        labels = [label.strip(" `") for label in re.split(r"[|:]", target.group(1))] if target else []
+        tail = re.split(r"\b(?:ON|REQUIRE)\b", query, flags=re.IGNORECASE)[-1]
+        properties = re.findall(r"\w+\.`?(\w+)`?", tail)
+        kind = "FULLTEXT" if re.search(r"\bFULLTEXT\b", query, re.IGNORECASE) else "RANGE"
+        name = name or f"index_{'_'.join(labels + properties)}"
+        if name in self.indexes:
+            if not re.search(r"IF\s+NOT\s+EXISTS", query, re.IGNORECASE):
+                raise CypherError(f"An index or constraint named {name} already exists")
+            return counters
+        self.indexes[name] = {
+            "name": name,
+            "type": kind,
+            "entityType": "NODE",
+            "labelsOrTypes": labels,
+            "properties": properties,
+            "state": "ONLINE",
+            "populationPercent": 100.0,
+            "constraint": bool(re.search(r"\bCONSTRAINT\b", query, re.IGNORECASE)),
+        }
+        if kind == "FULLTEXT":
+            self.text_postings[name], self.text_words[name], self.text_vocabulary[name] = {}, {}, None
+            nodes = {}
+            for label in labels:
+                nodes.update(self.label_index.get(label, {}))
+            for idx in nodes:
+                self._index_text(idx, [name])
+        return counters
+
+    # How many indexed words match a term, and those words, lazily. A term is (field, word, leading wildcard,
+    # trailing wildcard): a prefix is a range of the sorted vocabulary, found by bisection; a leading wildcard
+    # scans the vocabulary (of the field)
+    def _text_matching_words(self, name, term):
+        field, word, leading, trailing = term
+        postings = self.text_postings[name]
+        key = f"{field}:{word}" if field else word
+        if not leading and not trailing:
+            return (1, iter([key])) if key in postings else (0, iter(()))
+        vocabulary = self.text_vocabulary[name]
+        if vocabulary is None:
+            vocabulary = self.text_vocabulary[name] = sorted(postings)
+        start = key if not leading else f"{field}:" if field else ""
+        successor = start[:-1] + chr(ord(start[-1]) + 1) if start else None
+        positions = range(bisect.bisect_left(vocabulary, start), bisect.bisect_left(vocabulary, successor) if successor else len(vocabulary))
+        if not leading:
+            # an unqualified prefix range also holds qualified words ("na" < "name:..."), which are skipped
+            return len(positions), (vocabulary[position] for position in positions if text_word_matches(vocabulary[position], term))
+        words = [vocabulary[position] for position in positions if text_word_matches(vocabulary[position], term)]
+        return len(words), iter(words)
+
+    # Nodes of one `term AND term ...` alternative: the term with the fewest postings is looked up, the others
+    # are checked against the words of its nodes, so a broad term next to a selective one costs nothing extra
+    def _text_alternative(self, name, terms):
+        postings, node_words = self.text_postings[name], self.text_words[name]
+        candidates = []
+        for term in terms:
+            width, words = self._text_matching_words(name, term)
+            if not width:
+                return set()
+            candidates.append((width, term, words))
+        # narrowest vocabulary ranges first, so the cheapest term caps how far the broad ones are counted
+        candidates.sort(key=lambda candidate: candidate[0])
+        best, best_cost = None, None
+        for width, term, words in candidates:
+            matched, cost = [], 0
+            for word in words:
+                matched.append(word)
+                cost += len(postings[word])
+                if best_cost is not None and cost >= best_cost:
+                    break
+            if best_cost is None or cost < best_cost:
+                best, best_cost = (term, matched), cost
+        term, words = best
+        nodes = set()
+        for word in words:
+            nodes.update(postings[word])
+        rest = [t for t in terms if t != term]
+        return {idx for idx in nodes if all(any(text_word_matches(word, t) for word in node_words[idx]) for t in rest)}
+
+    def fulltext(self, index_name, query, options=None):
+        index = self.indexes.get(index_name)
+        if index is None or index["type"] != "FULLTEXT":
+            raise CypherError(f"There is no full-text index called {index_name}")
+        limit = (options or {}).get("limit")
+        matches = set()
+        for alternative in re.split(r"\s+OR\s+", query):
+            terms = [parse_text_term(t) for t in alternative.split() if t.upper() != "AND"]
+            terms = list(dict.fromkeys(term for term in terms if term[1]))
+            if terms:
+                matches |= self._text_alternative(index_name, terms)
+        hits = [{"node": Node(idx), "score": 1.0} for idx in sorted(matches)]
+        return hits if limit is None else hits[:limit]
+
+    def procedure(self, name, args):
+        if name == "db.labels":
+            return [{"label": label} for label in sorted(self.label_index)]
+        if name == "db.relationshiptypes":
+            return [{"relationshipType": rs_type} for rs_type in sorted(self.type_counts)]
+        if name in ("db.awaitindexes", "db.awaitindex", "db.clearquerycaches"):
+            return []
+        if name == "db.index.fulltext.querynodes":
+            return self.fulltext(*args)
+        raise CypherError(f"Unsupported procedure {name}")
+
+    def structured_schema(self, sample=100):
+        """Node/relationship property types and relationship patterns in the shape Neo4jGraph.structured_schema uses."""
+        with self.lock:
+            def property_types(samples):
+                types = {}
+                for props in samples:
+                    for key, value in props.items():
+                        types.setdefault(key, CYPHER_TYPES.get(type(value), "STRING"))
+                return [{"property": key, "type": t} for key, t in types.items()]
+
+            node_props = {
+                label: property_types(self.node_props[idx] for idx in list(nodes)[:sample])
+                for label, nodes in sorted(self.label_index.items())
+            }
+            rel_samples = {}
+            for idx in range(len(self.rel_src)):
+                if self.rel_alive[idx] and self.rel_props[idx]:
+                    rel_samples.setdefault(self.types[self.rel_type[idx]], []).append(self.rel_props[idx])
+            rel_props = {rs_type: property_types(samples[:sample]) for rs_type, samples in rel_samples.items()}
+            relationships = [{"start": s, "type": t, "end": e} for s, t, e in sorted(self.patterns)]
+            indexes = [dict(index) for index in self.indexes.values()]
+        return {
+            "node_props": node_props,
+            "rel_props": rel_props,
+            "relationships": relationships,
+            "metadata": {"constraint": [i for i in indexes if i["constraint"]], "index": [i for i in indexes if not i["constraint"]]},
+        }
+
+    def info(self):
+        with self.lock:
+            return {
+                "nodes": self.node_count,
+                "relationships": self.rel_count,
+                "labels": {label: len(nodes) for label, nodes in self.label_index.items()},
+                "relationship_types": dict(self.type_counts),
+                "indexes": sorted(self.indexes),
+            }
+
+
+CYPHER_TYPES = {str: "STRING", int: "INTEGER", float: "FLOAT", bool: "BOOLEAN", list: "LIST"}
+
+NODE_COUNT = re.compile(r"^\s*MATCH\s*\(\s*(?P<var>\w+)\s*(?::\s*`?(?P<name>\w+)`?)?\s*\)\s*RETURN\s+count\(\s*(?P=var)\s*\)(?:\s+AS\s+(?P<alias>\w+))?\s*;?\s*$", re.IGNORECASE)
+RELATIONSHIP_COUNT = re.compile(r"^\s*MATCH\s*\(\s*\)\s*-\s*\[\s*(?P<var>\w+)\s*(?::\s*`?(?P<name>\w+)`?)?\s*\]\s*->\s*\(\s*\)\s*RETURN\s+count\(\s*(?P=var)\s*\)(?:\s+AS\s+(?P<alias>\w+))?\s*;?\s*$", re.IGNORECASE)
+ADMIN_STATEMENT = re.compile(r"^\s*(?:CREATE|DROP)\s+(?:\w+\s+)?(?:INDEX|CONSTRAINT)\b", re.IGNORECASE)
+
+
+### Execution ###
+
+class Execution:
+    """One run of a parsed query: rows are dicts of variable name -> value, passed from clause to clause."""
+
+    def __init__(self, graph, params):
+        self.graph = graph
+        self.params = params
+        self.counters = {field: 0 for field in COUNTER_FIELDS}
+        self.columns = []
+
+    def run(self, clauses):
+        rows = [{}]
+        for i, clause in enumerate(clauses):
+            rows = getattr(self, "_" + clause[0])(clause, rows)
+            if clause[0] in ("call", "show") and i == len(clauses) - 1:
+                self.columns = list(rows[0]) if rows else []
+        return rows
+
+    # Clauses
+
+    def _match(self, clause, rows):
+        _, patterns, where, optional = clause
+        seeds = self.id_hints(where)
+        out = []
+        for env in rows:
+            matched = False
+            for candidate in self.match_patterns(patterns, env, seeds):
+                if where is None or truthy(self.eval(where, candidate)):
+                    out.append(candidate)
+                    matched = True
+            if optional and not matched:
+                out.append({**env, **{var: None for var in pattern_variables(patterns) if var not in env}})
+        return out
+
+    def _unwind(self, clause, rows):
+        _, expr, var = clause
+        out = []
+        for env in rows:
+            value = self.eval(expr, env)
+            if value is None:
+                continue
+            for item in value if isinstance(value, list) else [value]:
+                out.append({**env, var: item})
+        return out
+
+    def _merge(self, clause, rows):
+        _, pattern, on_create, on_match = clause
+        out = []
+        for env in rows:
+            matches = [match for match, used in self.match_chain(pattern, env, (), {})]
+            if matches:
+                for match in matches:
+                    self.apply_set(on_match, match)
+                    out.append(match)
+            else:
+                created = self.create_pattern(pattern, env)
+                self.apply_set(on_create, created)
+                out.append(created)
+        return out
+
+    def _create(self, clause, rows):
+        out = []
+        for env in rows:
+            for pattern in clause[1]:
+                env = self.create_pattern(pattern, env)
+            out.append(env)
+        return out
+
+    def _set(self, clause, rows):
+        for env in rows:
+            self.apply_set(clause[1], env)
+        return rows
+
+    def _delete(self, clause, rows):
+        _, exprs, detach = clause
+        for env in rows:
+            for expr in exprs:
+                value = self.eval(expr, env)
+                for entity in value if isinstance(value, list) else [value]:
+                    if isinstance(entity, Node):
+                        self.graph.delete_node(entity.idx, detach, self.counters)
+                    elif isinstance(entity, Rel):
+                        self.graph.delete_rel(entity.idx, self.counters)
+                    elif entity is not None:
+                        raise CypherError(f"Cannot delete {entity!r}")
+        return rows
+
+    def _with(self, clause, rows):
+        _, projection, where = clause
+        rows = self.project(projection, rows)
+        if where is not None:
+            rows = [env for env in rows if truthy(self.eval(where, env))]
+        return rows
+
+    def _return(self, clause, rows):
+        rows = self.project(clause[1], rows)
+        items = clause[1]["items"]
+        self.columns = [name for expr, name in items] if items != "*" else (list(rows[0]) if rows else [])
+        return rows
+
+    def _subquery(self, clause, rows):
+        inner = clause[1]
+        returns = bool(inner) and inner[-1][0] == "return"
+        out = []
+        for env in rows:
+            execution = Execution(self.graph, self.params)
+            execution.counters = self.counters
+            results = execution.run_from(inner, env)
+            if returns:
+                out.extend({**env, **row} for row in results)
+            else:
+                out.append(env)
+        return out
+
+    def run_from(self, clauses, env):
+        rows = [dict(env)]
+        for clause in clauses:
+            rows = getattr(self, "_" + clause[0])(clause, rows)
+        return rows
+
+    def _call(self, clause, rows):
+        _, name, args, yields, where = clause
+        out = []
+        for env in rows:
+            for record in self.graph.procedure(name, [self.eval(arg, env) for arg in args]):
+                fields = yields or [(key, key) for key in record]
+                candidate = {**env, **{alias: record.get(field) for field, alias in fields}}
+                if where is None or truthy(self.eval(where, candidate)):
+                    out.append(candidate)
+        return out
+
+    def _show(self, clause, rows):
+        _, words, yields, where = clause
+        if "CONSTRAINTS" in words:
+            records = [i for i in self.graph.indexes.values() if i["constraint"]]
+        elif "INDEXES" in words or "INDEX" in words:
+            kinds = {word for word in words if word in ("FULLTEXT", "RANGE")}
+            records = [i for i in self.graph.indexes.values() if not kinds or i["type"] in kinds]
+        else:
+            raise CypherError(f"Unsupported SHOW {' '.join(words)}")
+        out = []
+        for record in records:
+            fields = yields or [(key, key) for key in record if key != "constraint"]
+            candidate = {alias: record.get(field) for field, alias in fields}
+            if where is None or truthy(self.eval(where, candidate)):
+                out.append(candidate)
+        return out
+
+    # Pattern matching
+
+    def id_hints(self, where):
+        """Constant `var.id = x` / `var.id IN [...]` conditions of a WHERE, used to start matching from the id index."""
+        hints = {}
+        for condition in conjuncts(where):
+            if condition[0] != "op" or condition[1] not in ("=", "IN"):
+                continue
+            left, right = condition[2], condition[3]
+            if condition[1] == "=" and right[0] == "prop" and left[0] != "prop":
+                left, right = right, left
+            if left[0] != "prop" or left[1][0] != "var" or left[2] != "id" or references_variables(right):
+                continue
+            value = self.eval(right, {})
+            if condition[1] == "=":
+                hints[left[1][1]] = [value]
+            elif isinstance(value, list):
+                hints[left[1][1]] = value
+        return hints
+
+    def match_patterns(self, patterns, env, seeds, used=()):
+        if not patterns:
+            yield env
+            return
+        for matched, used_after in self.match_chain(patterns[0], env, used, seeds):
+            yield from self.match_patterns(patterns[1:], matched, seeds, used_after)
+
+    def start_cost(self, node, env, seeds):
+        if node.var and node.var in env:
+            return 0
+        if "id" in node.props or node.var in seeds:
+            return 1
+        return 2 if node.labels else 3
+
+    def match_chain(self, elements, env, used, seeds):
+        if len(elements) > 1 and self.start_cost(elements[-1], env, seeds) < self.start_cost(elements[0], env, seeds):
+            flipped = {"out": "in", "in": "out", "both": "both"}
+            elements = [e if isinstance(e, NodePattern) else e._replace(direction=flipped[e.direction]) for e in reversed(elements)]
+        for start in self.node_candidates(elements[0], env, seeds):
+            bound = dict(env)
+            if elements[0].var:
+                bound[elements[0].var] = Node(start)
+            yield from self.expand(elements, 1, start, bound, used)
+
+    def node_candidates(self, node, env, seeds):
+        graph = self.graph
+        if node.var and node.var in env:
+            value = env[node.var]
+            if isinstance(value, Node) and self.node_matches(value.idx, node, env):
+                yield value.idx
+            return
+        if "id" in node.props:
+            candidates = graph.nodes_with_id(node.labels, self.eval(node.props["id"], env))
+        elif node.var in seeds:
+            candidates = [idx for entity_id in seeds[node.var] for idx in graph.nodes_with_id(node.labels, entity_id)]
+        elif node.labels:
+            candidates = list(graph.label_index.get(node.labels[0], {}))
+        else:
+            candidates = [idx for idx in range(len(graph.node_alive)) if graph.node_alive[idx]]
+        for idx in candidates:
+            if self.node_matches(idx, node, env):
+                yield idx
+
+    def node_matches(self, idx, node, env):
+        graph = self.graph
+        if not graph.node_alive[idx]:
+            return False
+        labels = graph.node_labels[idx]
+        if any(label not in labels for label in node.labels):
+            return False
+        props = graph.node_props[idx]
+        return all(props.get(key) == self.eval(expr, env) for key, expr in node.props.items())
+
+    def rel_matches(self, idx, rel, codes, env):
+        if codes is not None and self.graph.rel_type[idx] not in codes:
+            return False
+        props = self.graph.rel_props[idx]
+        return all(props.get(key) == self.eval(expr, env) for key, expr in rel.props.items())
+
+    def neighbours(self, node, rel, codes, env):
+        graph = self.graph
+        if rel.direction in ("out", "both"):
+            for idx in graph.out_rels[node]:
+                if self.rel_matches(idx, rel, codes, env):
+                    yield idx, graph.rel_tgt[idx]
+        if rel.direction in ("in", "both"):
+            for idx in graph.in_rels[node]:
+                if self.rel_matches(idx, rel, codes, env) and not (rel.direction == "both" and graph.rel_src[idx] == graph.rel_tgt[idx]):
+                    yield idx, graph.rel_src[idx]
+
+    def traverse(self, start, rel, used, env):
+        codes = None if not rel.types else {self.graph.type_codes[t] for t in rel.types if t in self.graph.type_codes}
+        if rel.hops is None:
+            for idx, other in self.neighbours(start, rel, codes, env):
+                if idx not in used:
+                    yield [idx], other
+            return
+        low, high = rel.hops
+        if low == 0:
+            yield [], start
+        stack = [(start, [])]
+        while stack:
+            node, path = stack.pop()
+            if len(path) >= high:
+                continue
+            for idx, other in self.neighbours(node, rel, codes, env):
+                if idx in used or idx in path:
+                    continue
+                extended = path + [idx]
+                if len(extended) >= low:
+                    yield extended, other
+                stack.append((other, extended))
+
+    def expand(self, elements, i, current, env, used):
+        if i >= len(elements):
+            yield env, used
+            return
+        rel, node = elements[i], elements[i + 1]
+        for path, other in self.traverse(current, rel, used, env):
+            if not self.node_matches(other, node, env):
+                continue
+            rel_value = Rel(path[0]) if rel.hops is None else [Rel(idx) for idx in path]
+            if rel.var and rel.var in env and env[rel.var] != rel_value:
+                continue
+            if node.var and node.var in env and env[node.var] != Node(other):
+                continue
+            bound = dict(env)
+            if rel.var:
+                bound[rel.var] = rel_value
+            if node.var:
+                bound[node.var] = Node(other)
+            yield from self.expand(elements, i + 2, other, bound, used + tuple(path))
+
+    def create_pattern(self, elements, env):
+        env = dict(env)
+        nodes = []
+        for element in elements[0::2]:
+            if element.var and element.var in env:
+                value = env[element.var]
+                if not isinstance(value, Node):
+                    raise CypherError(f"Variable `{element.var}` is not a node")
+                nodes.append(value.idx)
+                continue
+            props = {key: self.eval(expr, env) for key, expr in element.props.items()}
+            idx = self.graph.create_node(element.labels, props, self.counters)
+            if element.var:
+                env[element.var] = Node(idx)
+            nodes.append(idx)
+        for i, rel in enumerate(elements[1::2]):
+            if len(rel.types) != 1 or rel.hops is not None:
+                raise CypherError("A created relationship needs exactly one type and no length")
+            src, tgt = (nodes[i + 1], nodes[i]) if rel.direction == "in" else (nodes[i], nodes[i + 1])
+            props = {key: self.eval(expr, env) for key, expr in rel.props.items()}
+            idx = self.graph.create_rel(src, rel.types[0], tgt, props, self.counters)
+            if rel.var:
+                env[rel.var] = Rel(idx)
+        return env
+
+    def apply_set(self, items, env):
+        graph = self.graph
+        for item in items:
+            target = env.get(item[1])
+            if target is None:
+                continue
+            if item[0] == "label":
+                graph.add_labels(target.idx, item[2], self.counters)
+                continue
+            if item[0] == "prop":
+                updates = {item[2]: self.eval(item[3], env)}
+            else:
+                updates = self.eval(item[2], env)
+                if isinstance(updates, (Node, Rel)):
+                    updates = dict(graph.properties(updates))
+                if not isinstance(updates, dict):
+                    raise CypherError(f"Expected a map to SET on `{item[1]}`")
+                if item[0] == "replace_map":
+                    updates = {**{key: None for key in graph.properties(target) if key not in updates}, **updates}
+            for key, value in updates.items():
+                if isinstance(target, Node):
+                    graph.set_node_prop(target.idx, key, value, self.counters)
+                else:
+                    props = graph.rel_props[target.idx]
+                    if value is None:
+                        props.pop(key, None)
+                    else:
+                        props[key] = value
+                    self.counters["properties_set"] += 1
+
+    # Projection
+
+    def project(self, projection, rows):
+        items = projection["items"]
+        if items == "*":
+            items = [(("var", name), name) for name in (rows[0] if rows else {})]
+        keys = [(expr, name) for expr, name in items if not contains_aggregate(expr)]
+        if len(keys) == len(items):
+            out = [({name: self.eval(expr, env) for expr, name in items}, env) for env in rows]
+        else:
+            groups = {}
+            for env in rows:
+                key = tuple(hashable(self.eval(expr, env)) for expr, name in keys)
+                groups.setdefault(key, (env, []))[1].append(env)
+            if not rows and not keys:
+                groups[()] = ({}, [])
+            out = [({name: self.eval(expr, first, members) for expr, name in items}, first) for first, members in groups.values()]
+        if projection["distinct"]:
+            seen = set()
+            unique = []
+            for row, env in out:
+                key = tuple(hashable(v) for v in row.values())
+                if key not in seen:
+                    seen.add(key)
+                    unique.append((row, env))
+            out = unique
+        for expr, descending in reversed(projection["order"]):
+            out.sort(key=lambda pair: sort_key(self.order_value(expr, items, pair)), reverse=descending)
+        skip = self.eval(projection["skip"], {}) if projection["skip"] is not None else 0
+        limit = self.eval(projection["limit"], {}) if projection["limit"] is not None else None
+        out = out[skip:] if limit is None else out[skip:skip + limit]
+        return [row for row, env in out]
+
+    def order_value(self, expr, items, pair):
+        row, env = pair
+        for item_expr, name in items:
+            if expr == item_expr or expr == ("var", name):
+                return row[name]
+        return self.eval(expr, {**env, **row})
+
+    # Expressions
+
+    def eval(self, expr, env, group=None):
+        kind = expr[0]
+        if kind == "lit":
+            return expr[1]
+        if kind == "var":
+            if expr[1] not in env:
+                raise CypherError(f"Variable `{expr[1]}` not defined")
+            return env[expr[1]]
+        if kind == "param":
+            if expr[1] not in self.params:
+                raise CypherError(f"Expected parameter ${expr[1]}")
+            return self.params[expr[1]]
+        if kind == "prop":
+            base = self.eval(expr[1], env, group)
+            return None if base is None else self.graph.properties(base).get(expr[2])
+        if kind == "op":
+            return self.eval_op(expr, env, group)
+        if kind == "call":
+            return self.eval_call(expr, env, group)
+        if kind == "not":
+            value = self.eval(expr[1], env, group)
+            return None if value is None else not value
+        if kind == "isnull":
+            value = self.eval(expr[1], env, group)
+            return (value is not None) if expr[2] else (value is None)
+        if kind == "list":
+            return [self.eval(item, env, group) for item in expr[1]]
+        if kind == "map":
+            return {key: self.eval(value, env, group) for key, value in expr[1].items()}
+        if kind == "neg":
+            value = self.eval(expr[1], env, group)
+            return None if value is None else -value
+        if kind == "count_star":
+            if group is None:
+                raise CypherError("count(*) is only allowed in WITH or RETURN")
+            return len(group)
+        if kind == "index":
+            base, key = self.eval(expr[1], env, group), self.eval(expr[2], env, group)
+            if base is None or key is None:
+                return None
+            if isinstance(base, (Node, Rel, dict)):
+                return self.graph.properties(base).get(key)
+            return base[key] if -len(base) <= key < len(base) else None
+        if kind == "slice":
+            base = self.eval(expr[1], env, group)
+            low = self.eval(expr[2], env, group) if expr[2] is not None else None
+            high = self.eval(expr[3], env, group) if expr[3] is not None else None
+            return None if base is None else base[low:high]
+        if kind == "haslabel":
+            node = self.eval(expr[1], env, group)
+            return None if node is None else all(label in self.graph.node_labels[node.idx] for label in expr[2])
+        if kind == "case":
+            _, subject, branches, default = expr
+            value = self.eval(subject, env, group) if subject is not None else None
+            for condition, result in branches:
+                matched = self.eval(condition, env, group)
+                if (subject is not None and matched == value) or (subject is None and truthy(matched)):
+                    return self.eval(result, env, group)
+            return self.eval(default, env, group) if default is not None else None
+        if kind == "listcomp":
+            _, var, source, where, projection = expr
+            values = self.eval(source, env, group)
+            if values is None:
+                return None
+            out = []
+            for value in values:
+                scope = {**env, var: value}
+                if where is None or truthy(self.eval(where, scope, group)):
+                    out.append(self.eval(projection, scope, group) if projection is not None else value)
+            return out
+        raise CypherError(f"Unsupported expression {kind}")
+
+    def eval_op(self, expr, env, group):
+        _, op, left, right = expr
+        if op in ("AND", "OR", "XOR"):
+            a, b = self.eval(left, env, group), self.eval(right, env, group)
+            if op == "AND":
+                return False if a is False or b is False else (None if a is None or b is None else True)
+            if op == "OR":
+                return True if a is True or b is True else (None if a is None or b is None else False)
+            return None if a is None or b is None else a != b
+        a, b = self.eval(left, env, group), self.eval(right, env, group)
+        if op in ("=", "<>", "<", ">", "<=", ">="):
+            return compare(op, a, b)
+        if op in ("CONTAINS", "STARTS WITH", "ENDS WITH"):
+            if not isinstance(a, str) or not isinstance(b, str):
+                return None
+            return b in a if op == "CONTAINS" else a.startswith(b) if op == "STARTS WITH" else a.endswith(b)
+        if op == "IN":
+            if b is None:
+                return None
+            return None if a is None else a in b
+        if op == "=~":
+            return None if a is None or b is None else re.fullmatch(b, str(a)) is not None
+        return arithmetic(op, a, b)
+
+    def eval_call(self, expr, env, group):
+        _, name, args, distinct = expr
+        if name in AGGREGATES:
+            if group is None:
+                raise CypherError(f"{name}() is only allowed in WITH or RETURN")
+            values = [self.eval(args[0], member) for member in group]
+            values = [v for v in values if v is not None]
+            if distinct:
+                unique = {}
+                for v in values:
+                    unique.setdefault(hashable(v), v)
+                values = list(unique.values())
+            if name == "count":
+                return len(values)
+            if name == "collect":
+                return values
+            if name == "sum":
+                return sum(values)
+            if name == "avg":
+                return sum(values) / len(values) if values else None
+            return (min if name == "min" else max)(values, key=sort_key) if values else None
+        fn = FUNCTIONS.get(name)
+        if fn is None:
+            raise CypherError(f"Unsupported function {name}()")
+        return fn(self.graph, *[self.eval(arg, env, group) for arg in args])
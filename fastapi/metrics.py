@@ -0,0 +1,243 @@
+import os
+import uuid
+import bisect
+import threading
+import contextlib
+import contextvars
+from time import time
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+# Metrics and tracing configuration
+METRICS_PREFIX = "kg"
+# Latency buckets in seconds, from fast graph lookups up to multi-minute extractions
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Spans of the most recent traces are kept in memory for /traces/{trace_id}
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "500"))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "2000"))
+
+
+def format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named family of samples, one per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def _samples(self, key, value):
+        counts, total = value
+        labelnames = self.labelnames + ("le",)
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            samples.append(f"{self.name}_bucket{format_labels(labelnames, key + (format_value(bound),))} {cumulative}")
+        samples.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {format_value(total)}")
+        samples.append(f"{self.name}_count{format_labels(self.labelnames, key)} {cumulative}")
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram("stage_seconds", "Duration of each pipeline stage.", ["stage"]))
+STAGE_ERRORS = registry.register(Counter("stage_errors_total", "Pipeline stages that raised.", ["stage"]))
+HTTP_SECONDS = registry.register(Histogram("http_request_seconds", "HTTP request latency.", ["method", "route", "status"]))
+LLM_SECONDS = registry.register(Histogram("llm_request_seconds", "Gemini call latency.", ["purpose"]))
+LLM_TOKENS = registry.register(Counter("llm_tokens_total", "Estimated tokens sent to and received from Gemini.", ["purpose", "direction"]))
+LLM_ERRORS = registry.register(Counter("llm_errors_total", "Failed Gemini calls.", ["purpose"]))
+RATE_LIMIT_WAIT = registry.register(Histogram("rate_limit_wait_seconds", "Time spent waiting for the Gemini quota.", ["limiter"]))
+EXTRACTION_CACHE = registry.register(Counter("extraction_cache_total", "Extraction cache lookups.", ["result"]))
+EXTRACTION_ITEMS = registry.register(Counter("extraction_items_total", "Entities and relationships parsed from extraction output.", ["kind"]))
+EXTRACTION_PARSE_ERRORS = registry.register(Counter("extraction_parse_errors_total", "Extraction items that were not valid JSON."))
+WRITE_BATCHES = registry.register(Counter("graph_write_batches_total", "Write transactions committed."))
+WRITE_ROWS = registry.register(Counter("graph_write_rows_total", "Rows written, by statement kind.", ["kind"]))
+WRITE_RETRIES = registry.register(Counter("graph_write_retries_total", "Write transactions retried after an error."))
+WRITE_FAILED_ROWS = registry.register(Counter("graph_write_failed_rows_total", "Rows that could not be written."))
+SOURCE_FETCHES = registry.register(Counter("source_fetch_total", "URL fetches by fetcher and cache result.", ["fetcher", "result"]))
+INTENT_ROUTES = registry.register(Counter("intent_routes_total", "QA questions answered from a template or left to the LLM.", ["decision", "intent"]))
+QA_CACHE = registry.register(Counter("qa_cache_total", "QA cache lookups by stage.", ["stage", "result"]))
+QUEUE_DEPTH = registry.register(Gauge("ingestion_queue_depth", "Ingestion jobs waiting for a worker."))
+GRAPH_NODES = registry.register(Gauge("graph_nodes", "Nodes in the graph."))
+GRAPH_RELATIONSHIPS = registry.register(Gauge("graph_relationships", "Relationships in the graph."))
+
+
+### Tracing ###
+
+current_trace = contextvars.ContextVar("trace_id", default=None)
+current_span = contextvars.ContextVar("span_id", default=None)
+
+
+def new_trace_id():
+    return uuid.uuid4().hex
+
+
+class TraceStore:
+    """Spans of the most recent traces, oldest trace evicted first."""
+
+    def __init__(self, history=TRACE_HISTORY, max_spans=TRACE_MAX_SPANS):
+        self.history = history
+        self.max_spans = max_spans
+        self.traces = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, trace_id, span):
+        with self.lock:
+            spans = self.traces.setdefault(trace_id, [])
+            self.traces.move_to_end(trace_id)
+            if len(spans) < self.max_spans:
+                spans.append(span)
+            while len(self.traces) > self.history:
+                self.traces.popitem(last=False)
+
+    def get(self, trace_id):
+        with self.lock:
+            spans = self.traces.get(trace_id)
+            return sorted(spans, key=lambda span: span["start"]) if spans is not None else None
+
+
+traces = TraceStore()
+
+
+@contextlib.contextmanager
+def use_trace(trace_id):
+    """Run the block as part of `trace_id` (e.g. a background job continuing the request that queued it)."""
+    token = current_trace.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        current_trace.reset(token)
+
+
+# Record a finished stage: its duration goes into the stage histogram and, inside a trace, into the trace's spans
+def observe_stage(stage, seconds, error=None, span_id=None, parent_id=None, **attributes):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if error is not None:
+        STAGE_ERRORS.inc(stage=stage)
+    trace_id = current_trace.get()
+    if trace_id is None:
+        return
+    traces.add(trace_id, {
+        "stage": stage,
+        "span_id": span_id or uuid.uuid4().hex[:16],
+        "parent_id": parent_id if parent_id is not None else current_span.get(),
+        "start": round(time() - seconds, 6),
+        "seconds": round(seconds, 6),
+        "error": error,
+        "attributes": attributes,
+    })
+
+
+@contextlib.contextmanager
+def span(stage, **attributes):
+    """Time the block as `stage`; spans opened inside it become its children. The yielded dict can be filled
+    with attributes (row counts, sizes) that are only known at the end."""
+    span_id = uuid.uuid4().hex[:16]
+    parent_id = current_span.get()
+    token = current_span.set(span_id)
+    start = timer()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        current_span.reset(token)
+        observe_stage(stage, timer() - start, error, span_id, parent_id, **attributes)
+
+
+# Submit `fn` to an executor with the caller's trace context, which executor threads do not inherit
+def submit_in_context(executor, fn, *args, **kwargs):
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+# Record one Gemini call: latency, estimated prompt/completion tokens and failures, plus its span
+def record_llm_call(purpose, seconds, prompt_tokens, completion_tokens, error=None):
+    LLM_SECONDS.observe(seconds, purpose=purpose)
+    LLM_TOKENS.inc(prompt_tokens, purpose=purpose, direction="prompt")
+    LLM_TOKENS.inc(completion_tokens, purpose=purpose, direction="completion")
+    if error is not None:
+        LLM_ERRORS.inc(purpose=purpose)
+    observe_stage(f"llm_{purpose}", seconds, error, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
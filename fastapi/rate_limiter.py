@@ -0,0 +1,68 @@
+import os
+import asyncio
+import threading
+from time import monotonic, sleep
+from metrics import RATE_LIMIT_WAIT
+
+# Gemini quota configuration
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "15"))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "1000000"))
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second, holding at most `capacity` tokens.
+    Reservations may drive the balance negative; the caller then waits until the debt is refilled."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.tokens = float(capacity)
+        self.updated = monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Take `amount` tokens now and return how long the caller must wait before using them
+    def reserve(self, amount):
+        amount = min(float(amount), self.capacity)
+        with self.lock:
+            self._refill(monotonic())
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limiter shared by all extraction workers."""
+
+    def __init__(self, requests_per_minute=GEMINI_RPM, tokens_per_minute=GEMINI_TPM, name="gemini"):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+
+    def reserve(self, tokens, requests=1):
+        return max(self.requests.reserve(requests), self.tokens.reserve(tokens))
+
+    def acquire(self, tokens=0, requests=1):
+        """Block until `requests` requests carrying `tokens` tokens are allowed. Returns the time waited."""
+        wait = self.reserve(tokens, requests)
+        RATE_LIMIT_WAIT.observe(wait, limiter=self.name)
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=0, requests=1):
+        """Same as acquire, but yields to the event loop while waiting."""
+        wait = self.reserve(tokens, requests)
+        RATE_LIMIT_WAIT.observe(wait, limiter=self.name)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+# Rough token estimate (~4 characters per token) used for TPM accounting
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
@@ -1,17 +1,43 @@
-import io
+import json
+import codecs
+import asyncio
+import hashlib
+import tempfile
+import contextlib
 from starlette.responses import Response
-from fastapi import FastAPI, File , UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File , UploadFile, Form, HTTPException, Request, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from graph_qa import *
 from graph_construct import *
 from prompts import RELATION_EXTRACTION_TEMPLATE
-import speech_recognition as sr
+from jobs import JobQueue, QueueFullError
+from graph_stats import graph_stats, STATS_RECONCILE_SECONDS
+from constraints import constraint_manager, KNOWN_LABELS
+from entity_search import search_index
+from entity_resolution import entity_resolver
+from metrics import registry, traces, span, use_trace, new_trace_id, HTTP_SECONDS, QUEUE_DEPTH, GRAPH_NODES, GRAPH_RELATIONSHIPS
+from audio import Transcription, create_recognizer
+from archive import source_archive
+from source_registry import source_registry, SourceVersion, content_hash
+from source_fetch import source_fetcher, UnsupportedSourceError
+from graph_writer import empty_result
+from graph_snapshot import export_snapshot, SnapshotMissingError
+from graph_analytics import graph_analytics, EntityNotFoundError, NEIGHBORHOOD_LIMIT
+from timeit import default_timer as timer
 
 class TextInput(BaseModel):
     text: Optional[str] = None
     url: Optional[str] = None
+    # Re-uploading under the same source id replaces what the earlier version put into the graph
+    source_id: Optional[str] = None
+
+class UrlBatchInput(BaseModel):
+    urls: List[str]
+
+class QuestionBatchInput(BaseModel):
+    questions: List[str]
 
 app = FastAPI(
     title="Knowledge Graph RAG - Backend",
@@ -21,80 +47,461 @@ app = FastAPI(
     version="0.1.0",
 )
 
-count_direct_text_upload = 0
-count_url_upload = 0
-count_file_upload = 0
+class TraceMiddleware:
+    """Runs every request in a trace (the caller's X-Trace-Id, or a new one returned in the response header)
+    and records its latency until the last byte of the response, streamed responses included."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        trace_id = dict(scope["headers"]).get(b"x-trace-id", b"").decode("latin-1") or new_trace_id()
+        status = 500
+        start = timer()
+
+        async def send_with_trace(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-trace-id", trace_id.encode("latin-1"))]
+            await send(message)
+
+        with use_trace(trace_id):
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                route = scope.get("route")
+                HTTP_SECONDS.observe(timer() - start, method=scope["method"], route=route.path if route else "unmatched", status=status)
+
+app.add_middleware(TraceMiddleware)
+
+# Largest number of URLs accepted by one /upload-urls request, and of questions by one /query/batch request
+MAX_URL_BATCH = int(os.getenv("MAX_URL_BATCH", "100"))
+MAX_QUESTION_BATCH = int(os.getenv("MAX_QUESTION_BATCH", "1000"))
+# Uploads are read in pieces of this size and refused past the limits; audio is kept in memory up to
+# AUDIO_SPOOL_BYTES and in an anonymous temporary file beyond that
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_AUDIO_UPLOAD_BYTES = int(os.getenv("MAX_AUDIO_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+AUDIO_SPOOL_BYTES = int(os.getenv("AUDIO_SPOOL_BYTES", str(16 * 1024 * 1024)))
+# Shared by all audio jobs (a local model is loaded once), see audio.py
+speech_recognizer = create_recognizer()
+
+class UploadTooLargeError(Exception):
+    pass
+
+# Function to read an upload piece by piece into `consume`, giving up once it exceeds `limit` bytes
+async def read_upload(file, consume, limit):
+    size = 0
+    while contents := await file.read(UPLOAD_CHUNK_BYTES):
+        size += len(contents)
+        if size > limit:
+            raise UploadTooLargeError(f"Upload exceeds the limit of {limit} bytes.")
+        consume(contents)
+    return size
+
+# Jobs for the same source run one at a time, so each one diffs against the version written before it
+source_locks = {}
+
+@contextlib.asynccontextmanager
+async def source_lock(source_id):
+    entry = source_locks.setdefault(source_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del source_locks[source_id]
+
+# Function to look up what the previous version of a source put into the graph
+async def source_version(source_id, digest):
+    previous = await asyncio.to_thread(source_registry.get, source_id)
+    return SourceVersion(source_id, digest, previous)
+
+# Function to transcribe into chunks; a recording with failed segments counts as only partly ingested
+async def transcript_chunks(transcription, version):
+    async for chunk in transcription.chunks():
+        yield chunk
+    if transcription.failed_segments:
+        version.complete = False
+
+# Background ingestion: everything slow (fetching, transcription, extraction, graph writes) runs inside a job.
+# Sources go through the pipeline in memory; the raw source is archived on the side (see archive.py).
+# Content that is unchanged since the source was last ingested is not extracted again.
+async def run_ingestion(job):
+    if job.kind == "delete":
+        return await run_source_removal(job)
+    if job.kind == "snapshot":
+        job.set_stage("exporting")
+        return await asyncio.to_thread(export_snapshot, gds)
+    source_id = job.payload["source_id"]
+    async with source_lock(source_id):
+        transcription = None
+        if job.kind == "url":
+            # served from the source cache when fresh, and already in flight for URLs queued in a batch
+            job.set_stage("fetching")
+            fetched = await source_fetcher.afetch(job.source)
+            text = fetched.text
+            version = await source_version(source_id, content_hash(text))
+            if not version.unchanged:
+                source_archive.submit(text.encode("utf-8"), ".txt")
+                write_result = await aconstruct_graph_from_text(text, fetched.name, on_progress=job.set_stage, version=version)
+        elif job.kind == "audio":
+            # segments are transcribed concurrently and their text is extracted as it arrives
+            audio = job.payload["audio"]
+            try:
+                version = await source_version(source_id, job.payload["content_hash"])
+                if not version.unchanged:
+                    transcription = Transcription(audio, speech_recognizer, on_progress=job.set_stage)
+                    write_result = await aconstruct_graph_from_chunks(transcript_chunks(transcription, version), on_progress=job.set_stage, version=version)
+            finally:
+                source_archive.submit(audio, os.path.splitext(job.source)[1] or ".wav", close=True)
+        else:
+            text = job.payload["text"]
+            version = await source_version(source_id, job.payload["content_hash"])
+            if not version.unchanged:
+                source_archive.submit(text.encode("utf-8"), ".txt")
+                write_result = await aconstruct_graph_from_text(text, job.source, on_progress=job.set_stage, version=version)
+        if version.unchanged:
+            print(f"Source {source_id} is unchanged, nothing to ingest")
+            write_result = empty_result()
+            write_result["source"] = version.summary(version.previous_entities, version.previous_relationships)
+    result = job_result(write_result)
+    if transcription is not None:
+        result["audio"] = transcription.info()
+    if job.kind == "url":
+        result["fetch"] = {"cache": fetched.cache, "characters": len(text)}
+    return result
+
+async def run_source_removal(job):
+    source_id = job.payload["source_id"]
+    async with source_lock(source_id):
+        job.set_stage("writing")
+        write_result = await aremove_source(source_id)
+    if write_result is None:
+        raise Exception(f"Unknown source: {source_id}")
+    return job_result(write_result)
+
+def job_result(write_result):
+    totals = graph_stats.snapshot()
+    result = {
+        "delta": {
+            **write_result["counters"],
+            "nodes_by_label": write_result["nodes_by_label"],
+            "relationships_by_pattern": write_result["relationships_by_pattern"],
+        },
+        "batches": write_result["batches"],
+        "failed_rows": write_result["failed_rows"],
+        "num_entity": totals["num_entity"],
+        "num_relation": totals["num_relation"],
+    }
+    if "source" in write_result:
+        result["source"] = write_result["source"]
+    return result
+
+ingestion_queue = JobQueue(run_ingestion)
+stats_task = None
+
+# Counts are served from memory; this loop corrects any drift against the database
+async def reconcile_stats_periodically():
+    while True:
+        try:
+            await graph_stats.areconcile(async_gds)
+        except Exception as e:
+            print(f"Graph statistics reconciliation failed: {e}")
+        await asyncio.sleep(STATS_RECONCILE_SECONDS)
+
+# Create id constraints for the known labels and wait for their indexes before any ingestion starts
+async def prepare_schema():
+    try:
+        await constraint_manager.aensure(async_gds, KNOWN_LABELS)
+        await search_index.aensure(async_gds, KNOWN_LABELS)
+        await search_index.abackfill(async_gds)
+        await constraint_manager.await_indexes(async_gds)
+        for index in await constraint_manager.index_states(async_gds):
+            print(f"Index {index['name']} on {index['labelsOrTypes']}: {index['state']} ({index['populationPercent']}%)")
+    except Exception as e:
+        print(f"Schema preparation failed: {e}")
+
+@app.on_event("startup")
+async def on_startup():
+    global stats_task
+    try:
+        await async_gds.verify_connectivity()
+    except Exception as e:
+        print(f"Graph database is not reachable: {e}")
+    await prepare_schema()
+    try:
+        await entity_resolver.aload(async_gds)
+    except Exception as e:
+        print(f"Loading the entity resolution index failed: {e}")
+    await ingestion_queue.start()
+    try:
+        await asyncio.to_thread(schema_snapshot.get_chain)
+    except Exception as e:
+        print(f"Building the QA chain failed, it will be built on the first query: {e}")
+    stats_task = asyncio.create_task(reconcile_stats_periodically())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if stats_task is not None:
+        stats_task.cancel()
+    await ingestion_queue.stop()
+    await source_archive.drain()
+    await async_gds.close()
+
+def enqueue(kind, source, payload, message):
+    try:
+        job = ingestion_queue.submit(kind, source, payload)
+    except QueueFullError as e:
+        return JSONResponse(status_code=429, content={"message": str(e)}, headers={"Retry-After": "10"})
+    return JSONResponse(status_code=202, content={"message": message, "job_id": job.id, "status_url": f"/jobs/{job.id}"})
 
 @app.post("/upload-text")
-def handle_text(input: TextInput):
-    print(input)
-    """Extract relations in text content, then add to knowledge graph."""
-    global count_direct_text_upload, count_url_upload
-    filepath = ""
+async def handle_text(input: TextInput):
+    """Queue extraction of relations in text content; poll /jobs/{job_id} for progress."""
     if input.text:
-        filepath = f"./uploaded-content/direct_text_{count_direct_text_upload}.txt"
-        count_direct_text_upload += 1
-        with open(filepath, "w") as file:
-            file.write(input.text)        
+        data = input.text.encode("utf-8")
+        if len(data) > MAX_UPLOAD_BYTES:
+            return JSONResponse(status_code=413, content={"message": f"Upload exceeds the limit of {MAX_UPLOAD_BYTES} bytes."})
+        digest = content_hash(data)
+        # without an id, text is its own source: editing it adds a new source rather than replacing the old one
+        source_id = input.source_id or f"text:{digest[:16]}"
+        return enqueue("text", "direct text", {"text": input.text, "content_hash": digest, "source_id": source_id}, "Text queued.")
     elif input.url:
-        content, filename = process_url(input.url)
-        filepath = f"./uploaded-content/{filename}.txt"
-        count_url_upload += 1
-        with open(filepath, "w") as file:
-            file.write(content.encode("ascii", "ignore").decode("ascii"))    
+        try:
+            fetcher, ref = source_fetcher.resolve(input.url)
+        except UnsupportedSourceError as e:
+            return JSONResponse(status_code=400, content={"message": str(e)})
+        return enqueue("url", input.url.strip(), {"source_id": input.source_id or ref.key}, "URL queued.")
     else:
         # raise HTTPException(status_code=400, detail="Empty input.")
         return JSONResponse(status_code=400, content={"message": "Empty input."})
-    construct_graph(filepath)  
-    node_count, relation_count = get_info()  
-    return JSONResponse(content={"message": "Text/URL processed.", "num_entity": node_count, "num_relation": relation_count}) 
+
+@app.post("/upload-urls")
+async def handle_urls(input: UrlBatchInput):
+    """Queue one ingestion job per URL; the URLs are fetched concurrently right away, a few per host at a time,
+    while extraction proceeds at the pace of the ingestion workers."""
+    if not input.urls:
+        return JSONResponse(status_code=400, content={"message": "Empty input."})
+    if len(input.urls) > MAX_URL_BATCH:
+        return JSONResponse(status_code=400, content={"message": f"At most {MAX_URL_BATCH} URLs per request."})
+    jobs, queued, queue_full = [], [], False
+    for url in input.urls:
+        url = url.strip()
+        try:
+            fetcher, ref = source_fetcher.resolve(url)
+            job = ingestion_queue.submit("url", url, {"source_id": ref.key})
+        except UnsupportedSourceError as e:
+            jobs.append({"url": url, "message": str(e)})
+            continue
+        except QueueFullError as e:
+            jobs.append({"url": url, "message": str(e)})
+            queue_full = True
+            continue
+        jobs.append({"url": url, "job_id": job.id, "status_url": f"/jobs/{job.id}"})
+        queued.append(url)
+    source_fetcher.prefetch(queued)
+    if not queued:
+        if queue_full:
+            return JSONResponse(status_code=429, content={"message": "No URL could be queued.", "jobs": jobs}, headers={"Retry-After": "10"})
+        return JSONResponse(status_code=400, content={"message": "No URL could be queued.", "jobs": jobs})
+    return JSONResponse(status_code=202, content={"message": f"{len(queued)} of {len(jobs)} URLs queued.", "jobs": jobs})
 
 @app.post("/upload-file")
-async def handle_file(file : UploadFile  = File(...)):
-    """Extract relations in text/audio file, then add to knowledge graph."""
-    global count_file_upload
-    filepath = ""
+async def handle_file(file : UploadFile  = File(...), source_id : Optional[str] = Form(None)):
+    """Queue extraction of relations in a text/audio file; poll /jobs/{job_id} for progress.
+    A file uploaded again under the same name (or `source_id`) replaces what its earlier version put into the graph."""
+    source_id = source_id or f"file:{file.filename}"
+    digest = hashlib.sha256()
+
+    def consume(contents):
+        digest.update(contents)
+        return contents
+
     if file.content_type == "text/plain":
-        filepath = f"./uploaded-content/{file.filename}"
-        count_file_upload += 1
-        # Read the file contents asynchronously
-        contents = await file.read()
-        with open(filepath, "w") as saved_file:
-            saved_file.write(str(contents.decode("utf-8")))
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        pieces = []
+        try:
+            with span("upload_read"):
+                await read_upload(file, lambda contents: pieces.append(decoder.decode(consume(contents))), MAX_UPLOAD_BYTES)
+                pieces.append(decoder.decode(b"", final=True))
+        except UploadTooLargeError as e:
+            return JSONResponse(status_code=413, content={"message": str(e)})
+        except UnicodeDecodeError:
+            return JSONResponse(status_code=400, content={"message": "File is not valid UTF-8 text."})
+        return enqueue("file", file.filename, {"text": "".join(pieces), "content_hash": digest.hexdigest(), "source_id": source_id}, "File queued.")
     elif file.content_type == "audio/wav":
-        contents = await file.read()
-        recognizer = sr.Recognizer()
-        audio_file = io.BytesIO(contents)
-        with sr.AudioFile(audio_file) as source:
-            audio_data = recognizer.record(source, duration=60)
-            try:
-                transcript = recognizer.recognize_google(audio_data, language='en')
-            except sr.UnknownValueError:
-                return JSONResponse(content={"error": "Speech was unintelligible"}, status_code=400)
-            except sr.RequestError as e:
-                return JSONResponse(content={"error": f"Could not request results; {e}"}, status_code=500)
-        filepath = f"./uploaded-content/{os.path.splitext(file.filename)[0].txt}"
-        count_file_upload += 1
-        with open(filepath, "w") as saved_file:
-            saved_file.write(transcript)
+        audio = tempfile.SpooledTemporaryFile(max_size=AUDIO_SPOOL_BYTES)
+        try:
+            with span("upload_read"):
+                await read_upload(file, lambda contents: audio.write(consume(contents)), MAX_AUDIO_UPLOAD_BYTES)
+        except UploadTooLargeError as e:
+            audio.close()
+            return JSONResponse(status_code=413, content={"message": str(e)})
+        response = enqueue("audio", file.filename, {"audio": audio, "content_hash": digest.hexdigest(), "source_id": source_id}, "Audio file queued.")
+        if response.status_code != 202:
+            audio.close()
+        return response
     else:
         # raise HTTPException(status_code=400, detail="Unsupported file type.")
         return JSONResponse(status_code=400, content={"message": "Unsupported file type."})
-    construct_graph(filepath) 
-    node_count, relation_count = get_info() 
-    return JSONResponse(content={"message": "File processed.", "num_entity": node_count, "num_relation": relation_count})
+
+@app.get("/sources")
+async def handle_list_sources():
+    """Ingested sources, most recently ingested first, with the number of entities/relationships each contributed."""
+    return JSONResponse(content={"sources": await asyncio.to_thread(source_registry.list)})
+
+@app.delete("/sources/{source_id:path}")
+async def handle_delete_source(source_id: str):
+    """Queue removal of a source: entities and relationships no other source mentions are deleted."""
+    if await asyncio.to_thread(source_registry.get, source_id) is None:
+        return JSONResponse(status_code=404, content={"message": "Unknown source."})
+    return enqueue("delete", source_id, {"source_id": source_id}, "Source removal queued.")
+
+@app.get("/jobs")
+async def handle_list_jobs():
+    """Recent ingestion jobs, newest first."""
+    return JSONResponse(content={"queue_depth": ingestion_queue.depth(), "jobs": ingestion_queue.list()})
+
+@app.get("/jobs/{job_id}")
+async def handle_get_job(job_id: str):
+    """Stage, progress, timings and graph delta of one ingestion job."""
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"message": "Unknown job."})
+    return JSONResponse(content=job.to_dict())
 
 @app.post("/query")
-def handle_query(input: TextInput):
+async def handle_query(input: TextInput):
     """Query to knowledge graph, then provide an answer. Therefore, only ask RELEVANT things."""
     if input.text:
-        return JSONResponse(content=qa_on_graph(input.text))
+        return JSONResponse(content=await aqa_on_graph(input.text))
     else:
         # raise HTTPException(status_code=400, detail="Empty input.")
         return JSONResponse(status_code=400, content={"message": "Empty input."})
     
+@app.post("/query/stream")
+async def handle_query_stream(input: TextInput):
+    """Like /query, but streams Server-Sent Events: the Cypher as soon as it is generated and run,
+    the database context, the answer token by token, and finally the complete result."""
+    if not input.text:
+        return JSONResponse(status_code=400, content={"message": "Empty input."})
+
+    async def events():
+        try:
+            async for event, data in astream_qa_on_graph(input.text):
+                yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/query/batch")
+async def handle_query_batch(input: QuestionBatchInput):
+    """Answer many questions at once. Repeated questions are answered once and the rest run concurrently;
+    the response streams NDJSON: one line per distinct question as soon as it is answered (`indexes` are its
+    positions in the request, `status` is "ok" or "error"), then a line with the batch `summary`."""
+    if not input.questions:
+        return JSONResponse(status_code=400, content={"message": "Empty input."})
+    if len(input.questions) > MAX_QUESTION_BATCH:
+        return JSONResponse(status_code=400, content={"message": f"At most {MAX_QUESTION_BATCH} questions per request."})
+
+    async def lines():
+        async for entry in abatch_qa_on_graph(input.questions):
+            yield json.dumps(entry, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @app.get("/info")
-def handle_get_info():
-    node_count, relation_count = get_info() 
-    return JSONResponse(content={"num_entity": node_count, "num_relation": relation_count})
-    
+async def handle_get_info(request: Request):
+    """Node and relationship counts (total, per label and per type), served from memory with an ETag."""
+    etag = graph_stats.etag()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=graph_stats.snapshot(), headers={"ETag": etag})
+
+@app.post("/snapshot")
+async def handle_export_snapshot():
+    """Queue an export of the graph into a columnar snapshot (NumPy arrays), which /analytics reads."""
+    return enqueue("snapshot", "graph", {}, "Graph snapshot export queued.")
+
+# Function to run an analysis in a worker thread and turn its errors into responses
+async def analytics_response(analysis, *args):
+    try:
+        return JSONResponse(content=await asyncio.to_thread(analysis, *args))
+    except (SnapshotMissingError, EntityNotFoundError) as e:
+        return JSONResponse(status_code=404, content={"message": str(e)})
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"message": str(e)})
+
+@app.get("/analytics")
+async def handle_analytics_info():
+    """Counts, degree and component statistics of the latest graph snapshot."""
+    return await analytics_response(graph_analytics.info)
+
+@app.get("/analytics/degree")
+async def handle_analytics_degree(top: int = Query(10, ge=1, le=1000), label: Optional[str] = None, direction: str = "both"):
+    """Most connected entities (of a label), by relationships in `direction` ("out", "in" or "both")."""
+    return await analytics_response(graph_analytics.degree, top, label, direction)
+
+@app.get("/analytics/pagerank")
+async def handle_analytics_pagerank(top: int = Query(10, ge=1, le=1000), label: Optional[str] = None):
+    """Most central entities (of a label) by PageRank."""
+    return await analytics_response(graph_analytics.pagerank, top, label)
+
+@app.get("/analytics/components")
+async def handle_analytics_components(top: int = Query(10, ge=1, le=1000), label: Optional[str] = None):
+    """Largest clusters of connected entities; with a label, clusters connected through entities of that label only."""
+    return await analytics_response(graph_analytics.components, top, label)
+
+@app.get("/analytics/neighborhood")
+async def handle_analytics_neighborhood(id: str, label: Optional[str] = None, hops: int = Query(2, ge=1, le=6), direction: str = "both", limit: int = Query(NEIGHBORHOOD_LIMIT, ge=0, le=10000)):
+    """Entities within `hops` relationships of the entity `id`, nearest first."""
+    return await analytics_response(graph_analytics.neighborhood, id, label, hops, direction, limit)
+
+@app.get("/extraction-cache")
+async def handle_extraction_cache():
+    """Hit/miss counters and size of the extraction cache."""
+    return JSONResponse(content=await asyncio.to_thread(extraction_cache.info))
+
+@app.get("/entity-resolution")
+async def handle_entity_resolution():
+    """Entities per label in the resolution index and how many extracted ids were merged into existing ones."""
+    return JSONResponse(content=entity_resolver.info())
+
+@app.get("/qa-cache")
+async def handle_qa_cache():
+    """Hit/miss counters of the question-to-Cypher and Cypher-result caches."""
+    return JSONResponse(content=qa_cache_info())
+
+@app.get("/indexes")
+async def handle_get_indexes():
+    """Build state of the id indexes backing entity MERGEs."""
+    return JSONResponse(content={"indexes": await constraint_manager.index_states(async_gds)})
+
+@app.get("/schema")
+async def handle_get_schema():
+    """Graph schema snapshot used for Cypher generation, its age and the graph version it reflects."""
+    return JSONResponse(content=schema_snapshot.info())
+
+@app.get("/metrics")
+async def handle_metrics():
+    """Stage latency histograms and pipeline counters in the Prometheus text format."""
+    totals = graph_stats.snapshot()
+    QUEUE_DEPTH.set(ingestion_queue.depth())
+    GRAPH_NODES.set(totals["num_entity"])
+    GRAPH_RELATIONSHIPS.set(totals["num_relation"])
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces/{trace_id}")
+async def handle_get_trace(trace_id: str):
+    """Spans of one request (and of the ingestion job it queued), in start order."""
+    spans = traces.get(trace_id)
+    if spans is None:
+        return JSONResponse(status_code=404, content={"message": "Unknown trace."})
+    return JSONResponse(content={"trace_id": trace_id, "spans": spans})
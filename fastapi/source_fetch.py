@@ -0,0 +1,249 @@
+import os
+import re
+import asyncio
+import sqlite3
+import threading
+from time import time
+from collections import namedtuple
+from urllib.parse import unquote
+import requests
+from youtube_transcript_api import YouTubeTranscriptApi
+from metrics import span, SOURCE_FETCHES
+
+# Source fetch configuration: fetched content is cached for SOURCE_CACHE_TTL seconds, then revalidated
+SOURCE_CACHE_PATH = os.getenv("SOURCE_CACHE_PATH", "./cache/source_cache.sqlite")
+SOURCE_CACHE_TTL = float(os.getenv("SOURCE_CACHE_TTL", str(24 * 3600)))
+SOURCE_CACHE_MAX_BYTES = int(os.getenv("SOURCE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+SOURCE_FETCH_WORKERS = int(os.getenv("SOURCE_FETCH_WORKERS", "8"))
+SOURCE_FETCH_PER_HOST = int(os.getenv("SOURCE_FETCH_PER_HOST", "2"))
+SOURCE_FETCH_TIMEOUT = float(os.getenv("SOURCE_FETCH_TIMEOUT", "30"))
+YOUTUBE_LANGUAGES = os.getenv("YOUTUBE_LANGUAGES", "en").split(",")
+# MediaWiki API of a Wikipedia language edition; point it at a local fixture server to work offline
+WIKIPEDIA_API_URL = os.getenv("WIKIPEDIA_API_URL", "https://{language}.wikipedia.org/w/api.php")
+
+# A URL resolved by a fetcher: `key` identifies the content whatever form the URL took, `target` is what the fetcher needs
+SourceRef = namedtuple("SourceRef", ["key", "name", "host", "target"])
+# Fetched content; `cache` tells how it was obtained: "miss", "hit", "revalidated" or "stale" (the refetch failed)
+FetchedSource = namedtuple("FetchedSource", ["key", "name", "text", "cache"])
+
+
+class UnsupportedSourceError(Exception):
+    pass
+
+
+### Fetchers ###
+
+class Fetcher:
+    """Fetches the full text of the URLs it recognizes. `fetch` returns (text, validator), where the validator
+    (e.g. a revision id, kept as a string) lets `revalidate` tell whether cached text is still current without
+    downloading it again. Fetchers run in worker threads."""
+
+    name = "fetcher"
+
+    def match(self, url):
+        """SourceRef for a URL this fetcher handles, else None."""
+        raise NotImplementedError
+
+    def fetch(self, ref):
+        raise NotImplementedError
+
+    def revalidate(self, ref, validator):
+        return False
+
+
+class YouTubeFetcher(Fetcher):
+    """Transcript of a YouTube video (watch, youtu.be, embed and shorts URLs)."""
+
+    name = "youtube"
+    pattern = re.compile(r"^(?:https?://)?(?:www\.|m\.)?(?:youtube\.com/(?:watch\?(?:.*&)?v=|embed/|shorts/|v/)|youtu\.be/)([0-9A-Za-z_-]{11})")
+
+    def __init__(self, languages=YOUTUBE_LANGUAGES):
+        self.languages = languages
+
+    def match(self, url):
+        match = self.pattern.match(url)
+        if not match:
+            return None
+        video_id = match.group(1)
+        return SourceRef(f"youtube:{video_id}", f"youtube_{video_id}", "www.youtube.com", video_id)
+
+    def fetch(self, ref):
+        try:
+            transcript = YouTubeTranscriptApi.get_transcript(ref.target, languages=self.languages)
+        except Exception:
+            raise Exception(f"Youtube transcript is not available for youtube Id: {ref.target}")
+        text = " ".join(" ".join(entry["text"].split()) for entry in transcript)
+        # transcripts carry no revision to check against, so an expired entry is fetched again
+        return text, None
+
+
+class WikipediaFetcher(Fetcher):
+    """Plain text of a Wikipedia article, read from the MediaWiki API; the revision id is its validator."""
+
+    name = "wikipedia"
+    pattern = re.compile(r"^https?://(?:www\.)?([a-zA-Z]{2,3})\.(?:m\.)?wikipedia\.org/wiki/([^?#]+)")
+
+    def __init__(self, api_url=WIKIPEDIA_API_URL, timeout=SOURCE_FETCH_TIMEOUT):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def match(self, url):
+        match = self.pattern.match(url)
+        if not match:
+            return None
+        language, title = match.group(1).lower(), unquote(match.group(2)).replace("_", " ").strip()
+        return SourceRef(f"wikipedia:{language}:{title}", f"wiki_{title}", f"{language}.wikipedia.org", (language, title))
+
+    # One HTTP session (and so one connection pool) per worker thread
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def query(self, ref, **params):
+        language, title = ref.target
+        params = {"action": "query", "format": "json", "formatversion": "2", "redirects": "1", "titles": title, **params}
+        response = self.session().get(self.api_url.format(language=language), params=params, timeout=self.timeout)
+        response.raise_for_status()
+        pages = response.json().get("query", {}).get("pages", [])
+        if not pages or pages[0].get("missing") or pages[0].get("invalid"):
+            raise Exception(f"Cannot load Wikipedia page {title!r}.")
+        return pages[0]
+
+    def fetch(self, ref):
+        page = self.query(ref, prop="extracts|revisions", explaintext="1", rvprop="ids")
+        return page.get("extract", ""), page["revisions"][0]["revid"]
+
+    def revalidate(self, ref, validator):
+        page = self.query(ref, prop="revisions", rvprop="ids")
+        return str(page["revisions"][0]["revid"]) == validator
+
+
+### Cache ###
+
+class SourceCache:
+    """Fetched text by source key in SQLite, with the validator and time of the last check. The oldest
+    entries are evicted once the store grows past `max_bytes`."""
+
+    def __init__(self, path=SOURCE_CACHE_PATH, max_bytes=SOURCE_CACHE_MAX_BYTES):
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS sources "
+            "(key TEXT PRIMARY KEY, text TEXT NOT NULL, validator TEXT, size INTEGER NOT NULL, checked REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS sources_checked ON sources (checked)")
+        self.db.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT text, validator, checked FROM sources WHERE key = ?", (key,)).fetchone()
+        return {"text": row[0], "validator": row[1], "checked": row[2]} if row else None
+
+    def put(self, key, text, validator):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO sources (key, text, validator, size, checked) VALUES (?, ?, ?, ?, ?)",
+                (key, text, None if validator is None else str(validator), len(text.encode("utf-8")), time()),
+            )
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM sources").fetchone()[0]
+            for old_key, size in self.db.execute("SELECT key, size FROM sources ORDER BY checked").fetchall():
+                if total <= self.max_bytes or old_key == key:
+                    break
+                self.db.execute("DELETE FROM sources WHERE key = ?", (old_key,))
+                total -= size
+            self.db.commit()
+
+    # The cached text was confirmed current
+    def touch(self, key):
+        with self.lock:
+            self.db.execute("UPDATE sources SET checked = ? WHERE key = ?", (time(), key))
+            self.db.commit()
+
+
+### Fetching ###
+
+class SourceFetcher:
+    """Fetches URLs through the first matching fetcher, serving fresh content from the cache and revalidating
+    expired entries. At most `workers` fetches run at once, `per_host` per host, and concurrent requests for the
+    same source share one fetch."""
+
+    def __init__(self, fetchers=None, cache=None, ttl=SOURCE_CACHE_TTL, workers=SOURCE_FETCH_WORKERS, per_host=SOURCE_FETCH_PER_HOST):
+        self.fetchers = fetchers if fetchers is not None else [YouTubeFetcher(), WikipediaFetcher()]
+        self.cache = cache if cache is not None else SourceCache()
+        self.ttl = ttl
+        self.workers = workers
+        self.per_host = per_host
+        self.semaphore = None
+        self.hosts = {}
+        self.inflight = {}
+        self.tasks = set()
+
+    def resolve(self, url):
+        """(fetcher, SourceRef) for a URL; raises UnsupportedSourceError if no fetcher handles it."""
+        url = url.strip()
+        for fetcher in self.fetchers:
+            ref = fetcher.match(url)
+            if ref is not None:
+                return fetcher, ref
+        raise UnsupportedSourceError(f"Unsupported URL: {url}")
+
+    async def afetch(self, url):
+        fetcher, ref = self.resolve(url)
+        task = self.inflight.get(ref.key)
+        if task is None:
+            task = asyncio.create_task(self._afetch(fetcher, ref))
+            self.inflight[ref.key] = task
+            task.add_done_callback(lambda done: self.inflight.pop(ref.key, None))
+        # a caller that gives up does not cancel the fetch the others are waiting for
+        return await asyncio.shield(task)
+
+    async def _afetch(self, fetcher, ref):
+        with span("source_fetch", fetcher=fetcher.name) as attributes:
+            cached = await asyncio.to_thread(self.cache.get, ref.key)
+            if cached is not None and time() - cached["checked"] < self.ttl:
+                result = "hit"
+            else:
+                if self.semaphore is None:
+                    self.semaphore = asyncio.Semaphore(self.workers)
+                host = self.hosts.setdefault(ref.host, asyncio.Semaphore(self.per_host))
+                async with self.semaphore, host:
+                    try:
+                        if cached is not None and cached["validator"] is not None and await asyncio.to_thread(fetcher.revalidate, ref, cached["validator"]):
+                            await asyncio.to_thread(self.cache.touch, ref.key)
+                            result = "revalidated"
+                        else:
+                            text, validator = await asyncio.to_thread(fetcher.fetch, ref)
+                            await asyncio.to_thread(self.cache.put, ref.key, text, validator)
+                            cached = {"text": text}
+                            result = "miss"
+                    except Exception as e:
+                        if cached is None:
+                            SOURCE_FETCHES.inc(fetcher=fetcher.name, result="error")
+                            raise
+                        print(f"Refetching {ref.key} failed, serving the cached copy: {e}")
+                        result = "stale"
+            attributes["cache"] = result
+            attributes["characters"] = len(cached["text"])
+        SOURCE_FETCHES.inc(fetcher=fetcher.name, result=result)
+        return FetchedSource(ref.key, ref.name, cached["text"], result)
+
+    def prefetch(self, urls):
+        """Start fetching `urls` in the background, so that jobs find them fetched or in flight."""
+        for url in urls:
+            task = asyncio.create_task(self.afetch(url))
+            self.tasks.add(task)
+            task.add_done_callback(self._prefetched)
+
+    def _prefetched(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Prefetching a source failed: {task.exception()}")
+
+
+source_fetcher = SourceFetcher()
@@ -0,0 +1,128 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from time import time
+
+# Source registry configuration
+SOURCE_REGISTRY_PATH = os.getenv("SOURCE_REGISTRY_PATH", "./cache/source_registry.sqlite")
+SOURCE_REGISTRY_BUSY_TIMEOUT = float(os.getenv("SOURCE_REGISTRY_BUSY_TIMEOUT", "30"))
+
+
+def content_hash(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class SourceVersion:
+    """One ingestion of a source: its id and content hash, and what the previous version of the source
+    (a SourceRegistry record, or None for a new source) put into the graph, for the new one to be diffed against.
+
+    `complete` is cleared while ingesting when part of the document could not be extracted; the keys it did
+    not produce are then kept rather than taken off the graph."""
+
+    def __init__(self, source_id, content_hash, previous=None):
+        self.id = source_id
+        self.content_hash = content_hash
+        self.previous = previous
+        self.previous_entities = {tuple(key) for key in previous["entities"]} if previous else set()
+        self.previous_relationships = {tuple(key) for key in previous["relationships"]} if previous else set()
+        # an incomplete ingestion may have failed to write some rows, so they are written again rather than skipped
+        self.trusted = bool(previous and previous["complete"])
+        self.complete = True
+
+    # The same content was already ingested in full: there is nothing to do
+    @property
+    def unchanged(self):
+        return self.trusted and self.previous["content_hash"] == self.content_hash
+
+    def summary(self, entities, relationships):
+        """How this version of the source differs from the previous one, given the keys it extracted."""
+        removed_entities = self.previous_entities - entities if self.complete else set()
+        removed_relationships = self.previous_relationships - relationships if self.complete else set()
+        return {
+            "id": self.id,
+            "content_hash": self.content_hash,
+            "status": "unchanged" if self.unchanged else "updated" if self.previous else "new",
+            "complete": self.complete,
+            "entities": len(entities),
+            "relationships": len(relationships),
+            "entities_added": len(entities - self.previous_entities),
+            "entities_removed": len(removed_entities),
+            "relationships_added": len(relationships - self.previous_relationships),
+            "relationships_removed": len(removed_relationships),
+        }
+
+
+class SourceRegistry:
+    """Content hash and extracted entity/relationship keys of every ingested source, kept in SQLite so that
+    re-uploads can be diffed against what a source put into the graph and sources can be deleted.
+
+    Entity keys are [label, id] and relationship keys [src label, src id, type, tgt label, tgt id]."""
+
+    def __init__(self, path=SOURCE_REGISTRY_PATH):
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path or ":memory:", timeout=SOURCE_REGISTRY_BUSY_TIMEOUT, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS sources "
+            "(id TEXT PRIMARY KEY, content_hash TEXT, entities TEXT NOT NULL, relationships TEXT NOT NULL, "
+            "complete INTEGER NOT NULL, ingested_at REAL NOT NULL)"
+        )
+        self.db.commit()
+
+    def get(self, source_id):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT id, content_hash, entities, relationships, complete, ingested_at FROM sources WHERE id = ?", (source_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "content_hash": row[1],
+            "entities": json.loads(row[2]),
+            "relationships": json.loads(row[3]),
+            "complete": bool(row[4]),
+            "ingested_at": row[5],
+        }
+
+    def put(self, source_id, content_hash, entities, relationships, complete=True):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO sources (id, content_hash, entities, relationships, complete, ingested_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (source_id, content_hash, json.dumps(sorted(entities)), json.dumps(sorted(relationships)), int(complete), time()),
+            )
+            self.db.commit()
+
+    # Function to store what a finished ingestion left in the graph; an incomplete one keeps the previous keys too
+    # and forgets the hash, so the next upload of the same content runs again
+    def record(self, version, entities, relationships):
+        if not version.complete:
+            entities = entities | version.previous_entities
+            relationships = relationships | version.previous_relationships
+        self.put(version.id, version.content_hash if version.complete else None, entities, relationships, version.complete)
+
+    def delete(self, source_id):
+        with self.lock:
+            deleted = self.db.execute("DELETE FROM sources WHERE id = ?", (source_id,)).rowcount
+            self.db.commit()
+        return bool(deleted)
+
+    def list(self):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, content_hash, json_array_length(entities), json_array_length(relationships), complete, ingested_at "
+                "FROM sources ORDER BY ingested_at DESC"
+            ).fetchall()
+        return [
+            {"id": row[0], "content_hash": row[1], "entities": row[2], "relationships": row[3], "complete": bool(row[4]), "ingested_at": row[5]}
+            for row in rows
+        ]
+
+
+source_registry = SourceRegistry()
@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from entity_resolution import EntityResolver, resolution_key, trigrams, jaccard
+from graph_store import MemoryDriver, AsyncMemoryDriver
+from memory_graph import MemoryGraph
+
+
+def test_resolution_key():
+    assert resolution_key("OpenAI Inc.") == "openai"
+    assert resolution_key("open ai") == "openai"
+    assert resolution_key("Microsoft Corporation") == "microsoft"
+    # a name that is only a suffix keeps it
+    assert resolution_key("Company") == "company"
+
+
+def test_jaccard():
+    assert trigrams("ab") == {"#ab", "ab#"}
+    assert jaccard(trigrams("kubernetes"), trigrams("kubernetes")) == 1.0
+    assert jaccard(set(), trigrams("kubernetes")) == 0.0
+
+
+def test_exact_key_matches_merge():
+    resolver = EntityResolver(threshold=0.8, enabled=True)
+    assert resolver.resolve("Organization", "openai") == "openai"
+    assert resolver.resolve("Organization", "OpenAI Inc.") == "openai"
+    assert resolver.resolve("Organization", "open ai") == "openai"
+    assert resolver.merged == 2
+
+
+def test_near_duplicates_merge():
+    resolver = EntityResolver(threshold=0.8, enabled=True)
+    assert resolver.resolve("Organization", "internationalbusinessmachines") == "internationalbusinessmachines"
+    assert resolver.resolve("Organization", "internationalbusinessmachine") == "internationalbusinessmachines"
+    assert resolver.resolve("Technology", "convolutionalneuralnetworks") == "convolutionalneuralnetworks"
+    assert resolver.resolve("Technology", "convolutionalneuralnetwork") == "convolutionalneuralnetworks"
+    assert resolver.info()["merged"] == 2
+
+
+def test_distinct_entities_stay_apart():
+    resolver = EntityResolver(threshold=0.8, enabled=True)
+    assert resolver.resolve("Technology", "ai") == "ai"
+    # short keys merge only on an exact match
+    assert resolver.resolve("Technology", "api") == "api"
+    assert resolver.resolve("Person", "johnsmith") == "johnsmith"
+    assert resolver.resolve("Person", "janesmith") == "janesmith"
+    # labels are resolved separately
+    assert resolver.resolve("Organization", "openai") == "openai"
+    assert resolver.resolve("Technology", "openai") == "openai"
+    assert resolver.merged == 0
+    assert resolver.info()["entities_by_label"] == {"Technology": 3, "Person": 2, "Organization": 1}
+
+
+def test_disabled():
+    resolver = EntityResolver(enabled=False)
+    resolver.register("Organization", "openai")
+    assert resolver.resolve("Organization", "OpenAI Inc.") == "OpenAI Inc."
+
+
+@pytest.mark.parametrize("run_async", [False, True], ids=["sync", "async"])
+def test_load_from_graph(run_async):
+    graph = MemoryGraph()
+    graph.run("CREATE (:Organization {id: 'openai'}), (:Person:Researcher {id: 'alanturing'}), (:Note {text: 'no id'})")
+    resolver = EntityResolver(threshold=0.8, enabled=True)
+    if run_async:
+        asyncio.run(resolver.aload(AsyncMemoryDriver(graph)))
+    else:
+        resolver.load(MemoryDriver(graph))
+    assert resolver.info()["entities_by_label"] == {"Organization": 1, "Person": 1, "Researcher": 1}
+    assert resolver.resolve("Organization", "OpenAI Inc.") == "openai"
+    assert resolver.resolve("Researcher", "Alan Turing") == "alanturing"
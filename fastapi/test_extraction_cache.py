@@ -0,0 +1,102 @@
+import sqlite3
+import pytest
+import extraction_cache
+from extraction_cache import ExtractionCache, cache_key, is_cacheable
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # a strictly increasing access time, so least recently used is well defined
+    now = [0.0]
+
+    def tick():
+        now[0] += 1
+        return now[0]
+
+    monkeypatch.setattr(extraction_cache, "time", tick)
+    return now
+
+
+def stored_bytes(path):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+
+
+def test_cache_key():
+    key = cache_key("Alan  Turing\nproposed\tthe test. ", "prompt", "model")
+    assert key == cache_key("Alan Turing proposed the test.", "prompt", "model")
+    assert key != cache_key("Alan Turing proposed the test.", "other prompt", "model")
+    assert key != cache_key("Alan Turing proposed the test.", "prompt", "other model")
+    # parts are delimited, so moving text between them changes the key
+    assert cache_key("ab", "c", "d") != cache_key("a", "bc", "d")
+
+
+def test_memory_lru():
+    cache = ExtractionCache(path=None, memory_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.info() == {"memory_hits": 3, "disk_hits": 0, "misses": 1, "evictions": 0, "memory_entries": 2}
+
+
+def test_disk_tier_is_shared(tmp_path):
+    path = str(tmp_path / "cache" / "extractions.sqlite")
+    ExtractionCache(path).put("a", '{"entities": []}')
+    cache = ExtractionCache(path, memory_entries=10)
+    assert cache.get("a") == '{"entities": []}'
+    assert cache.get("a") == '{"entities": []}'
+    assert cache.get("b") is None
+    info = cache.info()
+    assert (info["disk_hits"], info["memory_hits"], info["misses"]) == (1, 1, 1)
+    assert info["disk_entries"] == 1
+
+
+def test_size_accounting(tmp_path, clock):
+    path = str(tmp_path / "extractions.sqlite")
+    cache = ExtractionCache(path, max_bytes=1000)
+    cache.put("a", "x" * 100)
+    cache.put("b", "é" * 50)
+    assert cache.info()["disk_bytes"] == 200
+    # replacing an entry counts only its new size
+    cache.put("a", "x" * 300)
+    cache.put("a", "x" * 300)
+    assert cache.info()["disk_bytes"] == 400 == stored_bytes(path)
+    # a second process writing to the same store updates the same total
+    ExtractionCache(path, max_bytes=1000).put("c", "x" * 50)
+    assert cache.info()["disk_bytes"] == 450 == stored_bytes(path)
+    # the total is kept, not recounted, when the store is opened again
+    assert ExtractionCache(path).info()["disk_bytes"] == 450
+
+
+def test_eviction_drops_least_recently_used(tmp_path, clock):
+    path = str(tmp_path / "extractions.sqlite")
+    cache = ExtractionCache(path, memory_entries=0, max_bytes=300)
+    for key in "abc":
+        cache.put(key, key * 100)
+    cache.get("a")
+    cache.put("d", "d" * 150)
+    # b and c were used least recently; dropping b alone is not enough
+    assert [cache.get(key) is not None for key in "abcd"] == [True, False, False, True]
+    info = cache.info()
+    assert info["evictions"] == 2
+    assert info["disk_entries"] == 2
+    assert info["disk_bytes"] == 250 == stored_bytes(path)
+
+
+def test_eviction_clears_memory_tier(tmp_path, clock):
+    cache = ExtractionCache(str(tmp_path / "extractions.sqlite"), memory_entries=10, max_bytes=150)
+    cache.put("a", "a" * 100)
+    cache.put("b", "b" * 100)
+    assert cache.get("a") is None
+    assert cache.get("b") == "b" * 100
+
+
+def test_is_cacheable():
+    assert is_cacheable('{"entities": [], "relationships": []}')
+    assert not is_cacheable("[]")
+    assert not is_cacheable('{"entities": [')
+    assert not is_cacheable(None)
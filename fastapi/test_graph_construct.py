@@ -0,0 +1,80 @@
+import json
+import asyncio
+import pytest
+import graph_construct
+from fakes import FakeGemini
+from graph_store import MemoryDriver, AsyncMemoryDriver
+from memory_graph import MemoryGraph
+from source_registry import SourceRegistry, SourceVersion
+
+NAMES = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet"]
+EXTRACTION = json.dumps({
+    "entities": [{"label": "Concept", "id": name, "name": name.title()} for name in NAMES],
+    "relationships": [f"{a}|IS_RELATED_TO|{b}" for a, b in zip(NAMES, NAMES[1:])],
+})
+
+
+# Stand-ins for stream_gemini/astream_gemini whose output stops a third of the way in, with an error or without
+def failing_stream(text, error):
+    def stream_gemini(prompt, model=None, limiter=None):
+        yield text
+        if error:
+            raise Exception("Stream reset")
+
+    async def astream_gemini(prompt, model=None, limiter=None):
+        yield text
+        if error:
+            raise Exception("Stream reset")
+
+    return stream_gemini, astream_gemini
+
+
+FAILURES = {
+    "error": (EXTRACTION[:len(EXTRACTION) // 3], True),
+    "cut off": (EXTRACTION[:len(EXTRACTION) // 3], False),
+    "no json": ("I cannot help with that.", False),
+}
+
+
+def count(graph, query):
+    return graph.query(query)[0]["n"]
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = SourceRegistry(":memory:")
+    monkeypatch.setattr(graph_construct, "source_registry", registry)
+    return registry
+
+
+def ingest(graph, registry, content_hash, run_async):
+    version = SourceVersion("doc", content_hash, registry.get("doc"))
+    model = FakeGemini(EXTRACTION)
+    if run_async:
+        return asyncio.run(graph_construct.aingest_chunks(["chunk"], "$ctext", AsyncMemoryDriver(graph), model=model, cache=None, version=version))
+    return graph_construct.ingest_chunks(["chunk"], "$ctext", MemoryDriver(graph), model=model, cache=None, version=version)
+
+
+@pytest.mark.parametrize("run_async", [False, True], ids=["sync", "async"])
+@pytest.mark.parametrize("failure", list(FAILURES))
+def test_failed_reingestion_removes_nothing(monkeypatch, registry, failure, run_async):
+    graph = MemoryGraph()
+    result = ingest(graph, registry, "v1", run_async)
+    assert result["source"]["complete"]
+    assert count(graph, "MATCH (n) RETURN count(n) AS n") == 10
+    assert count(graph, "MATCH ()-[r]->() RETURN count(r) AS n") == 9
+
+    stream_gemini, astream_gemini = failing_stream(*FAILURES[failure])
+    monkeypatch.setattr(graph_construct, "stream_gemini", stream_gemini)
+    monkeypatch.setattr(graph_construct, "astream_gemini", astream_gemini)
+    result = ingest(graph, registry, "v2", run_async)
+    assert not result["source"]["complete"]
+    assert result["source"]["entities_removed"] == 0
+    assert result["source"]["relationships_removed"] == 0
+    assert count(graph, "MATCH (n) RETURN count(n) AS n") == 10
+    assert count(graph, "MATCH ()-[r]->() RETURN count(r) AS n") == 9
+    record = registry.get("doc")
+    assert not record["complete"]
+    assert record["content_hash"] is None
+    assert len(record["entities"]) == 10
+    assert len(record["relationships"]) == 9
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import graph_writer
+from graph_store import MemoryDriver, AsyncMemoryDriver
+from graph_writer import build_statements, write_statements, awrite_statements
+from memory_graph import MemoryGraph
+from metrics import WRITE_RETRIES
+
+
+class FlakyDriver(MemoryDriver):
+    """Embedded-graph driver whose first `failures` write transactions raise a transient error."""
+
+    def __init__(self, graph, failures=1):
+        super().__init__(graph)
+        self.failures = failures
+
+    def session(self, **kwargs):
+        session = super().session(**kwargs)
+        write = session.execute_write
+
+        def execute_write(work, *args, **kwargs):
+            if self.failures:
+                self.failures -= 1
+                raise Exception("Transient error")
+            return write(work, *args, **kwargs)
+
+        session.execute_write = execute_write
+        return session
+
+
+class AsyncFlakyDriver(AsyncMemoryDriver):
+    def __init__(self, graph, failures=1):
+        super().__init__(graph)
+        self.failures = failures
+
+    def session(self, **kwargs):
+        session = super().session(**kwargs)
+        write = session.execute_write
+
+        async def execute_write(work, *args, **kwargs):
+            if self.failures:
+                self.failures -= 1
+                raise Exception("Transient error")
+            return await write(work, *args, **kwargs)
+
+        session.execute_write = execute_write
+        return session
+
+
+def statements():
+    rows = [{"id": f"concept{i}", "properties": {"name": f"Concept {i}"}} for i in range(3)]
+    return build_statements({"Concept": rows}, {})
+
+
+def retries():
+    return WRITE_RETRIES.values.get(WRITE_RETRIES._key({}), 0)
+
+
+def test_transient_write_failure_is_retried():
+    graph = MemoryGraph()
+    before = retries()
+    result = write_statements(FlakyDriver(graph), statements())
+    assert result["counters"]["nodes_created"] == 3
+    assert result["failed_rows"] == 0
+    assert retries() == before + 1
+    assert graph.query("MATCH (n:Concept) RETURN count(n) AS n")[0]["n"] == 3
+
+
+def test_transient_async_write_failure_is_retried():
+    graph = MemoryGraph()
+    before = retries()
+    result = asyncio.run(awrite_statements(AsyncFlakyDriver(graph), statements()))
+    assert result["counters"]["nodes_created"] == 3
+    assert result["failed_rows"] == 0
+    assert retries() == before + 1
+    assert graph.query("MATCH (n:Concept) RETURN count(n) AS n")[0]["n"] == 3
+
+
+def test_async_write_failure_is_logged_off_the_event_loop(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    threads = []
+    record_failure = graph_writer.record_failure
+
+    def recording_failure(*args):
+        threads.append(threading.get_ident())
+        record_failure(*args)
+
+    monkeypatch.setattr(graph_writer, "record_failure", recording_failure)
+
+    async def write():
+        return threading.get_ident(), await awrite_statements(AsyncFlakyDriver(MemoryGraph(), failures=100), statements())
+
+    loop_thread, result = asyncio.run(write())
+    assert result["failed_rows"] == 3
+    assert len(threads) == 3 and loop_thread not in threads
+    assert len((tmp_path / "failed_statements.txt").read_text().splitlines()) == 3
@@ -0,0 +1,119 @@
+import json
+import pytest
+from entity_search import create_index_query
+from graph_writer import build_statements, write_statements, group_extraction
+from graph_store import MemoryDriver
+from intent_router import IntentRouter, stem, tokenize, INTENT_RESULT_LIMIT
+from memory_graph import MemoryGraph
+
+EXTRACTION = {
+    "entities": [
+        {"label": "Person", "id": "johnsmith", "name": "John Smith"},
+        {"label": "Person", "id": "adajones", "name": "Ada Jones"},
+        {"label": "Organization", "id": "acme", "name": "Acme"},
+        {"label": "Organization", "id": "bankofamerica", "name": "Bank of America"},
+        {"label": "Technology", "id": "rocketskates", "name": "Rocket Skates"},
+        {"label": "Concept", "id": "agile", "name": "Agile"},
+        {"label": "Concept", "id": "scrum", "name": "Scrum"},
+    ],
+    "relationships": [
+        "johnsmith|WORK_AT|acme",
+        "adajones|WORK_AT|acme",
+        "adajones|WORK_AT|bankofamerica",
+        "acme|DEVELOPE|rocketskates",
+        "agile|IS_RELATED_TO|scrum",
+    ],
+}
+RELATIONSHIPS = [
+    ("Person", "WORK_AT", "Organization"),
+    ("Organization", "DEVELOPE", "Technology"),
+    ("Concept", "IS_RELATED_TO", "Concept"),
+]
+
+
+@pytest.fixture(scope="module")
+def graph():
+    graph = MemoryGraph()
+    write_statements(MemoryDriver(graph), build_statements(*group_extraction(EXTRACTION)))
+    graph.run(create_index_query(["Person", "Organization", "Technology", "Concept"]))
+    return graph
+
+
+@pytest.fixture
+def router(tmp_path):
+    return IntentRouter(RELATIONSHIPS, log_path=str(tmp_path / "logs" / "intents.jsonl"))
+
+
+def answer(graph, route):
+    return route.intent.answer(graph.query(route.cypher, route.params))
+
+
+def test_stem_and_tokenize():
+    assert {stem(word) for word in ["works", "worked", "working"]} == {"work"}
+    assert stem("studies") == stem("studied") == "study"
+    assert tokenize("Where does John Smith's company work?") == ["where", "does", "john", "smith", "company", "work"]
+
+
+@pytest.mark.parametrize("question, intent, answer_text", [
+    ("Where does John Smith work?", "WORK_AT:out", "John Smith works at Acme."),
+    ("Who works at Acme?", "WORK_AT:in", "People who work at Acme: John Smith and Ada Jones."),
+    ("Which employees work at Bank of America?", "WORK_AT:in", "People who work at Bank of America: Ada Jones."),
+    ("Who developed rocket skates?", "DEVELOPE:in", "Rocket Skates was developed by Acme."),
+    ("What is related to scrum?", "IS_RELATED_TO:both", "Scrum is related to Agile."),
+])
+def test_template_routes(graph, router, question, intent, answer_text):
+    route = router.route(question, graph.query)
+    assert route.reason == "template"
+    assert route.intent.name == intent
+    assert answer(graph, route) == answer_text
+
+
+def test_template_query_is_parameterized(graph, router):
+    route = router.route("Where does John Smith work?", graph.query)
+    assert route.params == {"ids": ["johnsmith"], "limit": INTENT_RESULT_LIMIT}
+    assert "johnsmith" not in route.cypher
+    # the same intent for another entity runs the same query text
+    other = router.route("Where does Ada Jones work?", graph.query)
+    assert other.cypher == route.cypher
+    assert other.params["ids"] == ["adajones"]
+    assert answer(graph, other) == "Ada Jones works at Acme and Bank of America."
+
+
+@pytest.mark.parametrize("question, reason", [
+    ("How many people work at Acme?", "aggregate, comparison or negation"),
+    ("Who does not work at Acme?", "aggregate, comparison or negation"),
+    ("Where do they work?", "no entity named"),
+    ("Where does Grace Hopper work?", "no entity found"),
+    ("Where does John Smith live?", "low confidence"),
+    ("Tell me about Rocket Skates", "low confidence"),
+])
+def test_fallbacks(graph, router, question, reason):
+    route = router.route(question, graph.query)
+    assert route.intent is None
+    assert route.reason == reason
+    assert route.cypher is None and route.params is None
+
+
+def test_disabled(graph):
+    route = IntentRouter(RELATIONSHIPS, log_path="", enabled=False).route("Where does John Smith work?", graph.query)
+    assert route.reason == "routing disabled"
+
+
+def test_failed_lookup_falls_back(router):
+    def query_fn(cypher, params):
+        raise Exception("Index unavailable")
+
+    assert router.route("Where does John Smith work?", query_fn).reason == "entity lookup failed"
+
+
+def test_log(graph, router):
+    route = router.route("Where does John Smith work?", graph.query)
+    router.log("Where does John Smith work?", route)
+    fallback = router.route("How many people work at Acme?", graph.query)
+    router.log("How many people work at Acme?", fallback, cypher="MATCH (n) RETURN count(n)")
+    with open(router.log_path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert [(entry["decision"], entry["intent"]) for entry in entries] == [("template", "WORK_AT:out"), ("fallback", None)]
+    assert entries[0]["params"] == {"ids": ["johnsmith"], "limit": INTENT_RESULT_LIMIT}
+    assert entries[1]["cypher"] == "MATCH (n) RETURN count(n)"
+    assert entries[1]["params"] is None
@@ -0,0 +1,73 @@
+import json
+from json_stream import ExtractionStreamParser
+
+EXTRACTION = {
+    "entities": [
+        {"label": "Person", "id": "alan", "name": "Alan \"The\" Turing", "notes": "likes {braces} and [brackets]"},
+        {"label": "Concept", "id": "test", "properties": {"year": 1950, "tags": ["ai", "logic"]}},
+    ],
+    "relationships": ["alan|PROPOSE|test", "test|IS_RELATED_TO|alan"],
+}
+ITEMS = [("entity", entity) for entity in EXTRACTION["entities"]] + [("relationship", rs) for rs in EXTRACTION["relationships"]]
+
+
+def parse(pieces):
+    parser = ExtractionStreamParser()
+    items = []
+    for piece in pieces:
+        items += parser.feed(piece)
+    return parser, items
+
+
+def test_whole_output():
+    parser, items = parse([json.dumps(EXTRACTION)])
+    assert items == ITEMS
+    assert parser.complete
+    assert (parser.items, parser.entities, parser.relationships, parser.errors) == (4, 2, 2, 0)
+
+
+def test_items_are_yielded_as_they_close():
+    text = json.dumps(EXTRACTION, indent=2)
+    parser = ExtractionStreamParser()
+    seen = []
+    for i, c in enumerate(text):
+        for item in parser.feed(c):
+            seen.append((item, i))
+    assert [item for item, _ in seen] == ITEMS
+    # each item comes out on the character that closes it
+    assert all(text[i] in '}"' for _, i in seen)
+    assert parser.complete
+
+
+def test_fence_and_trailing_text_are_ignored():
+    text = "```json\n" + json.dumps(EXTRACTION) + "\n```\nThe {extra} text."
+    parser, items = parse([text[i:i + 7] for i in range(0, len(text), 7)])
+    assert items == ITEMS
+    assert parser.complete
+
+
+def test_cut_off_output_keeps_completed_items():
+    text = json.dumps(EXTRACTION)
+    parser, items = parse([text[:text.index("test|IS_RELATED_TO") + 4]])
+    assert items == ITEMS[:3]
+    assert not parser.complete
+
+
+def test_no_json():
+    parser, items = parse(["I cannot help with that."])
+    assert items == []
+    assert not parser.started and not parser.complete
+
+
+def test_unparseable_item_is_skipped():
+    text = '{"entities": [{"id": "a", "label": "X",}, {"id": "b", "label": "X"}], "relationships": []}'
+    parser, items = parse([text])
+    assert items == [("entity", {"id": "b", "label": "X"})]
+    assert parser.errors == 1
+    assert parser.complete
+
+
+def test_other_keys_are_not_items():
+    text = '{"notes": ["not an item"], "entities": [{"id": "a"}], "meta": {"entities": [{"id": "nested"}]}}'
+    parser, items = parse([text])
+    assert items == [("entity", {"id": "a"})]
@@ -0,0 +1,122 @@
+import pytest
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+from langchain_core.documents import Document
+from graph_store import MemoryGraphStore
+from memory_graph import MemoryGraph, CypherError
+
+PEOPLE = [
+    {"id": "ann", "name": "Ann Lee", "age": 34, "city": "Oslo"},
+    {"id": "bob", "name": "Bob Stone", "age": 41, "city": "Oslo"},
+    {"id": "cat", "name": "Cat O'Brien", "age": 29, "city": "Rome"},
+]
+KNOWS = [{"src": "ann", "tgt": "bob"}, {"src": "bob", "tgt": "cat"}, {"src": "ann", "tgt": "cat"}]
+
+
+@pytest.fixture
+def graph():
+    graph = MemoryGraph()
+    graph.run("UNWIND $rows AS row MERGE (n:Person {id: row.id}) ON CREATE SET n += row", {"rows": PEOPLE})
+    graph.run("UNWIND $rows AS row MATCH (a:Person {id: row.src}) MATCH (b:Person {id: row.tgt}) MERGE (a)-[:KNOWS]->(b)", {"rows": KNOWS})
+    graph.run("MERGE (c:Company {id: 'acme'}) ON CREATE SET c.name = 'Acme Corp' WITH c MATCH (p:Person {id: 'ann'}) MERGE (p)-[:WORKS_AT]->(c)")
+    return graph
+
+
+def test_unwind_merge_counters(graph):
+    _, _, counters = graph.run("UNWIND $rows AS row MERGE (n:Person {id: row.id}) ON CREATE SET n += row", {"rows": PEOPLE + [{"id": "dan"}]})
+    assert counters["nodes_created"] == 1
+    _, _, counters = graph.run("MATCH (a:Person {id: 'ann'}) MATCH (b:Person {id: 'bob'}) MERGE (a)-[:KNOWS]->(b)")
+    assert counters["relationships_created"] == 0
+    _, _, counters = graph.run("MERGE (n:Person {id: 'ann'}) ON CREATE SET n.new = true ON MATCH SET n.seen = 1")
+    assert counters["nodes_created"] == 0
+    assert graph.query("MATCH (n:Person {id: 'ann'}) RETURN n.new AS new, n.seen AS seen") == [{"new": None, "seen": 1}]
+
+
+def test_match_where(graph):
+    rows = graph.query("MATCH (n:Person) WHERE n.age > 30 AND toLower(n.name) CONTAINS 'o' RETURN n.id AS id ORDER BY id")
+    assert rows == [{"id": "bob"}]
+    rows = graph.query("MATCH (a:Person)-[:KNOWS]->(b:Person) WHERE a.city = b.city RETURN a.id AS a, b.id AS b")
+    assert rows == [{"a": "ann", "b": "bob"}]
+    rows = graph.query("MATCH (n:Person) WHERE n.id IN $ids RETURN n.name AS name ORDER BY name DESC", {"ids": ["ann", "cat"]})
+    assert rows == [{"name": "Cat O'Brien"}, {"name": "Ann Lee"}]
+    rows = graph.query("MATCH (a:Person {id: 'ann'})-[:KNOWS*2]->(c) RETURN c.id AS id")
+    assert rows == [{"id": "cat"}]
+    rows = graph.query("MATCH (p:Person) OPTIONAL MATCH (p)-[:WORKS_AT]->(c:Company) RETURN p.id AS id, c.name AS company ORDER BY id")
+    assert rows == [{"id": "ann", "company": "Acme Corp"}, {"id": "bob", "company": None}, {"id": "cat", "company": None}]
+
+
+def test_aggregation(graph):
+    rows = graph.query("MATCH (n:Person) RETURN n.city AS city, count(n) AS people, avg(n.age) AS age ORDER BY city")
+    assert rows == [{"city": "Oslo", "people": 2, "age": 37.5}, {"city": "Rome", "people": 1, "age": 29.0}]
+    rows = graph.query("MATCH (a:Person)-[:KNOWS]->(b) WITH a, collect(b.id) AS friends WHERE size(friends) > 1 RETURN a.id AS id, friends")
+    assert rows == [{"id": "ann", "friends": ["bob", "cat"]}]
+    rows = graph.query("MATCH (n:Person) RETURN n.id AS id ORDER BY n.age DESC SKIP 1 LIMIT 1")
+    assert rows == [{"id": "ann"}]
+    assert graph.query("MATCH (n) RETURN count(n) AS n") == [{"n": 4}]
+    assert graph.query("MATCH ()-[r:KNOWS]->() RETURN count(r) AS n") == [{"n": 3}]
+
+
+def test_detach_delete(graph):
+    _, _, counters = graph.run("MATCH (n:Person {id: 'bob'}) DETACH DELETE n")
+    assert counters["nodes_deleted"] == 1
+    assert counters["relationships_deleted"] == 2
+    with pytest.raises(CypherError):
+        graph.run("MATCH (n:Person {id: 'ann'}) DELETE n")
+
+
+def test_fulltext_index(graph):
+    graph.run("CREATE FULLTEXT INDEX people IF NOT EXISTS FOR (n:Person|Company) ON EACH [n.name]")
+    query = "CALL db.index.fulltext.queryNodes($index, $query) YIELD node RETURN node.id AS id ORDER BY id"
+    assert graph.query(query, {"index": "people", "query": "a*"}) == [{"id": "acme"}, {"id": "ann"}]
+    assert graph.query(query, {"index": "people", "query": "ann* AND lee*"}) == [{"id": "ann"}]
+    assert graph.query(query, {"index": "people", "query": "stone* OR brien*"}) == [{"id": "bob"}, {"id": "cat"}]
+    assert graph.query(query, {"index": "people", "query": "name:*ton*"}) == [{"id": "bob"}]
+    # the index follows writes made after it was created
+    graph.run("MATCH (n:Person {id: 'bob'}) SET n.name = 'Bob Marsh'")
+    graph.run("CREATE (:Person {id: 'sam', name: 'Sam Stone'})")
+    assert graph.query(query, {"index": "people", "query": "stone*"}) == [{"id": "sam"}]
+    with pytest.raises(CypherError):
+        graph.query(query, {"index": "missing", "query": "a*"})
+
+
+@pytest.mark.parametrize("query, message", [
+    ("MATCH p = (a)-[:KNOWS]->(b) RETURN p", "Path variables"),
+    ("MATCH (n:Person) WHERE (n)-[:KNOWS]->() RETURN n.id", "Pattern expressions"),
+    ("MATCH (n:Person), (m:Person) WHERE NOT (n)--(m) RETURN n.id", "Pattern expressions"),
+    ("MATCH (n:Person) RETURN [(n)-[:KNOWS]->(m) | m.id] AS friends", "Pattern expressions"),
+    ("MATCH (n:Person) WHERE EXISTS { (n)-[:KNOWS]->() } RETURN n.id", "subqueries"),
+    ("MATCH (n:Person) RETURN n.id AS id UNION MATCH (c:Company) RETURN c.id AS id", "UNION"),
+    ("MATCH (n:Person) RETURN frobnicate(n) AS x", "Unsupported function"),
+])
+def test_unsupported_syntax(graph, query, message):
+    with pytest.raises(CypherError, match=message):
+        graph.query(query)
+
+
+def test_parenthesized_expressions_are_not_patterns(graph):
+    assert graph.query("MATCH (n:Person {id: 'ann'}) RETURN (n.age) - 4 AS x, (n.age + 1) * 2 AS y") == [{"x": 30, "y": 70}]
+
+
+def test_add_graph_documents():
+    graph = MemoryGraph()
+    store = MemoryGraphStore(graph)
+    ann, acme = Node(id="ann-lee", type="Person", properties={"name": "Ann Lee"}), Node(id="acme", type="Company")
+    document = GraphDocument(
+        nodes=[ann, acme],
+        relationships=[Relationship(source=ann, target=acme, type="WORKS_AT"), Relationship(source=ann, target=Node(id="bob", type="Person"), type="KNOWS")],
+        source=Document(page_content="Ann Lee works at Acme.", metadata={"id": "doc1"}),
+    )
+    store.add_graph_documents([document, document], include_source=True)
+    assert graph.query("MATCH (n) RETURN labels(n)[0] AS label, n.id AS id ORDER BY label, id") == [
+        {"label": "Company", "id": "acme"},
+        {"label": "Document", "id": "doc1"},
+        {"label": "Person", "id": "annlee"},
+        {"label": "Person", "id": "bob"},
+    ]
+    assert graph.query("MATCH (a)-[r]->(b) RETURN a.id AS a, type(r) AS type, b.id AS b ORDER BY type, b") == [
+        {"a": "annlee", "type": "KNOWS", "b": "bob"},
+        {"a": "doc1", "type": "MENTIONS", "b": "acme"},
+        {"a": "doc1", "type": "MENTIONS", "b": "annlee"},
+        {"a": "annlee", "type": "WORKS_AT", "b": "acme"},
+    ]
+    store.refresh_schema()
+    assert "(:Person)-[:WORKS_AT]->(:Company)" in store.schema
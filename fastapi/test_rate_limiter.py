@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+import rate_limiter
+from time import monotonic
+from rate_limiter import TokenBucket, RateLimiter, estimate_tokens
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_bursts_then_waits(clock):
+    bucket = TokenBucket(capacity=2, rate=1)
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 1.0
+    # the debt carries over: the next reservation waits behind the previous one
+    clock[0] += 0.5
+    assert bucket.reserve(1) == 1.5
+
+
+def test_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(capacity=2, rate=1)
+    bucket.reserve(2)
+    clock[0] += 100
+    assert bucket.reserve(2) == 0
+    assert bucket.reserve(1) == 1.0
+
+
+def test_oversized_reservation_is_capped(clock):
+    bucket = TokenBucket(capacity=10, rate=5)
+    assert bucket.reserve(50) == 0
+    assert bucket.reserve(50) == 2.0
+
+
+def test_limiter_waits_for_the_tighter_quota(clock):
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=600, name="test")
+    assert limiter.reserve(600) == 0
+    # one request per second is still available, 100 tokens take 10 seconds
+    assert limiter.reserve(100) == 10.0
+    clock[0] += 60
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=600, name="test")
+    limiter.reserve(1)
+    limiter.reserve(1)
+    assert limiter.reserve(1) == 30.0
+
+
+def test_acquire_sleeps(clock, monkeypatch):
+    slept = []
+    monkeypatch.setattr(rate_limiter, "sleep", slept.append)
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=60, name="test")
+    assert limiter.acquire(60) == 0
+    assert limiter.acquire(30) == 30.0
+    assert slept == [30.0]
+
+
+def test_acquire_async_yields_while_waiting():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=600, name="test")
+
+    async def acquire():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        await limiter.acquire_async(600)
+        start = monotonic()
+        wait = await limiter.acquire_async(1)
+        ticker.cancel()
+        return wait, monotonic() - start, ticks
+
+    wait, elapsed, ticks = asyncio.run(acquire())
+    assert wait == pytest.approx(0.1, abs=0.01)
+    assert elapsed >= 0.09
+    assert ticks > 0
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("x" * 40) == 10
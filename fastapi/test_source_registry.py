@@ -0,0 +1,76 @@
+from source_registry import SourceRegistry, SourceVersion, content_hash
+
+ENTITIES = {("Person", "alan"), ("Concept", "test")}
+RELATIONSHIPS = {("Person", "alan", "PROPOSE", "Concept", "test")}
+
+
+def registry_with_source(complete=True):
+    registry = SourceRegistry(":memory:")
+    registry.put("doc", "v1", ENTITIES, RELATIONSHIPS, complete)
+    return registry
+
+
+def test_content_hash():
+    assert content_hash("text") == content_hash(b"text")
+    assert content_hash("text") != content_hash("text ")
+
+
+def test_new_source():
+    version = SourceVersion("doc", "v1")
+    assert not version.unchanged
+    assert version.summary(ENTITIES, RELATIONSHIPS) == {
+        "id": "doc", "content_hash": "v1", "status": "new", "complete": True,
+        "entities": 2, "relationships": 1,
+        "entities_added": 2, "entities_removed": 0, "relationships_added": 1, "relationships_removed": 0,
+    }
+
+
+def test_updated_source_diff():
+    registry = registry_with_source()
+    version = SourceVersion("doc", "v2", registry.get("doc"))
+    assert version.trusted and not version.unchanged
+    entities = {("Person", "alan"), ("Concept", "machine")}
+    relationships = {("Person", "alan", "PROPOSE", "Concept", "machine")}
+    summary = version.summary(entities, relationships)
+    assert summary["status"] == "updated"
+    assert (summary["entities_added"], summary["entities_removed"]) == (1, 1)
+    assert (summary["relationships_added"], summary["relationships_removed"]) == (1, 1)
+
+
+def test_unchanged_source():
+    registry = registry_with_source()
+    assert SourceVersion("doc", "v1", registry.get("doc")).unchanged
+    # the same content is ingested again when the previous ingestion was incomplete
+    registry = registry_with_source(complete=False)
+    version = SourceVersion("doc", "v1", registry.get("doc"))
+    assert not version.trusted and not version.unchanged
+
+
+def test_incomplete_version_removes_nothing():
+    registry = registry_with_source()
+    version = SourceVersion("doc", "v2", registry.get("doc"))
+    version.complete = False
+    summary = version.summary({("Person", "alan")}, set())
+    assert summary["entities_removed"] == 0
+    assert summary["relationships_removed"] == 0
+    registry.record(version, {("Person", "alan"), ("Concept", "machine")}, set())
+    record = registry.get("doc")
+    assert record["content_hash"] is None
+    assert not record["complete"]
+    assert {tuple(key) for key in record["entities"]} == ENTITIES | {("Concept", "machine")}
+    assert {tuple(key) for key in record["relationships"]} == RELATIONSHIPS
+
+
+def test_record_get_list_delete():
+    registry = SourceRegistry(":memory:")
+    assert registry.get("doc") is None
+    registry.record(SourceVersion("doc", "v1"), ENTITIES, RELATIONSHIPS)
+    record = registry.get("doc")
+    assert record["content_hash"] == "v1" and record["complete"]
+    assert record["entities"] == [["Concept", "test"], ["Person", "alan"]]
+    assert record["relationships"] == [["Person", "alan", "PROPOSE", "Concept", "test"]]
+    registry.put("other", "v1", set(), set())
+    assert [(source["id"], source["entities"], source["relationships"]) for source in registry.list()] == [("other", 0, 0), ("doc", 2, 1)]
+    assert registry.delete("doc")
+    assert not registry.delete("doc")
+    assert [source["id"] for source in registry.list()] == ["other"]
@@ -0,0 +1,47 @@
+import pytest
+from text_chunking import ChunkBuilder, split_units, split_into_chunks
+
+PARAGRAPHS = [f"Paragraph {i} says something. It has a second sentence about topic {i}." for i in range(12)]
+TEXT = "\n\n".join(PARAGRAPHS)
+
+
+def test_split_units_falls_back_to_sentences_then_hard_cuts():
+    assert split_units("One.\n\n  \n\nTwo.\n \nThree.") == ["One.", "Two.", "Three."]
+    assert split_units("First sentence here. Second one! Third?", chunk_size=25) == ["First sentence here.", "Second one!", "Third?"]
+    assert split_units("x" * 25, chunk_size=10) == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_chunks_fit_and_overlap():
+    chunks = split_into_chunks(TEXT, chunk_size=200, overlap=80)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    # every paragraph lands in some chunk, in order
+    assert [p for p in PARAGRAPHS if any(p in chunk for chunk in chunks)] == PARAGRAPHS
+    for previous, chunk in zip(chunks, chunks[1:]):
+        carried = chunk.split("\n")[0]
+        assert previous.endswith(carried)
+
+
+def test_no_overlap():
+    chunks = split_into_chunks(TEXT, chunk_size=200, overlap=0)
+    assert "\n".join(chunks).split("\n") == PARAGRAPHS
+
+
+def test_builder_matches_whole_text():
+    builder = ChunkBuilder(chunk_size=200, overlap=80)
+    chunks = []
+    for paragraph in PARAGRAPHS:
+        chunks += builder.add(paragraph)
+    chunks += builder.close()
+    assert chunks == split_into_chunks(TEXT, chunk_size=200, overlap=80)
+    assert builder.close() == []
+
+
+def test_small_text_is_one_chunk():
+    assert split_into_chunks("Short text.") == ["Short text."]
+    assert split_into_chunks("  \n\n ") == []
+
+
+def test_chunk_size_must_be_positive():
+    with pytest.raises(ValueError):
+        ChunkBuilder(chunk_size=0)
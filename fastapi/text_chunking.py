@@ -0,0 +1,75 @@
+import os
+import re
+
+# Chunking configuration (sizes are in characters)
+CHUNK_SIZE = int(os.getenv("EXTRACTION_CHUNK_SIZE", "8000"))
+CHUNK_OVERLAP = int(os.getenv("EXTRACTION_CHUNK_OVERLAP", "400"))
+
+PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+
+# Function to break text into paragraph units, falling back to sentences and then hard cuts for oversized pieces
+def split_units(text, chunk_size=CHUNK_SIZE):
+    units = []
+    for paragraph in PARAGRAPH_SPLIT.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= chunk_size:
+            units.append(paragraph)
+            continue
+        for sentence in SENTENCE_SPLIT.split(paragraph):
+            sentence = sentence.strip()
+            while len(sentence) > chunk_size:
+                units.append(sentence[:chunk_size])
+                sentence = sentence[chunk_size:]
+            if sentence:
+                units.append(sentence)
+    return units
+
+
+class ChunkBuilder:
+    """Packs units into chunks of at most chunk_size characters as text arrives (e.g. transcript segments).
+    Consecutive chunks share trailing units of up to `overlap` characters."""
+
+    def __init__(self, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.current = []
+        self.current_len = 0
+
+    # Add text and return the chunks it completed; the last, still open chunk is kept until more text or close()
+    def add(self, text):
+        chunks = []
+        for unit in split_units(text, self.chunk_size):
+            if self.current and self.current_len + len(unit) + 1 > self.chunk_size:
+                chunks.append("\n".join(self.current))
+                # carry the tail of the previous chunk over as overlap
+                carried = []
+                carried_len = 0
+                for prev in reversed(self.current):
+                    if carried_len + len(prev) + 1 > self.overlap or carried_len + len(prev) + len(unit) + 2 > self.chunk_size:
+                        break
+                    carried.insert(0, prev)
+                    carried_len += len(prev) + 1
+                self.current = carried
+                self.current_len = carried_len
+            self.current.append(unit)
+            self.current_len += len(unit) + 1
+        return chunks
+
+    def close(self):
+        chunks = ["\n".join(self.current)] if self.current else []
+        self.current = []
+        self.current_len = 0
+        return chunks
+
+
+def split_into_chunks(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Split text on paragraph/sentence boundaries into chunks of at most chunk_size characters.
+    Consecutive chunks share trailing units of up to `overlap` characters."""
+    builder = ChunkBuilder(chunk_size, overlap)
+    return builder.add(text) + builder.close()
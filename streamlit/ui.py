@@ -4,22 +4,34 @@ from requests_toolbelt.multipart.encoder import MultipartEncoder
 import streamlit as st
 from streamlit_chat import message
 import json
+import time
 
 
 BACKEND_UPLOAD_TEXT_URL = "http://localhost:8000/upload-text"
 BACKEND_UPLOAD_FILE_URL = "http://localhost:8000/upload-file"
 BACKEND_QUERY_URL = "http://localhost:8000/query"
+BACKEND_QUERY_STREAM_URL = "http://localhost:8000/query/stream"
 BACKEND_INFO_URL = "http://localhost:8000/info"
-
-num_entity = 0
-num_relation = 0
-entity_change = 0
-relation_change = 0
-info = requests.get(BACKEND_INFO_URL).json()
-entity_change = int(info.get('num_entity')) - num_entity
-num_entity += entity_change
-relation_change = int(info.get('num_relation')) - num_relation
-num_relation += relation_change
+BACKEND_JOBS_URL = "http://localhost:8000/jobs"
+
+# /info is served with an ETag; only re-read the counts when they changed since the last rerun
+if "info" not in st.session_state:
+    st.session_state.info = {"num_entity": 0, "num_relation": 0}
+    st.session_state.info_etag = None
+    st.session_state.info_change = (0, 0)
+info_headers = {"If-None-Match": st.session_state.info_etag} if st.session_state.info_etag else {}
+info_response = requests.get(BACKEND_INFO_URL, headers=info_headers, timeout=10)
+if info_response.status_code == 200:
+    info = info_response.json()
+    st.session_state.info_change = (
+        int(info.get('num_entity')) - st.session_state.info["num_entity"],
+        int(info.get('num_relation')) - st.session_state.info["num_relation"],
+    )
+    st.session_state.info = info
+    st.session_state.info_etag = info_response.headers.get("ETag")
+num_entity = st.session_state.info["num_entity"]
+num_relation = st.session_state.info["num_relation"]
+entity_change, relation_change = st.session_state.info_change
 
 
 ### Helper functions ###
@@ -36,27 +48,44 @@ def submit_and_clear_input(key:str):
 def send_file(file, file_name, content_type,  server_url: str):
     m = MultipartEncoder(fields={"file": (file_name, file, content_type)})
     r = requests.post(
-        server_url, data=m, headers={"Content-Type": m.content_type}, timeout=8000
+        server_url, data=m, headers={"Content-Type": m.content_type}, timeout=60
     )
     return r
+
+# Uploads are processed in the background; poll the job until it finishes
+def wait_for_job(response):
+    job_id = response.get("job_id")
+    if not job_id:
+        return response
+    progress = st.progress(0.0, text="Queued")
+    while True:
+        job = requests.get(f"{BACKEND_JOBS_URL}/{job_id}", timeout=10).json()
+        progress.progress(job.get("progress", 0.0), text=f"{job.get('stage')} ({job.get('status')})")
+        if job.get("status") in ("done", "failed"):
+            break
+        time.sleep(1)
+    progress.empty()
+    if job.get("status") == "failed":
+        return {"message": f"Upload failed: {job.get('error')}"}
+    return {"message": f"{response.get('message')} Processed.", **(job.get("result") or {})}
  
 def on_upload_click(text_input, url_input, file_input):
     response = None
     headers = {"Content-Type": "application/json"}
     if file_input:
         if file_input.name.endswith(".txt"):
-            response = send_file(file_input, file_input.name, 'text/plain', BACKEND_UPLOAD_FILE_URL).json()
+            response = wait_for_job(send_file(file_input, file_input.name, 'text/plain', BACKEND_UPLOAD_FILE_URL).json())
         elif file_input.name.endswith(".wav"):
-            response = send_file(file_input, file_input.name, 'audio/wav', BACKEND_UPLOAD_FILE_URL).json()
+            response = wait_for_job(send_file(file_input, file_input.name, 'audio/wav', BACKEND_UPLOAD_FILE_URL).json())
         else:
             raise ValueError("Unsupported file type. Use 'txt' or 'wav'.")
     elif text_input:
         data = {'text': text_input}
-        response = requests.post(BACKEND_UPLOAD_TEXT_URL, json=data, headers=headers, timeout=8000).json()
+        response = wait_for_job(requests.post(BACKEND_UPLOAD_TEXT_URL, json=data, headers=headers, timeout=60).json())
         st.rerun()
     elif url_input:
         data = {'url': url_input}
-        response = requests.post(BACKEND_UPLOAD_TEXT_URL, json=data, headers=headers, timeout=8000).json()
+        response = wait_for_job(requests.post(BACKEND_UPLOAD_TEXT_URL, json=data, headers=headers, timeout=60).json())
         st.rerun()
     else:
         return
@@ -114,23 +143,53 @@ col1.text_input("Enter your question", key="user_input", on_change=submit_and_cl
 user_input = st.session_state.temp
 
 
-cypher_query = ""
-# Handle chat
+if "cypher_query" not in st.session_state:
+    st.session_state.cypher_query = ""
+
+# Function to read (event, data) pairs from a Server-Sent Events response
+def read_events(response):
+    event, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+        elif not line and event:
+            yield event, json.loads("\n".join(data))
+            event, data = None, []
+
+# Handle chat: the answer is streamed into the chat box as it is generated
 if user_input:
-    with st.spinner("Processing your question..."):
-        st.session_state.user_msgs.append(user_input)
-        try:
-            result = requests.post(BACKEND_QUERY_URL, json={'text': user_input}, headers={"Content-Type": "application/json"}, timeout=8000).json()      #handle_query(user_input)      
-            print(result)
-            intermediate_steps = result["intermediate_steps"]
-            cypher_query = intermediate_steps[0]["query"]
-            database_results = intermediate_steps[1]["context"]
-            answer = result["result"]
-            print("answer: " + answer)
-            st.session_state.system_msgs.append(answer)
-        except Exception as e:
-            st.error("Failed to process question. Please try again.")
-            print(e)
+    st.session_state.user_msgs.append(user_input)
+    with chatbox:
+        message(user_input, is_user=True, key=str(len(st.session_state.user_msgs)) + "_pending")
+        status = st.empty()
+        answer_box = st.empty()
+    status.caption("Generating Cypher query...")
+    answer = ""
+    try:
+        with requests.post(BACKEND_QUERY_STREAM_URL, json={'text': user_input}, stream=True, timeout=(10, 300)) as response:
+            response.raise_for_status()
+            for event, data in read_events(response):
+                if event == "cypher":
+                    st.session_state.cypher_query = data["query"]
+                    status.caption("Querying the knowledge graph...")
+                elif event == "context":
+                    st.session_state.cypher_query = data["query"]
+                    status.caption("Writing the answer...")
+                elif event == "token":
+                    answer += data
+                    answer_box.markdown(answer)
+                elif event == "done":
+                    answer = data["result"]
+                elif event == "error":
+                    raise RuntimeError(data["message"])
+        print("answer: " + answer)
+        st.session_state.system_msgs.append(answer)
+    except Exception as e:
+        st.session_state.user_msgs.pop()
+        st.error("Failed to process question. Please try again.")
+        print(e)
     # Re-run the script to update the chat display
     st.rerun()
 
@@ -147,7 +206,7 @@ with col2:
     selected_entity_types = st.multiselect("Entity Types", entity_types, entity_types, disabled=True)
     selected_relationship_types = st.multiselect("Relationship Types", relationship_types, relationship_types, disabled=True)
 
-    st.text_area("Last Cypher Query", cypher_query, key="_cypher", height=200)
+    st.text_area("Last Cypher Query", st.session_state.cypher_query, height=200)
     # st.text_area("Last Database Results", database_results, key="_database", height=200)
 
 